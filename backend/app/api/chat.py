@@ -1,20 +1,33 @@
-from fastapi import APIRouter, Depends, WebSocket, HTTPException, Request
+from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect, HTTPException, Request, Response, Query
 from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
-from typing import List, Dict, Any, Optional, AsyncGenerator
+from sqlalchemy import select
+from typing import List, Dict, Any, Optional, AsyncGenerator, AsyncIterator, Sequence, Tuple
 import json
 import asyncio
-from app.db.database import get_db
-from app.db.models import Chat
-from app.chains.agent import create_agent
+import logging
+import time
+from contextlib import aclosing
+from app.db.database import AsyncSessionLocal, get_db
+from app.db.chats import chat_writer, save_chat, save_chat_nowait, session_namespace
+from app.db.models import Chat, ChatSession as ChatSessionModel
+from app.chains.agent import agent_flight, astream_agent
+from app.chains.cache import AnswerKey, answer_cache, has_prior_turns
+from app.chains.limits import ConcurrencyLimiter, Saturated, agent_limits
+from app.chains.pool import agent_pool
+from app.api.namespace import requested_namespace
+from app.core.config import settings
+from app.core.metrics import answers_interrupted
+from app.core.vectorstore import normalize_namespace
 from pydantic import BaseModel
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
-# Store agents for different sessions
-agents: Dict[str, Any] = {}
+# Appended to answers saved after being stopped or abandoned mid-stream
+STOPPED_SUFFIX = " [stopped]"
 
 class MessageRequest(BaseModel):
     message: str
@@ -30,82 +43,281 @@ class ChatSession(BaseModel):
     timestamp: datetime
     message_count: int
 
-async def save_chat(db: AsyncSession, session_id: str, message: str, is_user: bool):
-    """Helper function to save chat messages to the database."""
-    chat = Chat(
-        session_id=session_id,
-        message=message,
-        is_user=is_user
-    )
-    db.add(chat)
-    await db.commit()
+def _sse(data: Dict[str, Any], event: Optional[str] = None) -> str:
+    """Format a single server-sent event frame."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
 
-async def generate_response(agent: Any, message: str, db: AsyncSession, session_id: str) -> AsyncGenerator[str, None]:
+async def _acquire_slot(model: Optional[str]) -> ConcurrencyLimiter:
+    """Wait for an agent slot for this model, or fail fast with 429/503."""
+    limiter = agent_limits.limiter(model)
     try:
-        response = await asyncio.get_event_loop().run_in_executor(
-            None, lambda: agent.invoke({"input": message})
+        await limiter.acquire()
+    except Saturated as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
         )
-        ai_response = response.get("output", "I apologize, but I couldn't process that request.")
-        
-        # Store the complete AI response in the database
+    return limiter
+
+async def _resolve_namespace(db: AsyncSession, session_id: str, requested: Optional[str]) -> str:
+    """Namespace of a session, rejecting a request that names a different one with 409."""
+    namespace = await session_namespace(db, session_id, requested)
+    if requested is not None and requested != namespace:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Session {session_id} belongs to namespace {namespace}"
+        )
+    return namespace
+
+async def _lookup_answer(agent: Any, message: str, model: Optional[str], namespace: str):
+    """Check the answer cache, returning (answer, key, question embedding).
+
+    The key identifies answers that can be shared between sessions, through
+    the cache or by coalescing identical runs. It is None when the session
+    already has turns that may change what the question means.
+    """
+    if has_prior_turns(agent):
+        return None, None, None
+    key = answer_cache.key(message, model, namespace)
+    if not settings.ANSWER_CACHE_ENABLED:
+        return None, key, None
+    answer, vector = await answer_cache.lookup(key)
+    return answer, key, vector
+
+class _LimitedEvents:
+    """Agent events holding a limiter slot until the run is over.
+
+    The slot is released when the events run out or fail, or when they are
+    closed, even if they were never iterated: a client can go away before
+    the response body starts.
+    """
+
+    def __init__(self, events: AsyncIterator[Dict[str, Any]], limiter: ConcurrencyLimiter):
+        self._events = events
+        self._limiter = limiter
+        self._start = time.monotonic()
+        self._released = False
+
+    def __aiter__(self) -> "_LimitedEvents":
+        return self
+
+    async def __anext__(self) -> Dict[str, Any]:
+        try:
+            return await self._events.__anext__()
+        except BaseException:
+            await self.aclose()
+            raise
+
+    async def aclose(self) -> None:
+        try:
+            await self._events.aclose()
+        finally:
+            if not self._released:
+                self._released = True
+                self._limiter.release(time.monotonic() - self._start)
+
+async def _start_run(
+    agent: Any, message: str, model: Optional[str], key: Optional[AnswerKey]
+) -> Tuple[AsyncIterator[Dict[str, Any]], bool]:
+    """Start the agent run for a message, or join an identical one already in flight.
+
+    Returns (events, joined). Only a run that is started takes a slot, so a
+    burst of the same question uses one slot and one LLM call.
+    """
+    coalesce = key is not None and settings.COALESCE_REQUESTS
+    if coalesce:
+        events = agent_flight.join(key)
+        if events is not None:
+            return events, True
+    limiter = await _acquire_slot(model)
+    if coalesce:
+        # An identical run may have started while we waited for the slot
+        events = agent_flight.join(key)
+        if events is not None:
+            limiter.release()
+            return events, True
+    events = _LimitedEvents(astream_agent(agent, message, model), limiter)
+    if coalesce:
+        return agent_flight.lead(key, events), False
+    return events, False
+
+async def _save_question(
+    db: AsyncSession, session_id: str, message: str, events: Optional[AsyncIterator[Dict[str, Any]]]
+) -> None:
+    """Store the user's message, closing the run's events (and so its slot) if that fails."""
+    try:
+        await save_chat(db, session_id, message, True)
+    except BaseException:
+        if events is not None:
+            await events.aclose()
+        raise
+
+async def generate_cached_response(agent: Any, message: str, answer: str, db: AsyncSession, session_id: str) -> AsyncGenerator[str, None]:
+    # Keep the agent's memory in step with the conversation as if it had answered
+    agent.memory.save_context({"input": message}, {"output": answer})
+    await save_chat(db, session_id, answer, False)
+    yield _sse({"content": answer})
+    yield "event: done\ndata: {}\n\n"
+
+async def _answer_events(
+    agent: Any,
+    message: str,
+    db: AsyncSession,
+    session_id: str,
+    events: AsyncIterator[Dict[str, Any]],
+    joined: bool = False,
+    cache_key: Optional[AnswerKey] = None,
+    cache_vector=None
+) -> AsyncGenerator[Dict[str, Any], None]:
+    """Relay an agent run's events and save its answer.
+
+    Ends with {"type": "done", "output": ...}, preceded by {"type": "error"}
+    if the run failed. Closing the generator early (client gone or answer
+    stopped) cancels the run and saves what was streamed so far, marked
+    with STOPPED_SUFFIX.
+    """
+    tokens: List[str] = []
+    finished = False
+    try:
+        ai_response = None
+        async with aclosing(events):
+            async for event in events:
+                # Coalesced runs share event dicts between subscribers
+                event = dict(event)
+                if event["type"] == "end":
+                    ai_response = event["output"]
+                    continue
+                if event["type"] == "token":
+                    tokens.append(event["content"])
+                yield event
+        finished = True
+
+        if joined:
+            # Another session's agent produced the answer; record the turn here too
+            agent.memory.save_context({"input": message}, {"output": ai_response})
+        # Store the complete AI response in the database once streaming is done
         await save_chat(db, session_id, ai_response, False)
-        
-        # Split response into chunks and stream
-        chunks = [ai_response[i:i+5] for i in range(0, len(ai_response), 5)]
-        for chunk in chunks:
-            yield f"data: {json.dumps({'content': chunk})}\n\n"
-            await asyncio.sleep(0.05)  # Add small delay between chunks
-            
-        yield "event: done\ndata: {}\n\n"
-        
+        if cache_key is not None and not joined and settings.ANSWER_CACHE_ENABLED:
+            await answer_cache.store(cache_key, ai_response, cache_vector)
+        yield {"type": "done", "output": ai_response}
+
     except Exception as e:
+        finished = True
         error_message = str(e)
         # Store error response in database
         await save_chat(db, session_id, f"Error: {error_message}", False)
-        yield f"data: {json.dumps({'error': error_message})}\n\n"
-        yield "event: done\ndata: {}\n\n"
+        yield {"type": "error", "error": error_message}
+        yield {"type": "done", "output": None}
+
+    finally:
+        if not finished:
+            # Cancelled mid-answer; nothing may be awaited here
+            partial = ("".join(tokens) + STOPPED_SUFFIX).lstrip()
+            # A coalesced run we led keeps going for the sessions that joined it,
+            # and this agent's executor records the full answer when it ends
+            if joined or not getattr(events, "run_continues", False):
+                agent.memory.save_context({"input": message}, {"output": partial})
+            save_chat_nowait(session_id, partial, False)
+            answers_interrupted.inc()
+
+async def generate_response(
+    agent: Any,
+    message: str,
+    db: AsyncSession,
+    session_id: str,
+    events: AsyncIterator[Dict[str, Any]],
+    joined: bool = False,
+    cache_key: Optional[AnswerKey] = None,
+    cache_vector=None
+) -> AsyncGenerator[str, None]:
+    answer = _answer_events(agent, message, db, session_id, events, joined, cache_key, cache_vector)
+    async with aclosing(answer):
+        async for event in answer:
+            event_type = event.pop("type")
+            if event_type == "token":
+                yield _sse(event)
+            elif event_type in ("tool_start", "tool_end"):
+                yield _sse({"status": event_type, **event}, event="tool")
+            elif event_type in ("retrieval_start", "retrieval_end"):
+                yield _sse({"status": event_type, **event}, event="retrieval")
+            elif event_type == "error":
+                yield _sse({"error": event["error"]})
+            elif event_type == "done":
+                yield "event: done\ndata: {}\n\n"
+
+class EventStreamResponse(StreamingResponse):
+    """Server-sent events whose generator is always closed when the response ends.
+
+    Depending on the server, a client disconnect either cancels the
+    response or surfaces as a failed send that would leave the generator
+    suspended; closing it cancels the agent run either way. Closing a
+    generator that never started runs none of its cleanup, so the agent
+    events it would have consumed are passed in `closing` and closed too.
+    """
+    media_type = "text/event-stream"
+
+    def __init__(self, content: Any, *args, closing: Sequence[Any] = (), **kwargs):
+        super().__init__(content, *args, **kwargs)
+        self.closing = closing
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.body_iterator.aclose()
+            for resource in self.closing:
+                await resource.aclose()
 
 @router.get("/stream")
 async def stream_chat(
     message: str,
     session_id: str = "default",
     model: Optional[str] = None,
+    requested: Optional[str] = Depends(requested_namespace),
     db: AsyncSession = Depends(get_db)
-) -> StreamingResponse:
+) -> EventStreamResponse:
+    namespace = await _resolve_namespace(db, session_id, requested)
     # Get or create agent for this session
-    session_key = f"{session_id}_{model or 'default'}"
-    
-    if session_key not in agents:
-        agents[session_key] = create_agent(session_id, model)
-    
-    agent = agents[session_key]
+    agent = await agent_pool.get(db, session_id, model, namespace)
+    cached, cache_key, cache_vector = await _lookup_answer(agent, message, model, namespace)
+    # Cached answers need no agent run; everything else starts (or joins) one
+    # first so a rejected request leaves nothing behind
+    if cached is None:
+        events, joined = await _start_run(agent, message, model, cache_key)
     
     # Store user message
-    await save_chat(db, session_id, message, True)
+    await _save_question(db, session_id, message, None if cached is not None else events)
 
-    return StreamingResponse(
-        generate_response(agent, message, db, session_id),
-        media_type="text/event-stream"
+    if cached is not None:
+        return EventStreamResponse(generate_cached_response(agent, message, cached, db, session_id))
+
+    return EventStreamResponse(
+        generate_response(agent, message, db, session_id, events, joined, cache_key, cache_vector),
+        closing=(events,)
     )
 
 @router.get("/sessions")
-async def get_chat_sessions(db: AsyncSession = Depends(get_db)) -> List[ChatSession]:
-    # Get unique session IDs with their latest message and message count
-    query = select(
-        Chat.session_id,
-        func.max(Chat.timestamp).label("latest_timestamp"),
-        func.count().label("message_count"),
-        func.substring(func.min(Chat.message), 1, 50).label("first_message")  # Use first 50 chars of first message as title
-    ).group_by(Chat.session_id)
-    
+async def get_chat_sessions(
+    namespace: Optional[str] = Depends(requested_namespace),
+    db: AsyncSession = Depends(get_db)
+) -> List[ChatSession]:
+    # Read our own queued writes
+    await chat_writer.flush()
+    # Sessions are summarized as messages are written, so this is an indexed read
+    query = select(ChatSessionModel).where(ChatSessionModel.message_count > 0)
+    if namespace is not None:
+        query = query.where(ChatSessionModel.namespace == namespace)
+    query = query.order_by(ChatSessionModel.last_activity.desc())
     result = await db.execute(query)
-    sessions = result.all()
+    sessions = result.scalars().all()
     
     return [
         ChatSession(
-            id=session.session_id,
-            title=session.first_message + "..." if len(session.first_message or "") > 47 else session.first_message,
-            timestamp=session.latest_timestamp,
+            id=session.id,
+            title=session.title[:47] + "..." if len(session.title or "") > 47 else session.title,
+            timestamp=session.last_activity,
             message_count=session.message_count
         )
         for session in sessions
@@ -115,45 +327,81 @@ async def get_chat_sessions(db: AsyncSession = Depends(get_db)) -> List[ChatSess
 @router.post("/send")
 async def send_message(
     message_request: MessageRequest,
+    requested: Optional[str] = Depends(requested_namespace),
     db: AsyncSession = Depends(get_db)
 ) -> MessageResponse:
+    namespace = await _resolve_namespace(db, message_request.session_id, requested)
     # Get or create agent for this session
-    session_key = f"{message_request.session_id}_{message_request.model or 'default'}"
-    
-    if session_key not in agents:
-        agents[session_key] = create_agent(
-            message_request.session_id,
-            message_request.model
-        )
-    
-    agent = agents[session_key]
+    agent = await agent_pool.get(db, message_request.session_id, message_request.model, namespace)
+    cached, cache_key, cache_vector = await _lookup_answer(
+        agent, message_request.message, message_request.model, namespace
+    )
+    if cached is None:
+        events, joined = await _start_run(agent, message_request.message, message_request.model, cache_key)
     
     # Store user message
-    await save_chat(db, message_request.session_id, message_request.message, True)
+    await _save_question(
+        db, message_request.session_id, message_request.message, None if cached is not None else events
+    )
 
-    try:
-        # Get response from agent
-        response = agent.invoke({"input": message_request.message})
-        ai_response = response.get("output", "I apologize, but I couldn't process that request.")
+    if cached is not None:
+        agent.memory.save_context({"input": message_request.message}, {"output": cached})
+        await save_chat(db, message_request.session_id, cached, False)
+        return MessageResponse(content=cached)
 
-        # Store AI response
-        await save_chat(db, message_request.session_id, ai_response, False)
+    answer = _answer_events(
+        agent, message_request.message, db, message_request.session_id, events, joined, cache_key, cache_vector
+    )
+    async with aclosing(answer):
+        async for event in answer:
+            if event["type"] == "error":
+                raise HTTPException(status_code=500, detail=event["error"])
+            if event["type"] == "done":
+                return MessageResponse(content=event["output"])
 
-        return MessageResponse(content=ai_response)
-    except Exception as e:
-        error_message = str(e)
-        # Store error response
-        await save_chat(db, message_request.session_id, f"Error: {error_message}", False)
-        raise HTTPException(status_code=500, detail=error_message)
+@router.get("/limits")
+async def get_agent_limits() -> Dict[str, Dict[str, Any]]:
+    """Concurrency, queue depth and wait times of each agent limiter."""
+    return agent_limits.stats()
+
+def _encode_cursor(chat: Chat) -> str:
+    return f"{chat.timestamp.isoformat()}|{chat.id}"
+
+def _decode_cursor(cursor: str):
+    try:
+        timestamp, chat_id = cursor.rsplit("|", 1)
+        return datetime.fromisoformat(timestamp), int(chat_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 @router.get("/history")
 async def get_chat_history(
+    response: Response,
     session_id: str = "default",
+    limit: int = Query(100, ge=1, le=500),
+    before: Optional[str] = None,
     db: AsyncSession = Depends(get_db)
 ) -> List[dict]:
-    query = select(Chat).where(Chat.session_id == session_id).order_by(Chat.timestamp)
+    """Return the newest `limit` messages older than the `before` cursor, oldest first.
+
+    When older messages remain, the cursor for the next page is sent in the
+    X-Next-Cursor header.
+    """
+    await chat_writer.flush()
+    query = select(Chat).where(Chat.session_id == session_id)
+    if before:
+        timestamp, chat_id = _decode_cursor(before)
+        query = query.where(
+            (Chat.timestamp < timestamp) | ((Chat.timestamp == timestamp) & (Chat.id < chat_id))
+        )
+    # Keyset pagination over the (session_id, timestamp) index
+    query = query.order_by(Chat.timestamp.desc(), Chat.id.desc()).limit(limit + 1)
     result = await db.execute(query)
     chats = result.scalars().all()
+
+    if len(chats) > limit:
+        chats = chats[:limit]
+        response.headers["X-Next-Cursor"] = _encode_cursor(chats[-1])
     
     return [
         {
@@ -162,5 +410,176 @@ async def get_chat_history(
             "is_user": chat.is_user,
             "timestamp": chat.timestamp
         }
-        for chat in chats
-    ]
\ No newline at end of file
+        for chat in reversed(chats)
+    ]
+
+class SocketRequest(BaseModel):
+    """A frame sent by a /chat/ws client."""
+    type: str  # "message" or "stop"
+    id: str  # chosen by the client; tags every frame of the answer
+    message: Optional[str] = None
+    session_id: str = "default"
+    model: Optional[str] = None
+    namespace: Optional[str] = None
+
+def _merge_tokens(frames: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Join consecutive token frames of the same answer, so a slow client gets fewer, larger frames."""
+    merged: List[Dict[str, Any]] = []
+    for frame in frames:
+        previous = merged[-1] if merged else None
+        if (
+            previous is not None and frame["type"] == "token" and previous["type"] == "token"
+            and previous["id"] == frame["id"]
+        ):
+            merged[-1] = {**previous, "content": previous["content"] + frame["content"]}
+        else:
+            merged.append(frame)
+    return merged
+
+class ChatConnection:
+    """One /chat/ws connection, carrying answers for any number of sessions.
+
+    Each "message" frame starts an answer that runs as its own task, and
+    every frame sent back carries the request id. Frames go through a
+    bounded outbox drained by a single sender: when the client reads slowly
+    the outbox fills and the answers wait, and queued tokens of the same
+    answer are sent as one frame. A "stop" frame, or the connection
+    closing, cancels the agent run and saves the partial answer.
+    """
+
+    def __init__(self, websocket: WebSocket, namespace: Optional[str]):
+        self.websocket = websocket
+        self.namespace = namespace
+        self._outbox: asyncio.Queue = asyncio.Queue(maxsize=settings.WS_SEND_QUEUE_SIZE)
+        self._runs: Dict[str, asyncio.Task] = {}
+        self._busy_sessions: Dict[str, str] = {}
+        self._stopping: set = set()
+
+    async def serve(self) -> None:
+        sender = asyncio.create_task(self._send_frames())
+        try:
+            while True:
+                data = await self.websocket.receive_json()
+                try:
+                    request = SocketRequest.model_validate(data)
+                except ValueError as e:
+                    await self._send({"type": "error", "id": None, "status": 400, "error": str(e)})
+                    continue
+                if request.type == "message":
+                    await self._start(request)
+                elif request.type == "stop":
+                    self._stop(request.id)
+                else:
+                    await self._send({"type": "error", "id": request.id, "status": 400, "error": f"Unknown frame type {request.type}"})
+        except WebSocketDisconnect:
+            pass
+        finally:
+            runs = list(self._runs.values())
+            for task in runs:
+                task.cancel()
+            await asyncio.gather(*runs, return_exceptions=True)
+            sender.cancel()
+            await asyncio.gather(sender, return_exceptions=True)
+
+    async def _start(self, request: SocketRequest) -> None:
+        if request.id in self._runs:
+            error = (409, f"Request {request.id} is already running")
+        elif request.session_id in self._busy_sessions:
+            error = (409, f"Session {request.session_id} is already answering")
+        elif len(self._runs) >= settings.WS_MAX_RUNS:
+            error = (429, f"At most {settings.WS_MAX_RUNS} answers may run at once on a connection")
+        elif not request.message:
+            error = (400, "A message frame needs a message")
+        else:
+            error = None
+        if error is not None:
+            await self._send({"type": "error", "id": request.id, "status": error[0], "error": error[1]})
+            return
+        self._busy_sessions[request.session_id] = request.id
+        task = asyncio.create_task(self._run(request))
+        self._runs[request.id] = task
+        task.add_done_callback(lambda _: self._finished(request))
+
+    def _stop(self, request_id: str) -> None:
+        task = self._runs.get(request_id)
+        if task is not None and not task.done():
+            self._stopping.add(request_id)
+            task.cancel()
+
+    def _finished(self, request: SocketRequest) -> None:
+        self._runs.pop(request.id, None)
+        self._stopping.discard(request.id)
+        if self._busy_sessions.get(request.session_id) == request.id:
+            del self._busy_sessions[request.session_id]
+
+    async def _run(self, request: SocketRequest) -> None:
+        try:
+            async with AsyncSessionLocal() as db:
+                await self._answer(db, request)
+        except asyncio.CancelledError:
+            if request.id not in self._stopping:
+                raise
+            # Stopped by the client, which still expects the answer to end
+            await self._send({"type": "done", "id": request.id, "output": None, "stopped": True})
+        except HTTPException as e:
+            await self._send({"type": "error", "id": request.id, "status": e.status_code, "error": e.detail})
+        except Exception as e:
+            logger.error(f"WebSocket answer {request.id} failed: {str(e)}", exc_info=True)
+            await self._send({"type": "error", "id": request.id, "status": 500, "error": str(e)})
+
+    async def _answer(self, db: AsyncSession, request: SocketRequest) -> None:
+        try:
+            requested = normalize_namespace(request.namespace) if request.namespace else self.namespace
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        namespace = await _resolve_namespace(db, request.session_id, requested)
+        agent = await agent_pool.get(db, request.session_id, request.model, namespace)
+        cached, cache_key, cache_vector = await _lookup_answer(agent, request.message, request.model, namespace)
+        if cached is None:
+            events, joined = await _start_run(agent, request.message, request.model, cache_key)
+        await _save_question(db, request.session_id, request.message, None if cached is not None else events)
+
+        if cached is not None:
+            agent.memory.save_context({"input": request.message}, {"output": cached})
+            await save_chat(db, request.session_id, cached, False)
+            await self._send({"type": "token", "id": request.id, "content": cached})
+            await self._send({"type": "done", "id": request.id, "output": cached, "stopped": False})
+            return
+
+        answer = _answer_events(agent, request.message, db, request.session_id, events, joined, cache_key, cache_vector)
+        async with aclosing(answer):
+            async for event in answer:
+                if event["type"] == "done":
+                    event["stopped"] = False
+                await self._send({**event, "id": request.id})
+
+    async def _send(self, frame: Dict[str, Any]) -> None:
+        # Waits while the outbox is full: backpressure from a slow client
+        await self._outbox.put(frame)
+
+    async def _send_frames(self) -> None:
+        while True:
+            frames = [await self._outbox.get()]
+            while not self._outbox.empty():
+                frames.append(self._outbox.get_nowait())
+            for frame in _merge_tokens(frames):
+                await self.websocket.send_json(frame)
+
+@router.websocket("/ws")
+async def chat_websocket(websocket: WebSocket, namespace: Optional[str] = None) -> None:
+    """Stream answers for several sessions over one connection.
+
+    Send {"type": "message", "id", "message", "session_id", "model",
+    "namespace"} to ask and {"type": "stop", "id"} to stop an answer.
+    Answers arrive as token, tool_start/tool_end, retrieval_start/
+    retrieval_end and error frames tagged with the request id, ending with
+    {"type": "done", "id", "output", "stopped"}. The namespace query
+    parameter sets a default for the connection's messages.
+    """
+    await websocket.accept()
+    try:
+        namespace = normalize_namespace(namespace) if namespace else None
+    except ValueError as e:
+        await websocket.close(code=1008, reason=str(e))
+        return
+    await ChatConnection(websocket, namespace).serve()
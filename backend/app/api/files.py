@@ -1,13 +1,20 @@
+import asyncio
+import hashlib
 import os
+import tempfile
+import aiofiles
 from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from typing import List
+from typing import Dict, List, Optional, Tuple
 import logging
 from app.db.database import get_db
 from app.db.models import File as FileModel
 from app.core.config import settings
-from app.core.document_processor import process_document
+from app.core.document_processor import delete_document_vectors
+from app.core.ingestion import ingestion_queue, safe_filename, stage_file
+from app.core.vectorstore import DEFAULT_NAMESPACE, bump_corpus_version
+from app.api.namespace import requested_namespace
 from pydantic import BaseModel
 from datetime import datetime
 
@@ -17,77 +24,246 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
 class FileResponse(BaseModel):
     id: int
     filename: str
     upload_time: datetime
+    status: str = "ready"
+    chunk_count: int = 0
+
+class UploadResponse(FileResponse):
+    # None when the upload is identical to the indexed file and was skipped
+    job_id: Optional[str] = None
+
+class BatchUploadResponse(BaseModel):
+    batch_id: str
+    files: List[UploadResponse]
+
+class BatchReport(BaseModel):
+    id: str
+    done: bool
+    files: int
+    skipped: int
+    pending: int
+    processing: int
+    ready: int
+    failed: int
+    errors: Dict[str, str]
+    pages_parsed: int
+    chunks_total: int
+    chunks_embedded: int
+    elapsed_s: float
+    pages_per_s: float
+    chunks_per_s: float
+
+class DeleteResponse(BaseModel):
+    id: int
+    filename: str
+    chunks_deleted: int
+
+class JobResponse(BaseModel):
+    id: str
+    file_id: int
+    filename: str
+    document_id: str
+    namespace: str
+    status: str
+    pages_parsed: int
+    chunks_total: int
+    chunks_embedded: int
+    chunks_unchanged: int
+    chunks_deleted: int
+    error: Optional[str] = None
+    created_at: float
+    finished_at: Optional[float] = None
+
+def _file_response(db_file: FileModel) -> FileResponse:
+    # Files uploaded before ingestion state was tracked were processed inline
+    return FileResponse(
+        id=db_file.id,
+        filename=db_file.filename,
+        upload_time=db_file.upload_time,
+        status=db_file.status or "ready",
+        chunk_count=db_file.chunk_count or 0
+    )
+
+async def _save_upload(file: UploadFile) -> Tuple[str, str]:
+    """Stream an upload into a temporary file in UPLOAD_DIR.
+
+    Reads in fixed-size chunks so the file is never held in memory, hashes it
+    on the way and aborts with 413 as soon as MAX_UPLOAD_SIZE is exceeded.
+    Returns (temporary path, sha256 hex digest); the caller renames or
+    removes the temporary file.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=settings.UPLOAD_DIR, prefix=".upload-", suffix=".part")
+    os.close(fd)
+    try:
+        async with aiofiles.open(tmp_path, 'wb') as out:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > settings.MAX_UPLOAD_SIZE:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"File exceeds the maximum upload size of {settings.MAX_UPLOAD_SIZE} bytes"
+                    )
+                digest.update(chunk)
+                await out.write(chunk)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return tmp_path, digest.hexdigest()
+
+def _check_file_type(filename: str) -> None:
+    try:
+        filename = safe_filename(filename)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not filename.endswith(('.txt', '.pdf')):
+        raise HTTPException(
+            status_code=400,
+            detail="Only .txt and .pdf files are supported"
+        )
+
+async def _accept_upload(file: UploadFile, db: AsyncSession, namespace: str) -> Tuple[UploadResponse, Optional[str]]:
+    """Save an upload and queue its ingestion into a namespace, returning (response, job id)."""
+    tmp_path, content_hash = await _save_upload(file)
+    try:
+        db_file, changed = await stage_file(db, file.filename, tmp_path, content_hash, namespace)
+    finally:
+        # Left over when the upload was skipped or failed before the rename
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    if not changed:
+        logger.info(f"{file.filename} is unchanged, skipping ingestion")
+        return UploadResponse(**_file_response(db_file).model_dump()), None
+
+    # Parsing and embedding happen in the background; poll /files/jobs/{id}
+    job = ingestion_queue.submit(db_file.id, db_file.filename, db_file.filepath, db_file.document_id, namespace)
+    logger.info(f"Queued ingestion job {job.id} for {file.filename}")
+    return UploadResponse(**_file_response(db_file).model_dump(), job_id=job.id), job.id
 
 @router.post("/upload")
 async def upload_file(
     file: UploadFile = File(...),
+    namespace: Optional[str] = Depends(requested_namespace),
     db: AsyncSession = Depends(get_db)
-) -> FileResponse:
+) -> UploadResponse:
     try:
         # Create uploads directory if it doesn't exist
         os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
         logger.info(f"Processing upload for file: {file.filename}")
         
         # Validate file type
-        if not file.filename.endswith(('.txt', '.pdf')):
-            raise HTTPException(
-                status_code=400,
-                detail="Only .txt and .pdf files are supported"
-            )
-        
-        # Save file to uploads directory
-        file_path = os.path.join(settings.UPLOAD_DIR, file.filename)
-        logger.info(f"Saving file to: {file_path}")
-        
-        try:
-            contents = await file.read()
-            with open(file_path, 'wb') as f:
-                f.write(contents)
-                
-            # Process the document and add to vector store
-            logger.info("Processing document for vector store")
-            process_document(file_path)
-        except Exception as e:
-            logger.error(f"Error processing file: {str(e)}", exc_info=True)
-            raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
-        
-        # Save file info to database
-        logger.info("Saving file info to database")
-        db_file = FileModel(
-            filename=file.filename,
-            filepath=file_path
-        )
-        db.add(db_file)
-        await db.commit()
-        await db.refresh(db_file)
-        
-        logger.info("File upload completed successfully")
-        return FileResponse(
-            id=db_file.id,
-            filename=db_file.filename,
-            upload_time=db_file.upload_time
-        )
+        _check_file_type(file.filename)
+
+        # A re-upload under the same name re-indexes the existing document
+        response, _ = await _accept_upload(file, db, namespace or DEFAULT_NAMESPACE)
+        return response
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Unexpected error during file upload: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
+@router.post("/upload-batch")
+async def upload_batch(
+    files: List[UploadFile] = File(...),
+    namespace: Optional[str] = Depends(requested_namespace),
+    db: AsyncSession = Depends(get_db)
+) -> BatchUploadResponse:
+    """Upload many documents at once; poll /files/batches/{id} for throughput."""
+    if len(files) > settings.MAX_BATCH_FILES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"A batch may contain at most {settings.MAX_BATCH_FILES} files"
+        )
+    # Reject the whole batch before saving anything
+    for file in files:
+        _check_file_type(file.filename)
+    # Names are stored without their directory part, so compare them that way
+    names = [safe_filename(file.filename) for file in files]
+    if len(set(names)) != len(names):
+        raise HTTPException(status_code=400, detail="Filenames in a batch must be unique")
+
+    try:
+        os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
+        responses, jobs, skipped = [], [], []
+        for file in files:
+            response, job_id = await _accept_upload(file, db, namespace or DEFAULT_NAMESPACE)
+            responses.append(response)
+            if job_id is None:
+                skipped.append(response.filename)
+            else:
+                jobs.append(ingestion_queue.get(job_id))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Unexpected error during batch upload: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+
+    batch = ingestion_queue.track_batch(jobs, skipped)
+    logger.info(f"Queued batch {batch.id}: {len(jobs)} files to ingest, {len(skipped)} unchanged")
+    return BatchUploadResponse(batch_id=batch.id, files=responses)
+
 @router.get("/list")
 async def list_files(
+    namespace: Optional[str] = Depends(requested_namespace),
     db: AsyncSession = Depends(get_db)
 ) -> List[FileResponse]:
-    query = select(FileModel).order_by(FileModel.upload_time.desc())
+    query = (
+        select(FileModel)
+        .where(FileModel.namespace == (namespace or DEFAULT_NAMESPACE))
+        .order_by(FileModel.upload_time.desc())
+    )
     result = await db.execute(query)
     files = result.scalars().all()
     
-    return [
-        FileResponse(
-            id=file.id,
-            filename=file.filename,
-            upload_time=file.upload_time
+    return [_file_response(file) for file in files]
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str) -> JobResponse:
+    job = ingestion_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JobResponse(**job.to_dict())
+
+@router.get("/batches/{batch_id}")
+async def get_batch(batch_id: str) -> BatchReport:
+    report = ingestion_queue.batch_report(batch_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return BatchReport(**report)
+
+@router.delete("/{file_id}")
+async def delete_file(
+    file_id: int,
+    namespace: Optional[str] = Depends(requested_namespace),
+    db: AsyncSession = Depends(get_db)
+) -> DeleteResponse:
+    db_file = await db.get(FileModel, file_id)
+    # Files of other namespaces are not visible from this one
+    if db_file is None or db_file.namespace != (namespace or DEFAULT_NAMESPACE):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    # Files indexed before document ids existed have untagged chunks we cannot find
+    chunks_deleted = 0
+    if db_file.document_id:
+        # A running ingestion would add chunks back after they are deleted
+        await ingestion_queue.cancel_document(db_file.document_id)
+        chunks_deleted = await asyncio.to_thread(
+            delete_document_vectors, db_file.namespace, db_file.document_id
         )
-        for file in files
-    ]
\ No newline at end of file
+        if chunks_deleted:
+            bump_corpus_version()
+
+    if db_file.filepath and os.path.exists(db_file.filepath):
+        os.remove(db_file.filepath)
+
+    await db.delete(db_file)
+    await db.commit()
+    logger.info(f"Deleted {db_file.filename} and {chunks_deleted} chunks")
+    return DeleteResponse(id=file_id, filename=db_file.filename, chunks_deleted=chunks_deleted)
@@ -0,0 +1,72 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from app.chains.agent import agent_flight
+from app.chains.cache import answer_cache
+from app.chains.limits import agent_limits
+from app.chains.pool import agent_pool
+from app.core.ingestion import ingestion_queue
+from app.core.llm import provider_stats
+from app.core.metrics import Collector, registry
+from app.core.retrieval import retrieval_cache, retrieval_flight
+from app.core.vectorstore import embedding_cache
+from app.core.warmup import startup_timings
+from app.db.chats import chat_writer
+
+router = APIRouter()
+
+def _per_limiter(field: str):
+    return lambda: {(name,): stats[field] for name, stats in agent_limits.stats().items()}
+
+def _per_provider(field: str):
+    return lambda: {
+        (provider,): stats[field] for provider, stats in provider_stats.stats().items() if stats[field] is not None
+    }
+
+def _memory_tokens_saved():
+    # Imported at scrape time: the memory module pulls in langchain.memory
+    from app.chains.memory import memory_stats
+    return {(): memory_stats["tokens_saved"]}
+
+def _embedding_cache(field: str):
+    def collect():
+        cache = embedding_cache()
+        return {(): cache.stats()[field]} if cache is not None else {}
+    return collect
+
+# Gauges and counters read from the components' own statistics at scrape time
+for metric in [
+    Collector("agent_limiter_active", "Agent runs holding a concurrency slot.", _per_limiter("active"), ["limiter"]),
+    Collector("agent_limiter_queue_depth", "Agent runs waiting for a concurrency slot.", _per_limiter("queue_depth"), ["limiter"]),
+    Collector("agent_limiter_rejected_queue_full_total", "Requests rejected with 429.", _per_limiter("rejected_queue_full"), ["limiter"], kind="counter"),
+    Collector("agent_limiter_rejected_timeout_total", "Requests rejected with 503.", _per_limiter("rejected_timeout"), ["limiter"], kind="counter"),
+    Collector("agent_pool_size", "Agents held in the session pool.", lambda: {(): len(agent_pool)}),
+    Collector("agent_pool_hits_total", "Agent pool lookups served by a pooled agent.", lambda: {(): agent_pool.hits}, kind="counter"),
+    Collector("agent_pool_misses_total", "Agent pool lookups that built a new agent.", lambda: {(): agent_pool.misses}, kind="counter"),
+    Collector("agent_pool_evictions_total", "Agents evicted from the pool.", lambda: {(): agent_pool.evictions}, kind="counter"),
+    Collector("answer_cache_hits_total", "Answer cache hits.", lambda: {(): answer_cache.hits}, kind="counter"),
+    Collector("answer_cache_misses_total", "Answer cache misses.", lambda: {(): answer_cache.misses}, kind="counter"),
+    Collector("embedding_cache_hits_total", "Embedding cache hits.", _embedding_cache("hits"), kind="counter"),
+    Collector("embedding_cache_misses_total", "Embedding cache misses.", _embedding_cache("misses"), kind="counter"),
+    Collector("retrieval_cache_hits_total", "Retrieval cache hits for query embeddings and search results.", lambda: {(kind,): hits for kind, hits in retrieval_cache.hits.items()}, ["kind"], kind="counter"),
+    Collector("retrieval_cache_misses_total", "Retrieval cache misses for query embeddings and search results.", lambda: {(kind,): misses for kind, misses in retrieval_cache.misses.items()}, ["kind"], kind="counter"),
+    Collector("retrieval_cache_size_bytes", "Estimated size of the retrieval cache.", lambda: {(): retrieval_cache.stats()["size_bytes"]}),
+    Collector("coalesced_agent_runs_started_total", "Agent runs started for shareable questions.", lambda: {(): agent_flight.started}, kind="counter"),
+    Collector("coalesced_agent_runs_joined_total", "Requests that joined an identical agent run.", lambda: {(): agent_flight.joined}, kind="counter"),
+    Collector("coalesced_retrievals_shared_total", "Retrievals answered by an identical one in flight.", lambda: {(): retrieval_flight.shared}, kind="counter"),
+    Collector("llm_provider_ttft_ewma_seconds", "Smoothed time to first token per LLM provider.", _per_provider("ttft_ewma_s"), ["provider"]),
+    Collector("llm_provider_calls_total", "LLM calls per provider.", _per_provider("calls"), ["provider"], kind="counter"),
+    Collector("llm_provider_errors_total", "Failed LLM calls per provider.", _per_provider("errors"), ["provider"], kind="counter"),
+    Collector("llm_hedges_total", "Backup LLM calls started because the primary was slow.", lambda: {(): provider_stats.hedges}, kind="counter"),
+    Collector("llm_fallbacks_total", "LLM calls answered by a fallback model.", lambda: {(): provider_stats.fallbacks}, kind="counter"),
+    Collector("app_startup_step_seconds", "Duration of each startup and warmup step.", lambda: {(step,): seconds for step, seconds in startup_timings.items()}, ["step"]),
+    Collector("memory_tokens_saved_total", "Prompt tokens saved by summarizing older turns.", _memory_tokens_saved, kind="counter"),
+    Collector("ingestion_queue_depth", "Ingestion jobs waiting for a worker.", lambda: {(): ingestion_queue.depth}),
+    Collector("chat_writer_queued", "Chat messages waiting for the next group commit.", lambda: {(): chat_writer.queued}),
+    Collector("chat_writer_written_total", "Chat messages persisted by the writer.", lambda: {(): chat_writer.written}, kind="counter"),
+]:
+    registry.register(metric)
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics() -> PlainTextResponse:
+    """Prometheus text exposition of every registered metric."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
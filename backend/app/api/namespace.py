@@ -0,0 +1,17 @@
+from typing import Optional
+from fastapi import Header, HTTPException, Query
+from app.core.vectorstore import normalize_namespace
+
+def requested_namespace(
+    x_namespace: Optional[str] = Header(None),
+    # EventSource cannot send headers, so /chat/stream takes it as a parameter
+    namespace: Optional[str] = Query(None)
+) -> Optional[str]:
+    """Namespace named by the X-Namespace header or the namespace query parameter, if any."""
+    value = x_namespace or namespace
+    if not value:
+        return None
+    try:
+        return normalize_namespace(value)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -1,62 +1,250 @@
-from typing import List, Optional
-from langchain_community.chat_message_histories import ChatMessageHistory
-from langchain.memory import ConversationBufferMemory
-from langchain_openai import ChatOpenAI
-from langchain.agents import AgentExecutor, create_openai_functions_agent
-from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain.tools import Tool
-from langchain.callbacks.base import BaseCallbackHandler
-from langchain.schema import AgentAction, LLMResult
+from typing import TYPE_CHECKING, Any, AsyncGenerator, Dict, List, Optional
+from uuid import UUID
+from langchain_core.agents import AgentAction
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.tools import StructuredTool
+from app.core.coalesce import StreamFlight
+from app.core.llm import get_llm
+from app.core.metrics import (
+    agent_run_duration,
+    get_tracer,
+    llm_duration,
+    llm_tokens,
+    retrieval_duration,
+    time_to_first_token,
+    tool_calls,
+)
+from app.chains.context import pack_context
+from app.core.retrieval import get_retriever
 from app.core.vectorstore import get_vectorstore
 from app.core.config import settings
+from pydantic import BaseModel, Field
 import asyncio
+import logging
+import time
+
+if TYPE_CHECKING:
+    from langchain.agents import AgentExecutor
+
+logger = logging.getLogger(__name__)
+
+class SearchDocumentsInput(BaseModel):
+    query: str = Field(description="What to look for in the documents")
+    filename: Optional[str] = Field(
+        default=None,
+        description="Only search this uploaded file, e.g. 'lecture-3.pdf'"
+    )
 
 class StreamingHandler(BaseCallbackHandler):
-    """Callback handler for streaming responses."""
-    
-    def __init__(self):
+    """Callback handler for streaming responses.
+
+    When bound to an asyncio queue, every token and tool/retrieval progress
+    event is pushed onto it as a dict. Callbacks can fire from executor threads
+    (sync tools), so events are handed to the loop with call_soon_threadsafe.
+    """
+
+    run_inline = True
+
+    def __init__(self, queue: Optional[asyncio.Queue] = None, loop: Optional[asyncio.AbstractEventLoop] = None):
         self.tokens = []
         self.streaming_callback = None
+        self.queue = queue
+        self.loop = loop
+
+    def _emit(self, event: Dict[str, Any]) -> None:
+        if self.queue is not None and self.loop is not None:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, event)
 
     def on_llm_new_token(self, token: str, **kwargs) -> None:
         """Run when a new token is generated."""
+        # Function-call generations stream empty content; skip those.
+        if not token:
+            return
         if self.streaming_callback:
             self.streaming_callback(token)
         self.tokens.append(token)
+        self._emit({"type": "token", "content": token})
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, **kwargs) -> None:
+        """Run when the agent calls a tool."""
+        self._emit({"type": "tool_start", "tool": (serialized or {}).get("name"), "input": input_str})
+
+    def on_tool_end(self, output: Any, **kwargs) -> None:
+        """Run when a tool call finishes."""
+        self._emit({"type": "tool_end", "tool": kwargs.get("name")})
+
+    def on_retriever_start(self, serialized: Dict[str, Any], query: str, **kwargs) -> None:
+        """Run when document retrieval starts."""
+        self._emit({"type": "retrieval_start", "query": query})
+
+    def on_retriever_end(self, documents, **kwargs) -> None:
+        """Run when document retrieval finishes."""
+        self._emit({"type": "retrieval_end", "documents": len(documents)})
 
     def set_streaming_callback(self, callback):
         """Set the callback for streaming tokens."""
         self.streaming_callback = callback
 
-def create_agent(session_id: str, model: Optional[str] = None, streaming_callback=None):
-    """Create an agent with the given session ID and model."""
+class MetricsHandler(BaseCallbackHandler):
+    """Callback handler recording latency, token and tool metrics for one agent run.
+
+    When OpenTelemetry tracing is set up, every LLM, retrieval and tool run
+    also becomes a span under one span for the whole agent run.
+    """
+
+    run_inline = True
+
+    def __init__(self, model: str):
+        self.model = model
+        self.started = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        # Tokens used by this run, as reported by the provider
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._starts: Dict[UUID, float] = {}
+        self._models: Dict[UUID, str] = {}
+        self._tools: Dict[UUID, str] = {}
+        self._spans: Dict[UUID, Any] = {}
+        self._tracer = get_tracer()
+        self._root = self._tracer.start_span("agent.run", attributes={"llm.model": model}) if self._tracer else None
+
+    def finish(self, status: str) -> None:
+        """Record the whole run; call once when it is over."""
+        agent_run_duration.observe(time.perf_counter() - self.started, model=self.model, status=status)
+        for span in self._spans.values():
+            span.end()
+        self._spans.clear()
+        if self._root is not None:
+            self._root.set_attribute("agent.status", status)
+            self._root.end()
+
+    def _start(self, run_id: UUID, name: str, **attributes) -> None:
+        self._starts[run_id] = time.perf_counter()
+        if self._tracer is not None:
+            from opentelemetry import trace
+            context = trace.set_span_in_context(self._root)
+            self._spans[run_id] = self._tracer.start_span(name, context=context, attributes=attributes)
+
+    def _end(self, run_id: UUID, error: Optional[BaseException] = None) -> float:
+        elapsed = time.perf_counter() - self._starts.pop(run_id, time.perf_counter())
+        span = self._spans.pop(run_id, None)
+        if span is not None:
+            if error is not None:
+                span.record_exception(error)
+            span.end()
+        return elapsed
+
+    def _llm_start(self, run_id: UUID, kwargs: Dict[str, Any]) -> None:
+        metadata = kwargs.get("metadata") or {}
+        model = metadata.get("ls_model_name") or (kwargs.get("invocation_params") or {}).get("model_name") or self.model
+        self._models[run_id] = model
+        self._start(run_id, "llm", **{"llm.model": model})
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs) -> None:
+        self._llm_start(run_id, kwargs)
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages, *, run_id: UUID, **kwargs) -> None:
+        self._llm_start(run_id, kwargs)
+
+    def on_llm_new_token(self, token: str, **kwargs) -> None:
+        if token and self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+            time_to_first_token.observe(self.first_token_at - self.started, model=self.model)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs) -> None:
+        model = self._models.pop(run_id, self.model)
+        llm_duration.observe(self._end(run_id), model=model)
+        prompt, completion = 0, 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    prompt += usage.get("input_tokens", 0)
+                    completion += usage.get("output_tokens", 0)
+        if not prompt and not completion:
+            usage = (response.llm_output or {}).get("token_usage") or {}
+            prompt, completion = usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+        self.prompt_tokens += prompt
+        self.completion_tokens += completion
+        if prompt:
+            llm_tokens.inc(prompt, model=model, kind="prompt")
+        if completion:
+            llm_tokens.inc(completion, model=model, kind="completion")
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs) -> None:
+        model = self._models.pop(run_id, self.model)
+        llm_duration.observe(self._end(run_id, error), model=model)
+
+    def on_retriever_start(self, serialized: Dict[str, Any], query: str, *, run_id: UUID, **kwargs) -> None:
+        self._start(run_id, "retrieval")
+
+    def on_retriever_end(self, documents, *, run_id: UUID, **kwargs) -> None:
+        retrieval_duration.observe(self._end(run_id))
+
+    def on_retriever_error(self, error: BaseException, *, run_id: UUID, **kwargs) -> None:
+        retrieval_duration.observe(self._end(run_id, error))
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID, **kwargs) -> None:
+        name = (serialized or {}).get("name") or "unknown"
+        self._tools[run_id] = name
+        self._start(run_id, "tool", **{"tool.name": name})
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs) -> None:
+        self._end(run_id)
+        tool_calls.inc(tool=self._tools.pop(run_id, "unknown"), status="ok")
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs) -> None:
+        self._end(run_id, error)
+        tool_calls.inc(tool=self._tools.pop(run_id, "unknown"), status="error")
+
+def create_agent(session_id: str, model: Optional[str] = None, streaming_callback=None, namespace: Optional[str] = None):
+    """Create an agent with the given session ID and model, searching the namespace's documents."""
+    # langchain.agents and langchain.memory take about a second to import;
+    # load them with the first agent (or at warmup) rather than with the app
+    from langchain.agents import AgentExecutor, create_openai_functions_agent
+    from langchain.memory import ConversationBufferMemory
+    from langchain_community.chat_message_histories import ChatMessageHistory
+    from app.chains.memory import TokenBudgetMemory
     
-    # Initialize streaming handler
-    streaming_handler = StreamingHandler()
+    # Per-request streaming goes through astream_agent; a fixed callback can
+    # still be attached to the LLM itself
+    callbacks = []
     if streaming_callback:
+        streaming_handler = StreamingHandler()
         streaming_handler.set_streaming_callback(streaming_callback)
+        callbacks.append(streaming_handler)
     
-    # Initialize LLM with streaming
-    llm = ChatOpenAI(
-        model=model or settings.DEFAULT_MODEL,
+    # Shared, cached LLM client; fallbacks take over if the model fails or stalls
+    llm = get_llm(
+        model,
         temperature=0.7,
         streaming=True,
-        callbacks=[streaming_handler]
+        fallbacks=settings.LLM_FALLBACK_MODELS,
+        hedge_delay=settings.LLM_HEDGE_DELAY
     )
+    if callbacks:
+        llm = llm.with_config(callbacks=callbacks)
     
     # Initialize memory with error handling
     try:
         history = ChatMessageHistory()
-        memory = ConversationBufferMemory(
+        memory = TokenBudgetMemory(
             chat_memory=history,
+            llm=get_llm(model, temperature=0),
+            model_name=model or settings.DEFAULT_MODEL,
+            max_token_limit=settings.MEMORY_MAX_TOKENS,
             memory_key="chat_history",
+            output_key="output",
             return_messages=True
         )
     except Exception as e:
-        print(f"Error initializing memory: {e}")
+        logger.warning(f"Error initializing memory: {e}")
         # Fallback to basic memory
         memory = ConversationBufferMemory(
             memory_key="chat_history",
+            output_key="output",
             return_messages=True
         )
 
@@ -67,21 +255,24 @@ def create_agent(session_id: str, model: Optional[str] = None, streaming_callbac
     
     for attempt in range(max_retries):
         try:
-            vectorstore = get_vectorstore()
+            vectorstore = get_vectorstore(namespace)
             break
         except Exception as e:
             if attempt == max_retries - 1:
-                print(f"Failed to initialize vectorstore after {max_retries} attempts: {e}")
+                logger.error(f"Failed to initialize vectorstore after {max_retries} attempts: {e}")
                 raise
-            print(f"Attempt {attempt + 1} failed, retrying in {retry_delay} seconds...")
+            logger.warning(f"Attempt {attempt + 1} failed, retrying in {retry_delay} seconds...")
             asyncio.sleep(retry_delay)
             retry_delay *= 2
 
     # Create retrieval tool with error handling
-    retrieval_tool = Tool(
+    retrieval_tool = StructuredTool.from_function(
         name="search_documents",
-        description="Search through uploaded documents for relevant information. Use this tool to find specific facts or context from the documents.",
-        func=lambda q: _safe_retrieval(vectorstore, q)
+        description="Search through uploaded documents for relevant information. Use this tool to find specific facts or context from the documents. Each passage starts with its source, e.g. [notes.pdf p.3].",
+        func=lambda query, filename=None, callbacks=None: _safe_retrieval(
+            vectorstore, query, callbacks, filename, namespace, model or settings.DEFAULT_MODEL
+        ),
+        args_schema=SearchDocumentsInput
     )
 
     tools = [retrieval_tool]
@@ -100,6 +291,7 @@ def create_agent(session_id: str, model: Optional[str] = None, streaming_callbac
         
         Remember: Your goal is to be helpful while maintaining accuracy and clarity."""),
         MessagesPlaceholder(variable_name="chat_history"),
+        ("human", "{input}"),
         MessagesPlaceholder(variable_name="agent_scratchpad"),
     ])
 
@@ -111,11 +303,12 @@ def create_agent(session_id: str, model: Optional[str] = None, streaming_callbac
             prompt=prompt
         )
     except Exception as e:
-        print(f"Error creating agent: {e}")
+        logger.warning(f"Error creating agent: {e}")
         # Fallback to simpler prompt if needed
         prompt = ChatPromptTemplate.from_messages([
             ("system", "You are a helpful AI assistant."),
             MessagesPlaceholder(variable_name="chat_history"),
+            ("human", "{input}"),
             MessagesPlaceholder(variable_name="agent_scratchpad"),
         ])
         agent = create_openai_functions_agent(
@@ -128,16 +321,66 @@ def create_agent(session_id: str, model: Optional[str] = None, streaming_callbac
         agent=agent,
         tools=tools,
         memory=memory,
-        verbose=True,
+        # Step-by-step logging to stdout is for debugging; metrics cover production
+        verbose=settings.AGENT_VERBOSE,
         return_intermediate_steps=True,
         handle_parsing_errors=True
     )
 
-def _safe_retrieval(vectorstore, query: str) -> str:
+# Identical context-free questions asked at the same time share one agent run
+agent_flight = StreamFlight()
+
+async def astream_agent(agent: "AgentExecutor", message: str, model: Optional[str] = None) -> AsyncGenerator[Dict[str, Any], None]:
+    """Run the agent and yield token/progress events as they are produced.
+
+    The last event is {"type": "end", "output": ..., "usage": ...} with the
+    full answer and the prompt and completion tokens the run used.
+    If the consumer stops iterating, the underlying agent run is cancelled.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    handler = StreamingHandler(queue, loop)
+    metrics = MetricsHandler(model or settings.DEFAULT_MODEL)
+
+    task = asyncio.create_task(agent.ainvoke({"input": message}, config={"callbacks": [handler, metrics]}))
+    task.add_done_callback(lambda _: queue.put_nowait(None))
+    task.add_done_callback(lambda t: metrics.finish(
+        "cancelled" if t.cancelled() else "error" if t.exception() is not None else "ok"
+    ))
+
+    try:
+        while True:
+            event = await queue.get()
+            if event is None:
+                break
+            yield event
+
+        response = task.result()
+        yield {
+            "type": "end",
+            "output": response.get("output", "I apologize, but I couldn't process that request."),
+            "usage": {"prompt_tokens": metrics.prompt_tokens, "completion_tokens": metrics.completion_tokens}
+        }
+    finally:
+        if not task.done():
+            task.cancel()
+
+def _safe_retrieval(
+    vectorstore,
+    query: str,
+    callbacks=None,
+    filename: Optional[str] = None,
+    namespace: Optional[str] = None,
+    model: Optional[str] = None
+) -> str:
     """Safely perform retrieval with error handling."""
     try:
-        docs = vectorstore.as_retriever().get_relevant_documents(query)
-        return "\n".join(doc.page_content for doc in docs)
+        where = {"filename": filename} if filename else None
+        docs = get_retriever(vectorstore, where, namespace).invoke(query, config={"callbacks": callbacks})
+        # Merged, source-tagged passages within the context token budget
+        return pack_context(
+            query, docs, model or settings.DEFAULT_MODEL, settings.CONTEXT_MAX_TOKENS, settings.CONTEXT_RERANK
+        )
     except Exception as e:
-        print(f"Error during document retrieval: {e}")
+        logger.error(f"Error during document retrieval: {e}")
         return "I apologize, but I couldn't access the document storage at the moment. Please try again."
\ No newline at end of file
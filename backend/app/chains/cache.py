@@ -0,0 +1,121 @@
+import asyncio
+import re
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+from cachetools import TTLCache
+from app.core.config import settings
+from app.core.vectorstore import DEFAULT_NAMESPACE, corpus_version, get_vectorstore
+
+@dataclass(frozen=True)
+class AnswerKey:
+    question: str
+    model: str
+    corpus_version: int
+    namespace: str = DEFAULT_NAMESPACE
+
+def normalize_question(question: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation."""
+    return re.sub(r"\s+", " ", question).strip().lower().rstrip("?!. ")
+
+def has_prior_turns(agent: Any) -> bool:
+    """Whether the agent's memory holds earlier turns that may change the meaning of a question."""
+    memory = getattr(agent, "memory", None)
+    chat_memory = getattr(memory, "chat_memory", None)
+    if chat_memory and chat_memory.messages:
+        return True
+    # Turns folded into the running summary still shape the conversation
+    return bool(getattr(memory, "has_folded_turns", False))
+
+class AnswerCache:
+    """TTL/LRU cache of agent answers for context-free questions.
+
+    Keys combine the normalized question, the model, the namespace searched
+    and the corpus version at the time the answer was computed, so
+    ingestion invalidates every answer implicitly. With a similarity
+    threshold, a question whose embedding is close enough to a cached one
+    for the same model, namespace and corpus version is also a hit.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        similarity_threshold: Optional[float] = None,
+        embed: Optional[Callable[[str], List[float]]] = None
+    ):
+        self.similarity_threshold = similarity_threshold
+        self._embed = embed or (lambda text: get_vectorstore().embeddings.embed_query(text))
+        self._answers: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._vectors: Dict[AnswerKey, np.ndarray] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, question: str, model: Optional[str], namespace: Optional[str] = None) -> AnswerKey:
+        return AnswerKey(
+            normalize_question(question),
+            model or settings.DEFAULT_MODEL,
+            corpus_version(),
+            namespace or DEFAULT_NAMESPACE
+        )
+
+    async def lookup(self, key: AnswerKey) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """Return (cached answer or None, question embedding if one was computed)."""
+        answer = self._answers.get(key)
+        if answer is not None:
+            self.hits += 1
+            return answer, None
+
+        vector = None
+        if self.similarity_threshold is not None:
+            vector = await self._embed_normalized(key.question)
+            answer = self._similar(key, vector)
+
+        if answer is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return answer, vector
+
+    async def store(self, key: AnswerKey, answer: str, vector: Optional[np.ndarray] = None) -> None:
+        self._answers[key] = answer
+        if self.similarity_threshold is not None:
+            self._vectors[key] = vector if vector is not None else await self._embed_normalized(key.question)
+        self._prune_vectors()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": len(self._answers),
+            "maxsize": self._answers.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    async def _embed_normalized(self, text: str) -> np.ndarray:
+        vector = np.asarray(await asyncio.to_thread(self._embed, text), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _similar(self, key: AnswerKey, vector: np.ndarray) -> Optional[str]:
+        best_key, best_score = None, self.similarity_threshold
+        for candidate, candidate_vector in self._vectors.items():
+            if (candidate.model, candidate.namespace, candidate.corpus_version) != (
+                key.model, key.namespace, key.corpus_version
+            ):
+                continue
+            score = float(np.dot(vector, candidate_vector))
+            if score >= best_score:
+                best_key, best_score = candidate, score
+        return self._answers.get(best_key) if best_key is not None else None
+
+    def _prune_vectors(self) -> None:
+        # Drop embeddings whose answers expired or were evicted
+        self._answers.expire()
+        for stale in [k for k in self._vectors if k not in self._answers]:
+            del self._vectors[stale]
+
+answer_cache = AnswerCache(
+    maxsize=settings.ANSWER_CACHE_SIZE,
+    ttl=settings.ANSWER_CACHE_TTL,
+    similarity_threshold=settings.ANSWER_CACHE_SIMILARITY_THRESHOLD,
+)
@@ -0,0 +1,145 @@
+import math
+import os
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from langchain_core.documents import Document
+from app.core.metrics import context_tokens_removed
+from app.core.retrieval import tokenize
+
+# Overlaps shorter than this are treated as coincidence, not shared text
+MIN_OVERLAP = 20
+# Chunks whose start offsets are this close after one another are adjacent
+MAX_GAP = 3
+# Below this many tokens of budget left, the next passage is dropped rather than cut
+MIN_PASSAGE_TOKENS = 64
+
+@dataclass
+class Passage:
+    """A run of text from one page of one file, merged from one or more chunks."""
+    text: str
+    filename: str
+    page: Optional[int]
+    start: Optional[int]
+    rank: int  # best retrieval rank among the merged chunks
+
+def _overlap(first: str, second: str) -> int:
+    """Length of the longest suffix of first that is a prefix of second."""
+    probe = second[:MIN_OVERLAP]
+    if len(probe) < MIN_OVERLAP:
+        return 0
+    start = max(0, len(first) - len(second))
+    while (index := first.find(probe, start)) != -1:
+        if second.startswith(first[index:]):
+            return len(first) - index
+        start = index + 1
+    return 0
+
+def _merge(a: Passage, b: Passage) -> Optional[Passage]:
+    """a and b as one passage if one contains, overlaps or directly follows the other."""
+    rank = min(a.rank, b.rank)
+    start = min((s for s in (a.start, b.start) if s is not None), default=None)
+    if b.text in a.text:
+        return Passage(a.text, a.filename, a.page, start, rank)
+    if a.text in b.text:
+        return Passage(b.text, b.filename, b.page, start, rank)
+    for first, second in ((a, b), (b, a)):
+        overlap = _overlap(first.text, second.text)
+        if overlap:
+            return Passage(first.text + second.text[overlap:], a.filename, a.page, start, rank)
+        if first.start is not None and second.start is not None:
+            gap = second.start - (first.start + len(first.text))
+            if 0 <= gap <= MAX_GAP:
+                return Passage(first.text + " " + second.text, a.filename, a.page, start, rank)
+    return None
+
+def merge_chunks(docs: List[Document]) -> List[Passage]:
+    """Merge duplicate, overlapping and adjacent chunks of the same file and page, in rank order."""
+    groups: Dict[Tuple[Any, Any], List[Passage]] = {}
+    for rank, doc in enumerate(docs):
+        metadata = doc.metadata or {}
+        filename = metadata.get("filename") or os.path.basename(metadata.get("source", "")) or "document"
+        page = metadata.get("page")
+        passage = Passage(doc.page_content, filename, page, metadata.get("start_index"), rank)
+        group = groups.setdefault((metadata.get("document_id") or filename, page), [])
+        # Keep merging until the passage matches nothing else in its group
+        merged = True
+        while merged:
+            merged = False
+            for i, other in enumerate(group):
+                combined = _merge(other, passage)
+                if combined is not None:
+                    passage = combined
+                    del group[i]
+                    merged = True
+                    break
+        group.append(passage)
+    return sorted((p for group in groups.values() for p in group), key=lambda p: p.rank)
+
+def rerank(query: str, passages: List[Passage]) -> List[Passage]:
+    """Order passages by how well they cover the query's terms, retrieval rank breaking ties.
+
+    A cheap local scorer: each query term found adds 1 + log(term frequency).
+    """
+    terms = set(tokenize(query))
+    if not terms:
+        return passages
+
+    def score(passage: Passage) -> float:
+        counts = Counter(tokenize(passage.text))
+        return sum(1 + math.log(counts[term]) for term in terms if counts[term])
+
+    return sorted(passages, key=lambda p: (-score(p), p.rank))
+
+def source_tag(passage: Passage) -> str:
+    """Compact citation such as "[lecture-3.pdf p.4]" (pages are numbered from 1)."""
+    if isinstance(passage.page, int):
+        return f"[{passage.filename} p.{passage.page + 1}]"
+    return f"[{passage.filename}]"
+
+def _truncate(text: str, tokens: int, budget: int) -> str:
+    """Cut text at a word boundary to roughly budget tokens, given it currently has tokens."""
+    cut = text[:max(0, len(text) * budget // max(tokens, 1))]
+    if " " in cut:
+        cut = cut[:cut.rindex(" ")]
+    return cut + " …"
+
+def pack_context(
+    query: str, docs: List[Document], model: str, max_tokens: int, rerank_passages: bool = False
+) -> str:
+    """Assemble retrieved chunks into tagged passages that fit a token budget.
+
+    Overlapping and adjacent chunks of the same page are merged, passages are
+    optionally reranked, and they are added in order until max_tokens is
+    reached; the passage that crosses the budget is cut at a word boundary.
+    Records how many prompt tokens this saved over joining the raw chunks.
+    """
+    # The tokenizer lives with the conversation memory; import it on first use
+    from app.chains.memory import count_tokens
+
+    if not docs:
+        return ""
+    passages = merge_chunks(docs)
+    if rerank_passages:
+        passages = rerank(query, passages)
+
+    blocks: List[str] = []
+    remaining = max_tokens
+    for passage in passages:
+        block = f"{source_tag(passage)}\n{passage.text}"
+        tokens = count_tokens(block, model) + 1  # the blank line between blocks
+        if tokens > remaining:
+            if remaining >= MIN_PASSAGE_TOKENS or not blocks:
+                block = _truncate(block, tokens, remaining)
+                # The estimate is proportional; shrink until it really fits
+                while count_tokens(block, model) + 1 > remaining and len(block) > len(source_tag(passage)) + 3:
+                    block = _truncate(block[:-2], count_tokens(block, model) + 1, remaining)
+                blocks.append(block)
+            break
+        blocks.append(block)
+        remaining -= tokens
+
+    context = "\n\n".join(blocks)
+    raw_tokens = count_tokens("\n".join(doc.page_content for doc in docs), model)
+    context_tokens_removed.observe(max(0, raw_tokens - count_tokens(context, model)))
+    return context
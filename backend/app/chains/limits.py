@@ -0,0 +1,171 @@
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+from app.core.config import settings
+from app.core.llm import provider_for
+from app.core.metrics import Histogram, registry
+
+queue_wait = registry.register(Histogram(
+    "agent_queue_wait_seconds", "Time agent runs waited for a concurrency slot.", ["limiter"]
+))
+
+class Saturated(Exception):
+    """Raised when an agent run cannot get a slot.
+
+    status_code is 429 when the wait queue is already full and 503 when the
+    request waited for queue_timeout without getting a slot.
+    """
+
+    def __init__(self, limiter: str, status_code: int, retry_after: int):
+        super().__init__(f"Too many concurrent requests for {limiter}")
+        self.limiter = limiter
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+class ConcurrencyLimiter:
+    """Caps concurrent agent runs with a bounded FIFO queue of waiters."""
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, queue_timeout: float, window: int = 1000):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.admitted = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._waits: Deque[float] = deque(maxlen=window)
+        self._durations: Deque[float] = deque(maxlen=window)
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely to free up for a new request."""
+        average = sum(self._durations) / len(self._durations) if self._durations else 1.0
+        rounds = (self.waiting + 1) / max(self.max_concurrency, 1)
+        return max(1, math.ceil(average * rounds))
+
+    async def acquire(self) -> None:
+        start = time.monotonic()
+        if self.active < self.max_concurrency and not self._waiters:
+            self._admit(start)
+            return
+        if self.waiting >= self.max_queue:
+            self.rejected_full += 1
+            raise Saturated(self.name, 429, self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if not self._forget(waiter):
+                # The slot was handed over just as we gave up; pass it on
+                self.release()
+            self.rejected_timeout += 1
+            raise Saturated(self.name, 503, self.retry_after())
+        except BaseException:
+            if not self._forget(waiter):
+                self.release()
+            raise
+        self._record_wait(time.monotonic() - start)
+
+    def release(self, duration: Optional[float] = None) -> None:
+        if duration is not None:
+            self._durations.append(duration)
+        # Hand the slot straight to the oldest waiter so newcomers cannot jump the queue
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self.admitted += 1
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        await self.acquire()
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start)
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self._waits)
+        return {
+            "max_concurrency": self.max_concurrency,
+            "active": self.active,
+            "queue_depth": self.waiting,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_full,
+            "rejected_timeout": self.rejected_timeout,
+            "wait_ms_p50": round(waits[len(waits) // 2] * 1000, 1) if waits else 0.0,
+            "wait_ms_p95": round(waits[int(0.95 * (len(waits) - 1))] * 1000, 1) if waits else 0.0,
+            "wait_ms_max": round(waits[-1] * 1000, 1) if waits else 0.0,
+        }
+
+    def _admit(self, start: float) -> None:
+        self.active += 1
+        self.admitted += 1
+        self._record_wait(time.monotonic() - start)
+
+    def _record_wait(self, seconds: float) -> None:
+        self._waits.append(seconds)
+        queue_wait.observe(seconds, limiter=self.name)
+
+    def _forget(self, waiter: asyncio.Future) -> bool:
+        """Drop a waiter that gave up; False if it had already been given a slot."""
+        if waiter.done() and not waiter.cancelled():
+            return False
+        waiter.cancel()
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+        return True
+
+class AgentLimits:
+    """One limiter per model, or per provider when only the provider is configured.
+
+    AGENT_CONCURRENCY_LIMITS maps a model ("gpt-4") or provider ("openai",
+    "google") to its concurrency; anything else gets AGENT_CONCURRENCY.
+    """
+
+    def __init__(self, default: int, overrides: Dict[str, int], max_queue: int, queue_timeout: float):
+        self.default = default
+        self.overrides = overrides
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._limiters: Dict[str, ConcurrencyLimiter] = {}
+
+    def limiter(self, model: Optional[str] = None) -> ConcurrencyLimiter:
+        model = model or settings.DEFAULT_MODEL
+        provider = provider_for(model)
+        if model in self.overrides:
+            name, concurrency = model, self.overrides[model]
+        elif provider in self.overrides:
+            name, concurrency = provider, self.overrides[provider]
+        else:
+            name, concurrency = model, self.default
+        limiter = self._limiters.get(name)
+        if limiter is None:
+            limiter = self._limiters[name] = ConcurrencyLimiter(name, concurrency, self.max_queue, self.queue_timeout)
+        return limiter
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: limiter.stats() for name, limiter in self._limiters.items()}
+
+agent_limits = AgentLimits(
+    default=settings.AGENT_CONCURRENCY,
+    overrides=settings.AGENT_CONCURRENCY_LIMITS,
+    max_queue=settings.AGENT_QUEUE_SIZE,
+    queue_timeout=settings.AGENT_QUEUE_TIMEOUT,
+)
@@ -0,0 +1,184 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Dict, List
+import tiktoken
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain.memory.prompt import SUMMARY_PROMPT
+from langchain_core.messages import BaseMessage, SystemMessage, get_buffer_string
+from pydantic import PrivateAttr
+
+logger = logging.getLogger(__name__)
+
+# Summaries are produced off the request path on a small shared pool
+_summarizer = ThreadPoolExecutor(max_workers=2, thread_name_prefix="memory-summary")
+
+# The latest turn (question and answer) is replayed verbatim even when it alone exceeds the budget
+MIN_VERBATIM_MESSAGES = 2
+
+# Failed summarization calls are retried with exponential backoff before the
+# turns are left for the next request to pick up again
+SUMMARY_ATTEMPTS = 3
+SUMMARY_RETRY_DELAY = 1.0  # seconds, doubled on each retry
+
+# Aggregate prompt-token savings across all sessions
+memory_stats = {"requests": 0, "tokens_saved": 0}
+_stats_lock = threading.Lock()
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # tiktoken downloads its BPE files on first use; without network access
+        # fall back to the usual ~4 characters per token estimate
+        logger.warning(f"tiktoken encoding unavailable, estimating tokens: {str(e)}")
+        return None
+
+def count_tokens(text: str, model: str) -> int:
+    encoding = _encoding(model)
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text))
+
+def count_message_tokens(messages: List[BaseMessage], model: str) -> int:
+    """Approximate chat prompt tokens: content plus per-message framing."""
+    return sum(count_tokens(str(message.content), model) + 4 for message in messages)
+
+class TokenBudgetMemory(BaseChatMemory):
+    """Conversation memory that keeps recent turns within a token budget.
+
+    The newest messages that fit in max_token_limit are replayed verbatim,
+    and always at least the latest turn.
+    Older ones are removed from the buffer and folded into a running summary
+    by a background worker, so the request that overflows the budget does not
+    wait for the summarization call. Until their summary lands, the newest of
+    those turns that fit in max_token_limit stay in the prompt verbatim.
+    """
+
+    llm: Any
+    model_name: str = "gpt-3.5-turbo"
+    max_token_limit: int = 2000
+    memory_key: str = "chat_history"
+    summary: str = ""
+    tokens_saved_last: int = 0
+    tokens_saved_total: int = 0
+
+    _pending: List[BaseMessage] = PrivateAttr(default_factory=list)
+    _summarizing: bool = PrivateAttr(default=False)
+    _summarized_tokens: int = PrivateAttr(default=0)
+    _generation: int = PrivateAttr(default=0)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def memory_variables(self) -> List[str]:
+        return [self.memory_key]
+
+    @property
+    def has_folded_turns(self) -> bool:
+        """Whether older turns were folded out of the buffer, summarized or still waiting to be."""
+        with self._lock:
+            return bool(self.summary or self._pending or self._summarizing)
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        self._fold_overflow()
+
+        with self._lock:
+            summary = self.summary
+            unsummarized = self._newest_within_budget(self._pending)
+        messages = unsummarized + list(self.chat_memory.messages)
+        if summary:
+            messages = [SystemMessage(content=f"Summary of the earlier conversation: {summary}")] + messages
+
+        # Savings compare against replaying every message of the session verbatim
+        used = count_message_tokens(messages, self.model_name)
+        full = count_message_tokens(self.chat_memory.messages, self.model_name) + self._summarized_tokens
+        self.tokens_saved_last = max(full - used, 0)
+        self.tokens_saved_total += self.tokens_saved_last
+        with _stats_lock:
+            memory_stats["requests"] += 1
+            memory_stats["tokens_saved"] += self.tokens_saved_last
+
+        if self.return_messages:
+            return {self.memory_key: messages}
+        return {self.memory_key: get_buffer_string(messages)}
+
+    def clear(self) -> None:
+        super().clear()
+        with self._lock:
+            self.summary = ""
+            self._pending.clear()
+            self._summarized_tokens = 0
+            # A summary still in flight belongs to the cleared conversation
+            self._generation += 1
+
+    def _newest_within_budget(self, messages: List[BaseMessage]) -> List[BaseMessage]:
+        keep = len(messages)
+        tokens = 0
+        while keep > 0:
+            tokens += count_message_tokens([messages[keep - 1]], self.model_name)
+            if tokens > self.max_token_limit:
+                break
+            keep -= 1
+        return messages[keep:]
+
+    def _fold_overflow(self) -> None:
+        """Move the oldest messages past the budget into the summary queue."""
+        messages = list(self.chat_memory.messages)
+        keep = len(messages)
+        tokens = 0
+        while keep > 0:
+            cost = count_message_tokens([messages[keep - 1]], self.model_name)
+            if tokens + cost > self.max_token_limit and len(messages) - keep >= MIN_VERBATIM_MESSAGES:
+                break
+            tokens += cost
+            keep -= 1
+        overflow = messages[:keep]
+        if overflow:
+            self.chat_memory.clear()
+            self.chat_memory.add_messages(messages[keep:])
+        with self._lock:
+            self._pending.extend(overflow)
+            self._summarized_tokens += count_message_tokens(overflow, self.model_name)
+            # Also picks up turns left over from a summarization that gave up
+            if self._summarizing or not self._pending:
+                return
+            self._summarizing = True
+        _summarizer.submit(self._summarize_pending)
+
+    def _summarize_pending(self) -> None:
+        attempt = 0
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._summarizing = False
+                    return
+                # The batch stays in _pending, and so in the prompt, until its summary lands
+                batch = list(self._pending)
+                summary = self.summary
+                generation = self._generation
+            try:
+                prompt = SUMMARY_PROMPT.format(summary=summary, new_lines=get_buffer_string(batch))
+                new_summary = self.llm.invoke(prompt).content
+            except Exception as e:
+                attempt += 1
+                if attempt < SUMMARY_ATTEMPTS:
+                    logger.warning(f"Conversation summarization failed, retrying (attempt {attempt}): {str(e)}")
+                    time.sleep(SUMMARY_RETRY_DELAY * 2 ** (attempt - 1))
+                    continue
+                logger.warning(f"Conversation summarization failed after {attempt} attempts: {str(e)}")
+                # The next request resubmits the turns still pending
+                with self._lock:
+                    self._summarizing = False
+                return
+            attempt = 0
+            with self._lock:
+                if generation != self._generation:
+                    continue
+                self.summary = new_summary
+                self._pending = self._pending[len(batch):]
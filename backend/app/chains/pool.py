@@ -0,0 +1,163 @@
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.chains.agent import create_agent
+from app.core.config import settings
+from app.db.chats import chat_writer
+from app.db.models import Chat
+
+@dataclass
+class _PoolEntry:
+    agent: Any
+    last_used: float = field(default_factory=time.monotonic)
+    memory_bytes: int = 0
+
+def _history_bytes(agent: Any) -> int:
+    """Approximate size of the conversation memory held by an agent."""
+    memory = getattr(agent, "memory", None)
+    chat_memory = getattr(memory, "chat_memory", None)
+    if chat_memory is None:
+        return 0
+    return sum(len(str(message.content)) for message in chat_memory.messages)
+
+async def _load_history(db: AsyncSession, session_id: str, limit: int) -> list:
+    """Load the most recent messages of a session, oldest first."""
+    query = (
+        select(Chat)
+        .where(Chat.session_id == session_id)
+        .order_by(Chat.timestamp.desc(), Chat.id.desc())
+        .limit(limit)
+    )
+    result = await db.execute(query)
+    return list(reversed(result.scalars().all()))
+
+class AgentPool:
+    """Bounded pool of per-session agents with LRU and idle-TTL eviction.
+
+    Agents that are evicted (or lost on restart) are rebuilt on their next use,
+    with their memory rehydrated from the session's rows in the chats table.
+    """
+
+    def __init__(self, max_size: int, idle_ttl: float, max_memory_bytes: int, history_limit: int):
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self.max_memory_bytes = max_memory_bytes
+        self.history_limit = history_limit
+        self._entries: "OrderedDict[Tuple[str, str], _PoolEntry]" = OrderedDict()
+        self._locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def key(session_id: str, model: Optional[str] = None) -> Tuple[str, str]:
+        return session_id, model or "default"
+
+    async def get(
+        self, db: AsyncSession, session_id: str, model: Optional[str] = None, namespace: Optional[str] = None
+    ) -> Any:
+        """Return the agent for a session, creating and rehydrating it if needed.
+
+        A session keeps its namespace, so the namespace is only used when
+        the agent is built.
+        """
+        key = self.key(session_id, model)
+        self._evict_idle()
+
+        entry = self._touch(key)
+        if entry is not None:
+            return entry.agent
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            # Another request may have built it while we waited
+            entry = self._touch(key)
+            if entry is not None:
+                return entry.agent
+
+            self.misses += 1
+            agent = create_agent(session_id, model, namespace=namespace)
+            await self._rehydrate(db, agent, session_id)
+
+            self._entries[key] = _PoolEntry(agent=agent, memory_bytes=_history_bytes(agent))
+            self._evict_overflow()
+        if not lock.locked():
+            self._locks.pop(key, None)
+        return agent
+
+    def evict(self, key: Tuple[str, str]) -> None:
+        if self._entries.pop(key, None) is not None:
+            self.evictions += 1
+
+    def evict_session(self, session_id: str) -> None:
+        """Drop every pooled agent belonging to a session, whatever its model."""
+        for key in [k for k in self._entries if k[0] == session_id]:
+            self.evict(key)
+
+    def stats(self) -> Dict[str, Any]:
+        for entry in self._entries.values():
+            entry.memory_bytes = _history_bytes(entry.agent)
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "memory_bytes": self._memory_bytes(),
+            "max_memory_bytes": self.max_memory_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _touch(self, key: Tuple[str, str]) -> Optional[_PoolEntry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self.hits += 1
+        entry.last_used = time.monotonic()
+        # Account for whatever the previous turn added to this agent's memory
+        entry.memory_bytes = _history_bytes(entry.agent)
+        self._entries.move_to_end(key)
+        return entry
+
+    def _memory_bytes(self) -> int:
+        return sum(entry.memory_bytes for entry in self._entries.values())
+
+    def _evict_idle(self) -> None:
+        cutoff = time.monotonic() - self.idle_ttl
+        # Entries are kept in LRU order, so idle ones are at the front
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry.last_used >= cutoff:
+                break
+            self.evict(key)
+
+    def _evict_overflow(self) -> None:
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_size or self._memory_bytes() > self.max_memory_bytes
+        ):
+            self.evict(next(iter(self._entries)))
+
+    async def _rehydrate(self, db: AsyncSession, agent: Any, session_id: str) -> None:
+        memory = getattr(agent, "memory", None)
+        if memory is None or self.history_limit <= 0:
+            return
+        # Turns still queued in the write-behind writer belong in the history too
+        await chat_writer.flush()
+        for chat in await _load_history(db, session_id, self.history_limit):
+            if chat.is_user:
+                memory.chat_memory.add_user_message(chat.message)
+            else:
+                memory.chat_memory.add_ai_message(chat.message)
+
+agent_pool = AgentPool(
+    max_size=settings.AGENT_POOL_SIZE,
+    idle_ttl=settings.AGENT_IDLE_TTL,
+    max_memory_bytes=settings.AGENT_POOL_MAX_MEMORY_BYTES,
+    history_limit=settings.AGENT_HISTORY_LIMIT,
+)
@@ -0,0 +1,156 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Callable, Dict, Hashable, List, Optional, Set
+
+class SingleFlight:
+    """Run a blocking call once for every caller that asks for the same key at the same time.
+
+    Thread-safe: the first caller runs fn, callers arriving while it runs
+    block and receive the same result (or exception).
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            self.calls += 1
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+            else:
+                self.shared += 1
+        if not leader:
+            return future.result()
+
+        try:
+            future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return future.result()
+
+    def stats(self) -> Dict[str, int]:
+        return {"calls": self.calls, "shared": self.shared, "in_flight": len(self._calls)}
+
+class _Flight:
+    def __init__(self):
+        self.events: List[Any] = []
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.task: Optional[asyncio.Task] = None
+        self.error: Optional[BaseException] = None
+        self.finished = False
+
+class _Subscription:
+    """One caller's view of a flight: the events so far, then the rest live.
+
+    Closing it unsubscribes even if it was never iterated, and cancels the
+    flight once nobody is left to read it.
+    """
+
+    def __init__(self, flight: _Flight, queue: asyncio.Queue):
+        self._flight = flight
+        self._queue = queue
+        self._closed = False
+
+    @property
+    def run_continues(self) -> bool:
+        """Whether the shared run is still going for other subscribers."""
+        task = self._flight.task
+        return task is not None and not task.done() and bool(self._flight.subscribers)
+
+    def __aiter__(self) -> "_Subscription":
+        return self
+
+    async def __anext__(self) -> Any:
+        if self._closed:
+            raise StopAsyncIteration
+        try:
+            event = await self._queue.get()
+        except BaseException:
+            await self.aclose()
+            raise
+        if event is StreamFlight._END:
+            await self.aclose()
+            if self._flight.error is not None:
+                raise self._flight.error
+            raise StopAsyncIteration
+        return event
+
+    async def aclose(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        flight = self._flight
+        flight.subscribers.discard(self._queue)
+        if not flight.subscribers and flight.task is not None and not flight.task.done():
+            flight.task.cancel()
+
+class StreamFlight:
+    """Fan one async event stream out to every caller that asks for the same key.
+
+    The first caller's source is pumped by a background task; callers that
+    join while it runs get the events produced so far and then the rest
+    live. The source is cancelled once every subscriber has gone away.
+    """
+
+    _END = object()
+
+    def __init__(self):
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.started = 0
+        self.joined = 0
+
+    def join(self, key: Hashable) -> Optional[_Subscription]:
+        """Subscribe to a stream already in flight for key, or None if there is none."""
+        flight = self._flights.get(key)
+        if flight is None:
+            return None
+        self.joined += 1
+        return self._subscribe(flight)
+
+    def lead(self, key: Hashable, source: AsyncIterator[Any]) -> _Subscription:
+        """Start pumping source for key and subscribe to it."""
+        flight = self._flights[key] = _Flight()
+        self.started += 1
+        subscription = self._subscribe(flight)
+        flight.task = asyncio.create_task(self._pump(key, flight, source))
+        return subscription
+
+    def stats(self) -> Dict[str, int]:
+        return {"started": self.started, "joined": self.joined, "in_flight": len(self._flights)}
+
+    def _subscribe(self, flight: _Flight) -> "_Subscription":
+        queue: asyncio.Queue = asyncio.Queue()
+        for event in flight.events:
+            queue.put_nowait(event)
+        if flight.finished:
+            queue.put_nowait(self._END)
+        flight.subscribers.add(queue)
+        return _Subscription(flight, queue)
+
+    async def _pump(self, key: Hashable, flight: _Flight, source: AsyncIterator[Any]) -> None:
+        try:
+            async with aclosing(source):
+                async for event in source:
+                    flight.events.append(event)
+                    for queue in flight.subscribers:
+                        queue.put_nowait(event)
+        except asyncio.CancelledError:
+            flight.error = asyncio.CancelledError()
+        except Exception as e:
+            flight.error = e
+        finally:
+            flight.finished = True
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            for queue in flight.subscribers:
+                queue.put_nowait(self._END)
@@ -1,4 +1,5 @@
 from pydantic_settings import BaseSettings
+from typing import Dict, List, Optional
 import os
 from dotenv import load_dotenv
 
@@ -9,8 +10,70 @@ class Settings(BaseSettings):
     GOOGLE_API_KEY: str = os.getenv("GOOGLE_API_KEY", "your-google-key-here")
     VECTORSTORE_DIR: str = "./data/vectorstore"
     UPLOAD_DIR: str = "./uploads"
+    MAX_UPLOAD_SIZE: int = 256 * 1024 * 1024  # bytes
     DATABASE_URL: str = "sqlite:///./app.db"
+    DATABASE_ECHO: bool = False
+    DATABASE_POOL_SIZE: int = 5
+    DATABASE_MAX_OVERFLOW: int = 10
+    CHAT_FLUSH_INTERVAL: float = 0.05  # seconds a write may wait to join a batch
+    CHAT_FLUSH_BATCH: int = 200
     DEFAULT_MODEL: str = "gpt-3.5-turbo"
-    EMBEDDING_MODEL: str = "text-embedding-ada-002"
+    LLM_BACKEND: str = "openai"  # "fake" answers offline, for benchmarks and load tests
+    LLM_FALLBACK_MODELS: List[str] = []  # tried in order of latency when the requested model fails
+    LLM_HEDGE_DELAY: Optional[float] = None  # seconds without a first token before racing the next fallback
+    LLM_TIMEOUT: float = 60.0  # seconds
+    LLM_MAX_CONNECTIONS: int = 100
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    LLM_KEEPALIVE_EXPIRY: float = 30.0  # seconds an idle connection is kept open
+    FAKE_LLM_LATENCY: float = 0.2  # seconds before the first token
+    FAKE_LLM_TOKENS_PER_SECOND: float = 50.0
+    FAKE_LLM_ANSWER_TOKENS: int = 60
+    EMBEDDING_MODEL: str = "text-embedding-ada-002"  # for the onnx backend, a directory with model.onnx and tokenizer.json
+    EMBEDDING_BACKEND: str = "openai"  # "onnx" embeds locally on CPU; "fake" uses deterministic hash vectors
+    EMBEDDING_THREADS: int = 0  # onnxruntime intra-op threads (0: one per core)
+    EMBEDDING_MAX_BATCH: int = 32  # texts per local inference batch
+    EMBEDDING_BATCH_WAIT: float = 0.005  # seconds to wait for concurrent requests to join a batch
+    EMBEDDING_MAX_LENGTH: int = 256  # tokens per text
+    EMBEDDING_NORMALIZE: bool = True
+    FAKE_EMBEDDING_SIZE: int = 256
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_DIR: str = "./data/embedding_cache"
+    EMBEDDING_CACHE_SIZE_LIMIT: int = 1024 * 1024 * 1024  # bytes
+    HNSW_M: int = 16  # graph links per vector; takes effect for new or rebuilt collections
+    HNSW_CONSTRUCTION_EF: int = 100  # candidate list while inserting; takes effect for new or rebuilt collections
+    HNSW_SEARCH_EF: int = 64  # candidate list while querying (Chroma's default is 10); applied by `manage.py index compact`
+    RETRIEVAL_K: int = 4
+    RETRIEVAL_FETCH_K: int = 20  # candidates taken from each retriever before fusion
+    RETRIEVAL_MMR: bool = False
+    RETRIEVAL_HYBRID: bool = True
+    CONTEXT_MAX_TOKENS: int = 1500  # document text returned to the agent per search
+    CONTEXT_RERANK: bool = False  # reorder passages by query term coverage before packing
+    RETRIEVAL_CACHE_ENABLED: bool = True  # reuse query embeddings and results until the corpus changes
+    RETRIEVAL_CACHE_MAX_BYTES: int = 64 * 1024 * 1024  # approximate
+    MEMORY_MAX_TOKENS: int = 2000  # recent history replayed verbatim; older turns are summarized
+    AGENT_POOL_SIZE: int = 100
+    AGENT_IDLE_TTL: int = 1800  # seconds
+    AGENT_POOL_MAX_MEMORY_BYTES: int = 50_000_000
+    AGENT_HISTORY_LIMIT: int = 50  # messages replayed into a rebuilt agent
+    AGENT_VERBOSE: bool = False  # log every agent step to stdout
+    AGENT_CONCURRENCY: int = 8  # concurrent agent runs per model
+    AGENT_CONCURRENCY_LIMITS: Dict[str, int] = {}  # per model or provider, e.g. {"gpt-4": 2, "google": 4}
+    AGENT_QUEUE_SIZE: int = 32  # requests that may wait for a slot before getting 429
+    AGENT_QUEUE_TIMEOUT: float = 15.0  # seconds a request may wait before getting 503
+    WS_MAX_RUNS: int = 8  # answers streaming at once on one /chat/ws connection
+    WS_SEND_QUEUE_SIZE: int = 256  # frames buffered for a slow /chat/ws client before its runs wait
+    ANSWER_CACHE_ENABLED: bool = False
+    ANSWER_CACHE_SIZE: int = 1000
+    ANSWER_CACHE_TTL: int = 3600  # seconds
+    ANSWER_CACHE_SIMILARITY_THRESHOLD: Optional[float] = None  # e.g. 0.95 to match paraphrases
+    COALESCE_REQUESTS: bool = True  # share identical in-flight answers and retrievals
+    OTEL_ENABLED: bool = False  # export traces over OTLP (configure with OTEL_EXPORTER_OTLP_* variables)
+    OTEL_SERVICE_NAME: str = "ai-chat-backend"
+    WARMUP_STEPS: List[str] = ["hnsw", "llm", "agent", "parser"]  # run at startup; [] starts fastest
+    INGESTION_WORKERS: int = 2
+    INGESTION_PARSE_PROCESSES: int = 2
+    INGESTION_PAGES_PER_TASK: int = 20  # PDFs longer than this are parsed in parallel page ranges (0: whole files)
+    MAX_BATCH_FILES: int = 500  # files accepted by one /files/upload-batch request
+    EMBEDDING_BATCH_SIZE: int = 64
 
 settings = Settings()
\ No newline at end of file
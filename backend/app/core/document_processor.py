@@ -1,12 +1,16 @@
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import TextLoader
-from langchain_community.document_loaders.pdf import PyPDFLoader
+from langchain_core.documents import Document
+import hashlib
 import os
-from typing import List
-from app.core.vectorstore import get_vectorstore
+from typing import Dict, List, Optional, Set, Tuple
+from app.core.retrieval import lexical_indexes
+from app.core.vectorstore import bump_corpus_version, get_vectorstore
+
+def load_document(file_path: str) -> List[Document]:
+    """Load a document with the loader matching its file type."""
+    # Loaders are imported here, in the parsing processes, rather than by the app
+    from langchain_community.document_loaders import TextLoader
+    from langchain_community.document_loaders.pdf import PyPDFLoader
 
-def process_document(file_path: str) -> None:
-    """Process a document and add it to the vector store."""
     # Determine file type and use appropriate loader
     if file_path.endswith('.txt'):
         loader = TextLoader(file_path)
@@ -14,18 +18,128 @@ def process_document(file_path: str) -> None:
         loader = PyPDFLoader(file_path)
     else:
         raise ValueError(f"Unsupported file type for {file_path}")
-    
-    # Load the document
-    documents = loader.load()
-    
-    # Split the documents into chunks
+
+    return loader.load()
+
+def preload_loaders() -> None:
+    """Import the document loaders and splitter, e.g. in a new parsing process."""
+    from langchain_community.document_loaders import TextLoader, PyPDFLoader  # noqa: F401
+    from langchain_text_splitters import RecursiveCharacterTextSplitter  # noqa: F401
+
+def load_pdf_pages(file_path: str, start: int, stop: int) -> List[Document]:
+    """Load pages [start, stop) of a PDF, one document per page as PyPDFLoader does."""
+    import pypdf
+
+    reader = pypdf.PdfReader(file_path)
+    total = len(reader.pages)
+    return [
+        Document(
+            page_content=reader.pages[n].extract_text().strip(),
+            metadata={"source": file_path, "total_pages": total, "page": n, "page_label": reader.page_labels[n]}
+        )
+        for n in range(start, min(stop, total))
+    ]
+
+def page_ranges(file_path: str, pages_per_task: int) -> List[Optional[Tuple[int, int]]]:
+    """Page ranges to parse a document in, each in its own task.
+
+    Only PDFs longer than pages_per_task are split; [None] means parse the
+    whole document at once. Pages are split independently, so the chunks are
+    the same either way.
+    """
+    if not file_path.endswith('.pdf') or pages_per_task <= 0:
+        return [None]
+    import pypdf
+
+    total = len(pypdf.PdfReader(file_path).pages)
+    if total <= pages_per_task:
+        return [None]
+    return [(start, min(start + pages_per_task, total)) for start in range(0, total, pages_per_task)]
+
+def split_documents(documents: List[Document]) -> List[Document]:
+    """Split loaded documents into chunks for embedding."""
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=1000,
-        chunk_overlap=200
+        chunk_overlap=200,
+        # Lets context packing join neighbouring chunks of a page
+        add_start_index=True
     )
-    splits = text_splitter.split_documents(documents)
-    
-    # Add to vector store
-    vectorstore = get_vectorstore()
-    vectorstore.add_documents(splits)
-    vectorstore.persist()
\ No newline at end of file
+    return text_splitter.split_documents(documents)
+
+def parse_document(file_path: str, pages: Optional[Tuple[int, int]] = None) -> Tuple[int, List[Document]]:
+    """Load and split a document, or a range of its pages, returning (pages parsed, chunks).
+
+    Pure CPU work with no shared state, so it can run in a process pool.
+    """
+    documents = load_document(file_path) if pages is None else load_pdf_pages(file_path, *pages)
+    return len(documents), split_documents(documents)
+
+def assign_chunk_ids(document_id: str, splits: List[Document]) -> Dict[str, Document]:
+    """Tag chunks with their document id and key them by a stable chunk id.
+
+    A chunk id is derived from the document id, page and chunk text, so an
+    unchanged chunk keeps its id across re-uploads. Identical chunks within
+    one document collapse into one.
+    """
+    chunks: Dict[str, Document] = {}
+    for split in splits:
+        page = split.metadata.get("page", "")
+        digest = hashlib.sha256(f"{page}\0{split.page_content}".encode("utf-8")).hexdigest()
+        split.metadata["document_id"] = document_id
+        split.metadata["filename"] = os.path.basename(split.metadata.get("source", ""))
+        chunks.setdefault(f"{document_id}:{digest}", split)
+    return chunks
+
+def existing_chunk_ids(namespace: Optional[str], document_id: str) -> Set[str]:
+    """Ids of the chunks currently indexed for a document."""
+    return set(get_vectorstore(namespace).get(where={"document_id": document_id}, include=[])["ids"])
+
+def add_chunks(namespace: Optional[str], ids: List[str], chunks: List[Document]) -> None:
+    """Embed and store chunks, keeping the lexical index in sync."""
+    get_vectorstore(namespace).add_documents(chunks, ids=ids)
+    lexical_indexes.get(namespace).add(ids, chunks)
+
+def delete_chunks(namespace: Optional[str], ids: List[str]) -> None:
+    """Remove chunks from the vector store and the lexical index."""
+    get_vectorstore(namespace).delete(ids=ids)
+    lexical_indexes.get(namespace).remove(ids)
+
+def delete_document_vectors(namespace: Optional[str], document_id: str) -> int:
+    """Remove every indexed chunk of a document, returning how many were removed."""
+    ids = list(existing_chunk_ids(namespace, document_id))
+    if ids:
+        delete_chunks(namespace, ids)
+    return len(ids)
+
+def diff_chunks(namespace: Optional[str], document_id: str, chunks: Dict[str, Document]) -> Tuple[Dict[str, Document], List[str]]:
+    """Split a document's new chunk set into (chunks to add, stale ids to delete)."""
+    existing = existing_chunk_ids(namespace, document_id)
+    to_add = {chunk_id: doc for chunk_id, doc in chunks.items() if chunk_id not in existing}
+    to_delete = [chunk_id for chunk_id in existing if chunk_id not in chunks]
+    return to_add, to_delete
+
+def process_document(file_path: str, document_id: Optional[str] = None, namespace: Optional[str] = None) -> None:
+    """Process a document and add it to a namespace's vector store.
+
+    With a document id, only chunks that changed since the last indexing of
+    that document are embedded, and chunks that disappeared are removed.
+    """
+    _, splits = parse_document(file_path)
+
+    if document_id is None:
+        # Add to vector store
+        if splits:
+            ids = get_vectorstore(namespace).add_documents(splits)
+            lexical_indexes.get(namespace).add(ids, splits)
+            bump_corpus_version()
+        return
+
+    to_add, to_delete = diff_chunks(namespace, document_id, assign_chunk_ids(document_id, splits))
+    if to_delete:
+        delete_chunks(namespace, to_delete)
+    if to_add:
+        add_chunks(namespace, list(to_add), list(to_add.values()))
+    if to_add or to_delete:
+        bump_corpus_version()
@@ -0,0 +1,215 @@
+import hashlib
+import os
+import queue
+import threading
+import time
+from array import array
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+import diskcache
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper with a persistent, content-addressed cache.
+
+    Document vectors are stored on disk under sha256(model, text), so a chunk
+    that has been embedded once is never sent to the embeddings API again,
+    whichever file it came from. Query embeddings are passed through.
+    """
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        directory: str,
+        model: str,
+        size_limit: int = 2 ** 30,
+        cache: Optional[diskcache.Cache] = None
+    ):
+        self.underlying = underlying
+        self.model = model
+        # Least-recently-used entries are culled once size_limit bytes is reached
+        self.cache = cache or diskcache.Cache(
+            directory,
+            size_limit=size_limit,
+            eviction_policy="least-recently-used"
+        )
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model}\0{text}".encode("utf-8")).hexdigest()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self.key(text) for text in texts]
+        vectors: Dict[str, List[float]] = {}
+
+        # One transaction for the whole batch instead of one per chunk
+        with self.cache.transact():
+            for key in set(keys):
+                cached = self.cache.get(key)
+                if cached is not None:
+                    vectors[key] = array("f", cached).tolist()
+
+        # Embed each distinct unseen text once, even if it repeats in the batch
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                missing.setdefault(key, text)
+
+        if missing:
+            embedded = self.underlying.embed_documents(list(missing.values()))
+            with self.cache.transact():
+                for key, vector in zip(missing, embedded):
+                    vectors[key] = vector
+                    self.cache.set(key, array("f", vector).tobytes())
+
+        with self._stats_lock:
+            self.misses += len(missing)
+            self.hits += len(texts) - len(missing)
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.underlying.embed_query(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.underlying.aembed_query(text)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self.cache),
+            "size_bytes": self.cache.volume(),
+        }
+
+    def close(self) -> None:
+        self.cache.close()
+        if hasattr(self.underlying, "close"):
+            self.underlying.close()
+
+class OnnxEmbeddings(Embeddings):
+    """Local CPU embeddings from an ONNX sentence-transformer model.
+
+    model_path is a directory holding model.onnx and the matching
+    tokenizer.json (e.g. an all-MiniLM-L6-v2 export). Token embeddings are
+    mean-pooled over the attention mask and L2-normalized.
+
+    Calls from concurrent threads are batched dynamically: a single
+    inference thread takes whatever texts are queued, waiting up to
+    max_wait seconds for up to max_batch of them, and runs them as one
+    batch, so many concurrent retrievals share one model invocation.
+    """
+
+    def __init__(
+        self,
+        model_path: str,
+        threads: int = 0,
+        max_batch: int = 32,
+        max_wait: float = 0.005,
+        max_length: int = 256,
+        normalize: bool = True
+    ):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        options = onnxruntime.SessionOptions()
+        # 0 lets onnxruntime pick one thread per physical core
+        options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_path, "model.onnx"),
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {item.name for item in self.session.get_inputs()}
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_path, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.normalize = normalize
+        self.batches = 0
+        self._requests: "queue.Queue[Optional[Tuple[List[str], Future]]]" = queue.Queue()
+        # Guards closing, so nothing is queued behind the worker's stop marker
+        self._closed = False
+        self._close_lock = threading.Lock()
+        self._worker = threading.Thread(target=self._run, name="onnx-embeddings", daemon=True)
+        self._worker.start()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return self._submit(list(texts)).result()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def close(self) -> None:
+        with self._close_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._requests.put(None)
+        self._worker.join(timeout=5)
+
+    def _submit(self, texts: List[str]) -> Future:
+        future: Future = Future()
+        with self._close_lock:
+            if self._closed:
+                # The inference thread is gone; nothing would ever answer
+                raise RuntimeError("ONNX embeddings are closed")
+            self._requests.put((texts, future))
+        return future
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            inputs["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+        output = self.session.run(None, {name: value for name, value in inputs.items() if name in self.input_names})[0]
+
+        if output.ndim == 3:
+            # Token embeddings: mean over the real (unpadded) tokens
+            mask = attention_mask[..., None].astype(output.dtype)
+            output = (output * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.normalize:
+            output = output / np.clip(np.linalg.norm(output, axis=1, keepdims=True), 1e-12, None)
+        return output.astype(np.float32)
+
+    def _run(self) -> None:
+        while True:
+            item = self._requests.get()
+            if item is None:
+                return
+            pending = [item]
+            size = len(item[0])
+            deadline = time.monotonic() + self.max_wait
+            # Gather concurrent requests into one batch
+            while size < self.max_batch:
+                try:
+                    item = self._requests.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._requests.put(None)
+                    break
+                pending.append(item)
+                size += len(item[0])
+
+            texts = [text for request_texts, _ in pending for text in request_texts]
+            try:
+                vectors = np.concatenate([
+                    self._encode(texts[i:i + self.max_batch]) for i in range(0, len(texts), self.max_batch)
+                ])
+            except Exception as e:
+                for _, future in pending:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            offset = 0
+            for request_texts, future in pending:
+                future.set_result(vectors[offset:offset + len(request_texts)].tolist())
+                offset += len(request_texts)
@@ -0,0 +1,117 @@
+import asyncio
+import hashlib
+import json
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+class FakeChatModel(BaseChatModel):
+    """Offline chat model with a configurable first-token latency and token rate.
+
+    It plays the agent's function-calling protocol well enough to exercise
+    the whole pipeline. When a human question is asked with functions bound,
+    it calls the first function with that question as the query. Otherwise
+    it streams an answer of answer_tokens words taken from the last message.
+    The output depends only on the input, so runs are reproducible.
+    """
+
+    model_name: str = "fake-chat"
+    latency: float = 0.2  # seconds before the first token
+    tokens_per_second: float = 50.0
+    answer_tokens: int = 60
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _function_call(self, messages: List[BaseMessage], functions: Optional[List[Dict[str, Any]]]) -> Optional[Dict[str, str]]:
+        if not functions or not isinstance(messages[-1], HumanMessage):
+            return None
+        return {"name": functions[0]["name"], "arguments": json.dumps({"query": str(messages[-1].content)})}
+
+    def _answer(self, messages: List[BaseMessage]) -> List[str]:
+        words = str(messages[-1].content).split() or ["ok"]
+        # Rotate by a content hash so different inputs give different answers
+        offset = int(hashlib.sha256(" ".join(words).encode("utf-8")).hexdigest(), 16) % len(words)
+        return [("" if i == 0 else " ") + words[(offset + i) % len(words)] for i in range(self.answer_tokens)]
+
+    def _usage(self, messages: List[BaseMessage], output_tokens: int) -> Dict[str, int]:
+        input_tokens = sum(len(str(message.content)) // 4 + 4 for message in messages)
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+    def _chunks(self, messages: List[BaseMessage], functions) -> List[AIMessageChunk]:
+        call = self._function_call(messages, functions)
+        if call is not None:
+            return [AIMessageChunk(
+                content="",
+                additional_kwargs={"function_call": call},
+                usage_metadata=self._usage(messages, len(call["arguments"]) // 4 + 1)
+            )]
+        tokens = self._answer(messages)
+        chunks = [AIMessageChunk(content=token) for token in tokens]
+        chunks[-1].usage_metadata = self._usage(messages, len(tokens))
+        return chunks
+
+    def _result(self, chunks: List[AIMessageChunk]) -> ChatResult:
+        merged = chunks[0]
+        for chunk in chunks[1:]:
+            merged = merged + chunk
+        message = AIMessage(
+            content=merged.content,
+            additional_kwargs=merged.additional_kwargs,
+            usage_metadata=merged.usage_metadata
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.latency)
+        for i, chunk in enumerate(self._chunks(messages, kwargs.get("functions"))):
+            if i:
+                time.sleep(1 / self.tokens_per_second)
+            if run_manager and chunk.content:
+                run_manager.on_llm_new_token(chunk.content)
+            yield ChatGenerationChunk(message=chunk)
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency)
+        for i, chunk in enumerate(self._chunks(messages, kwargs.get("functions"))):
+            if i:
+                await asyncio.sleep(1 / self.tokens_per_second)
+            if run_manager and chunk.content:
+                await run_manager.on_llm_new_token(chunk.content)
+            yield ChatGenerationChunk(message=chunk)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        chunks = [generation.message for generation in self._stream(messages, stop, run_manager, **kwargs)]
+        return self._result(chunks)
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        chunks = [generation.message async for generation in self._astream(messages, stop, run_manager, **kwargs)]
+        return self._result(chunks)
@@ -0,0 +1,427 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import aclosing
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+from langchain_core.documents import Document
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.metrics import db_commit_duration, ingestion_stage_duration
+from app.core.document_processor import (
+    add_chunks, assign_chunk_ids, delete_chunks, existing_chunk_ids, page_ranges, parse_document, preload_loaders
+)
+from app.core.vectorstore import DEFAULT_NAMESPACE, bump_corpus_version
+from app.db.database import AsyncSessionLocal
+from app.db.models import File as FileModel
+
+logger = logging.getLogger(__name__)
+
+class IngestionCancelled(Exception):
+    """Raised inside a job whose file was deleted while it was queued or running."""
+
+@dataclass
+class IngestionJob:
+    id: str
+    file_id: int
+    filename: str
+    filepath: str
+    document_id: str
+    namespace: str = DEFAULT_NAMESPACE
+    status: str = "pending"
+    pages_parsed: int = 0
+    chunks_total: int = 0
+    chunks_embedded: int = 0
+    chunks_unchanged: int = 0
+    chunks_deleted: int = 0
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        data.pop("filepath")
+        return data
+
+@dataclass
+class IngestionBatch:
+    id: str
+    job_ids: List[str]
+    # Files identical to their indexed version, which were not re-ingested
+    skipped: List[str] = field(default_factory=list)
+    created_at: float = field(default_factory=time.time)
+
+class IngestionQueue:
+    """Background ingestion: parsing in a process pool, embedding in batches.
+
+    Large PDFs are parsed in page ranges spread over the pool, and chunks are
+    embedded as each range comes back rather than after the whole file.
+    Jobs are kept in memory for progress polling; the durable ingestion state
+    lives on the File row (pending, processing, ready or failed), and rows a
+    previous process left unfinished are picked up again by recover().
+    Jobs for the same document run one at a time, in submission order.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        parse_processes: int,
+        batch_size: int,
+        pages_per_task: int = 0,
+        max_jobs: int = 1000
+    ):
+        self.workers = workers
+        self.parse_processes = parse_processes
+        self.batch_size = batch_size
+        self.pages_per_task = pages_per_task
+        self.max_jobs = max_jobs
+        self.jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self.batches: "OrderedDict[str, IngestionBatch]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._pool: Optional[ProcessPoolExecutor] = None
+        # Unfinished jobs per document, oldest first, and the lock a running one holds
+        self._inflight: Dict[str, List[IngestionJob]] = {}
+        self._document_locks: Dict[str, asyncio.Lock] = {}
+        self._cancelled: Set[str] = set()
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue()
+        # spawn rather than fork: the server process already runs chromadb and
+        # HTTP client threads that must not be duplicated into children
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.parse_processes,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def preload(self) -> None:
+        """Start every parser process and have it import the loaders, waiting until done."""
+        if self._pool is None:
+            raise RuntimeError("Ingestion queue is not running")
+        futures = [self._pool.submit(preload_loaders) for _ in range(self.parse_processes)]
+        for future in futures:
+            future.result()
+
+    def submit(
+        self, file_id: int, filename: str, filepath: str, document_id: str, namespace: str = DEFAULT_NAMESPACE
+    ) -> IngestionJob:
+        if self._queue is None:
+            raise RuntimeError("Ingestion queue is not running")
+        job = IngestionJob(
+            id=uuid.uuid4().hex,
+            file_id=file_id,
+            filename=filename,
+            filepath=filepath,
+            document_id=document_id,
+            namespace=namespace
+        )
+        self.jobs[job.id] = job
+        self._inflight.setdefault(document_id, []).append(job)
+        self._document_locks.setdefault(document_id, asyncio.Lock())
+        # Forget the oldest finished jobs once the registry is full
+        while len(self.jobs) > self.max_jobs:
+            oldest = next(iter(self.jobs.values()))
+            if oldest.finished_at is None:
+                break
+            self.jobs.popitem(last=False)
+        self._queue.put_nowait(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        return self.jobs.get(job_id)
+
+    def has_job(self, document_id: str) -> bool:
+        """Whether a job for the document is queued or running in this process."""
+        return bool(self._inflight.get(document_id))
+
+    async def recover(self) -> int:
+        """Queue again the files a previous process left pending or processing.
+
+        Jobs only live in memory, so a restart or shutdown strands their
+        rows. Files still on disk are re-ingested (unchanged chunks are not
+        embedded again); the others are marked failed. Returns how many
+        jobs were queued.
+        """
+        async with AsyncSessionLocal() as db:
+            query = select(FileModel).where(FileModel.status.in_(("pending", "processing")))
+            stranded = (await db.execute(query)).scalars().all()
+        queued = 0
+        for db_file in stranded:
+            if db_file.document_id in self._inflight:
+                continue
+            if db_file.document_id and db_file.filepath and os.path.exists(db_file.filepath):
+                self.submit(
+                    db_file.id, db_file.filename, db_file.filepath, db_file.document_id,
+                    db_file.namespace or DEFAULT_NAMESPACE
+                )
+                queued += 1
+            else:
+                await self._set_file_state(db_file.id, status="failed", error="Ingestion was interrupted; upload the file again")
+        if stranded:
+            logger.info(f"Recovered {len(stranded)} unfinished ingestions, {queued} queued again")
+        return queued
+
+    async def cancel_document(self, document_id: str) -> None:
+        """Stop a document's ingestion before it is deleted.
+
+        Queued jobs are dropped and a running one stops after its current
+        step; returns once nothing can write the document's vectors.
+        """
+        jobs = self._inflight.get(document_id)
+        if not jobs:
+            return
+        self._cancelled.update(job.id for job in jobs)
+        async with self._document_locks[document_id]:
+            pass
+
+    def track_batch(self, jobs: List[IngestionJob], skipped: List[str]) -> IngestionBatch:
+        """Group jobs submitted together so their combined throughput can be reported."""
+        batch = IngestionBatch(id=uuid.uuid4().hex, job_ids=[job.id for job in jobs], skipped=skipped)
+        self.batches[batch.id] = batch
+        while len(self.batches) > self.max_jobs:
+            self.batches.popitem(last=False)
+        return batch
+
+    def batch_report(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        """Progress and throughput of a batch, or None if it is unknown."""
+        batch = self.batches.get(batch_id)
+        if batch is None:
+            return None
+        jobs = [job for job in map(self.jobs.get, batch.job_ids) if job is not None]
+        statuses = [job.status for job in jobs]
+        done = all(job.finished_at is not None for job in jobs)
+        end = max((job.finished_at for job in jobs), default=batch.created_at) if done else time.time()
+        elapsed = max(end - batch.created_at, 1e-9)
+        pages = sum(job.pages_parsed for job in jobs)
+        chunks = sum(job.chunks_total for job in jobs)
+        return {
+            "id": batch.id,
+            "done": done,
+            "files": len(batch.job_ids) + len(batch.skipped),
+            "skipped": len(batch.skipped),
+            "pending": statuses.count("pending"),
+            "processing": statuses.count("processing"),
+            "ready": statuses.count("ready"),
+            "failed": statuses.count("failed"),
+            "errors": {job.filename: job.error for job in jobs if job.error},
+            "pages_parsed": pages,
+            "chunks_total": chunks,
+            "chunks_embedded": sum(job.chunks_embedded for job in jobs),
+            "elapsed_s": round(elapsed, 3),
+            "pages_per_s": round(pages / elapsed, 2),
+            "chunks_per_s": round(chunks / elapsed, 2),
+        }
+
+    async def join(self) -> None:
+        """Wait until every submitted job has finished."""
+        if self._queue is not None:
+            await self._queue.join()
+
+    @property
+    def depth(self) -> int:
+        """Jobs waiting for a worker."""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def _is_latest(self, job: IngestionJob) -> bool:
+        """Whether no newer job for the same document is waiting to replace this one's result."""
+        return self._inflight.get(job.document_id, [job])[-1] is job
+
+    def _check_cancelled(self, job: IngestionJob) -> None:
+        if job.id in self._cancelled:
+            raise IngestionCancelled("The file was deleted")
+
+    def _finish(self, job: IngestionJob) -> None:
+        job.finished_at = time.time()
+        self._cancelled.discard(job.id)
+        jobs = self._inflight.get(job.document_id, [])
+        if job in jobs:
+            jobs.remove(job)
+        if not jobs:
+            self._inflight.pop(job.document_id, None)
+            self._document_locks.pop(job.document_id, None)
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                # An upload replacing a file being indexed waits for that job to finish
+                async with self._document_locks[job.document_id]:
+                    try:
+                        await self._run(job)
+                    except IngestionCancelled as e:
+                        job.status = "failed"
+                        job.error = str(e)
+                    except Exception as e:
+                        logger.error(f"Ingestion of {job.filename} failed: {str(e)}", exc_info=True)
+                        job.status = "failed"
+                        job.error = str(e)
+                        if self._is_latest(job):
+                            await self._set_file_state(job.file_id, status="failed", error=job.error)
+            finally:
+                self._finish(job)
+                self._queue.task_done()
+
+    async def _parse(self, job: IngestionJob) -> AsyncIterator[List[Document]]:
+        """Parse a document in page ranges across the pool, yielding chunks as ranges finish."""
+        loop = asyncio.get_running_loop()
+        ranges = await asyncio.to_thread(page_ranges, job.filepath, self.pages_per_task)
+
+        async def parse(pages: Optional[Tuple[int, int]]) -> Tuple[int, List[Document]]:
+            # Loading and splitting is CPU-bound; keep it off the event loop and the GIL
+            with ingestion_stage_duration.time(stage="parse"):
+                return await loop.run_in_executor(self._pool, parse_document, job.filepath, pages)
+
+        tasks = [asyncio.ensure_future(parse(pages)) for pages in ranges]
+        try:
+            for task in asyncio.as_completed(tasks):
+                pages_parsed, splits = await task
+                job.pages_parsed += pages_parsed
+                yield splits
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _run(self, job: IngestionJob) -> None:
+        self._check_cancelled(job)
+        job.status = "processing"
+        await self._set_file_state(job.file_id, status="processing")
+
+        # Only embed chunks that are new since the last indexing of this document
+        with ingestion_stage_duration.time(stage="diff"):
+            existing = await asyncio.to_thread(existing_chunk_ids, job.namespace, job.document_id)
+
+        seen = set()
+        pending: Dict[str, Document] = {}
+
+        async def embed(count: int) -> None:
+            self._check_cancelled(job)
+            ids = list(pending)[:count]
+            batch = [pending.pop(chunk_id) for chunk_id in ids]
+            with ingestion_stage_duration.time(stage="embed"):
+                await asyncio.to_thread(add_chunks, job.namespace, ids, batch)
+            job.chunks_embedded += len(batch)
+
+        async with aclosing(self._parse(job)) as parsed:
+            async for splits in parsed:
+                chunks = assign_chunk_ids(job.document_id, splits)
+                pending.update((chunk_id, doc) for chunk_id, doc in chunks.items() if chunk_id not in existing)
+                seen.update(chunks)
+                job.chunks_total = len(seen)
+                # Embed full batches while later pages are still being parsed
+                while len(pending) >= self.batch_size:
+                    await embed(self.batch_size)
+        if pending:
+            await embed(len(pending))
+        job.chunks_unchanged = len(seen & existing)
+
+        to_delete = [chunk_id for chunk_id in existing if chunk_id not in seen]
+        self._check_cancelled(job)
+        if to_delete:
+            with ingestion_stage_duration.time(stage="delete"):
+                await asyncio.to_thread(delete_chunks, job.namespace, to_delete)
+            job.chunks_deleted = len(to_delete)
+
+        if job.chunks_embedded or to_delete:
+            bump_corpus_version()
+
+        job.status = "ready"
+        # A newer upload of the file is queued; the row stays pending until it is indexed
+        if self._is_latest(job):
+            await self._set_file_state(job.file_id, status="ready", chunk_count=job.chunks_total)
+        logger.info(f"Ingested {job.filename}: {job.pages_parsed} pages, {job.chunks_total} chunks")
+
+    @staticmethod
+    async def _set_file_state(file_id: int, **values) -> None:
+        async with AsyncSessionLocal() as db:
+            with db_commit_duration.time(operation="file_state"):
+                await db.execute(update(FileModel).where(FileModel.id == file_id).values(**values))
+                await db.commit()
+
+def safe_filename(filename: Optional[str]) -> str:
+    """The last component of a client-supplied file name, so it cannot point outside the upload directory."""
+    name = os.path.basename((filename or "").replace("\\", "/")).strip()
+    if name in ("", ".", ".."):
+        raise ValueError(f"Invalid file name: {filename!r}")
+    return name
+
+def upload_dir(namespace: str = DEFAULT_NAMESPACE) -> str:
+    """Directory a namespace's uploads are kept in."""
+    if namespace == DEFAULT_NAMESPACE:
+        return settings.UPLOAD_DIR
+    # Uploads are .txt or .pdf files, so "namespaces" never clashes with one
+    return os.path.join(settings.UPLOAD_DIR, "namespaces", namespace)
+
+async def stage_file(
+    db: AsyncSession,
+    filename: str,
+    tmp_path: str,
+    content_hash: str,
+    namespace: str = DEFAULT_NAMESPACE,
+    queue: Optional[IngestionQueue] = None
+) -> Tuple[FileModel, bool]:
+    """Move a fully written temporary file into the namespace's upload directory and record it for ingestion.
+
+    A file with the same name in the same namespace re-indexes the existing
+    document. Returns
+    (file row, True) if it needs ingesting and (file row, False) if it is
+    identical to the file already indexed, or being indexed by a job in
+    queue (default: the app's ingestion queue); the temporary file is then
+    left for the caller to remove. A pending or processing row with no job
+    behind it was stranded by a restart, so re-uploading it ingests again.
+    """
+    filename = safe_filename(filename)
+    query = (
+        select(FileModel)
+        .where(FileModel.namespace == namespace, FileModel.filename == filename)
+        .order_by(FileModel.id.desc())
+    )
+    db_file = (await db.execute(query)).scalars().first()
+    queue = queue or ingestion_queue
+    if db_file is not None and db_file.content_hash == content_hash and (
+        db_file.status == "ready"
+        or (db_file.status in ("pending", "processing") and queue.has_job(db_file.document_id))
+    ):
+        return db_file, False
+
+    # Atomic: readers never see a partially written file
+    directory = upload_dir(namespace)
+    os.makedirs(directory, exist_ok=True)
+    file_path = os.path.join(directory, filename)
+    os.replace(tmp_path, file_path)
+
+    if db_file is None:
+        db_file = FileModel(filename=filename, namespace=namespace)
+        db.add(db_file)
+    db_file.filepath = file_path
+    db_file.document_id = db_file.document_id or uuid.uuid4().hex
+    db_file.content_hash = content_hash
+    db_file.upload_time = datetime.utcnow()
+    db_file.status = "pending"
+    db_file.error = None
+    await db.commit()
+    await db.refresh(db_file)
+    return db_file, True
+
+ingestion_queue = IngestionQueue(
+    workers=settings.INGESTION_WORKERS,
+    parse_processes=settings.INGESTION_PARSE_PROCESSES,
+    batch_size=settings.EMBEDDING_BATCH_SIZE,
+    pages_per_task=settings.INGESTION_PAGES_PER_TASK,
+)
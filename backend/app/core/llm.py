@@ -1,47 +1,407 @@
-from langchain_openai import ChatOpenAI
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.callbacks.manager import CallbackManager
-from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
-from langchain.chat_models.base import BaseChatModel
-from typing import Optional
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.language_models.chat_models import BaseChatModel
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Sequence, Tuple
 from app.core.config import settings
-import google.generativeai as genai
+from app.core.fakes import FakeChatModel
+import asyncio
+import httpx
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+def provider_for(model: str) -> str:
+    """Provider name for a model: 'google' for 'gemini-' models, otherwise 'openai'."""
+    if model.startswith("gemini-"):
+        return "google"
+    return "openai"
+
+# One keep-alive connection pool per process for every OpenAI client, instead
+# of a new HTTP client (and TLS handshake) per agent
+_http_lock = threading.Lock()
+_http_client: Optional[httpx.Client] = None
+_http_async_client: Optional[httpx.AsyncClient] = None
+_genai_configured = False
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY
+    )
+
+def _http_clients() -> Tuple[httpx.Client, httpx.AsyncClient]:
+    global _http_client, _http_async_client
+    with _http_lock:
+        if _http_client is None:
+            _http_client = httpx.Client(limits=_limits(), timeout=settings.LLM_TIMEOUT)
+            _http_async_client = httpx.AsyncClient(limits=_limits(), timeout=settings.LLM_TIMEOUT)
+        return _http_client, _http_async_client
+
+def _configure_genai() -> None:
+    global _genai_configured
+    if not _genai_configured:
+        import google.generativeai as genai
+
+        genai.configure(api_key=settings.GOOGLE_API_KEY)
+        _genai_configured = True
+
+class ProviderStats:
+    """Rolling first-token latency and error rate per provider.
+
+    Used to order fallbacks (fastest first) and to route around a primary
+    provider that is failing most of its recent calls.
+    """
+
+    def __init__(self, alpha: float = 0.2, window: int = 20, min_samples: int = 5, max_error_rate: float = 0.5):
+        self.alpha = alpha
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.ttft: Dict[str, float] = {}
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.hedges = 0
+        self.fallbacks = 0
+        self._recent: Dict[str, Deque[bool]] = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+
+    def record_first_token(self, provider: str, seconds: float) -> None:
+        with self._lock:
+            previous = self.ttft.get(provider)
+            self.ttft[provider] = seconds if previous is None else previous + self.alpha * (seconds - previous)
+
+    def record_result(self, provider: str, ok: bool) -> None:
+        with self._lock:
+            self.calls[provider] += 1
+            if not ok:
+                self.errors[provider] += 1
+            self._recent[provider].append(ok)
+
+    def healthy(self, provider: str) -> bool:
+        recent = self._recent.get(provider)
+        if not recent or len(recent) < self.min_samples:
+            return True
+        return recent.count(False) / len(recent) <= self.max_error_rate
+
+    def order(self, models: Sequence[str]) -> List[str]:
+        """The primary model first unless it is unhealthy, then fallbacks by latency."""
+        primary, fallbacks = models[0], list(models[1:])
+        fallbacks.sort(key=lambda model: (
+            not self.healthy(provider_for(model)),
+            self.ttft.get(provider_for(model), float("inf"))
+        ))
+        if not self.healthy(provider_for(primary)) and any(self.healthy(provider_for(m)) for m in fallbacks):
+            return fallbacks + [primary]
+        return [primary] + fallbacks
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        providers = set(self.calls) | set(self.ttft)
+        return {
+            provider: {
+                "ttft_ewma_s": self.ttft.get(provider),
+                "calls": self.calls[provider],
+                "errors": self.errors[provider],
+                "healthy": self.healthy(provider),
+            }
+            for provider in providers
+        }
+
+provider_stats = ProviderStats()
+
+# Runs the attempts of hedged synchronous calls, which cannot be interrupted;
+# a losing attempt finishes in the background and its answer is dropped
+_hedge_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm-hedge")
+
+class FailoverChatModel(BaseChatModel):
+    """Chat model trying an ordered list of models, with optional hedging.
+
+    A model that fails before its first token is replaced by the next one.
+    With hedge_delay set, the next model is also started when the current
+    one has produced nothing after hedge_delay seconds; whichever streams
+    first wins and the other is cancelled. Once a token has been streamed
+    the answer is committed to that model and later errors propagate.
+    Synchronous calls hedge the same way on the whole answer, but a losing
+    call runs to completion in the background.
+    """
+
+    models: List[Any]
+    names: List[str]
+    hedge_delay: Optional[float] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "failover"
+
+    @property
+    def model_name(self) -> str:
+        return self.names[0]
+
+    def _candidates(self) -> List[Tuple[str, Any]]:
+        by_name = dict(zip(self.names, self.models))
+        return [(name, by_name[name]) for name in provider_stats.order(self.names)]
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        candidates = self._candidates()
+        events: asyncio.Queue = asyncio.Queue()
+        tasks: Dict[int, asyncio.Task] = {}
+        started: Dict[int, float] = {}
+
+        async def attempt(index: int, name: str, model: Any) -> None:
+            provider = provider_for(name)
+            first = True
+            try:
+                # The inner model reports no callbacks of its own; tokens are
+                # emitted once, by this model's run
+                async for chunk in model.astream(messages, config={"callbacks": []}, stop=stop, **kwargs):
+                    if first:
+                        provider_stats.record_first_token(provider, time.perf_counter() - started[index])
+                        first = False
+                    events.put_nowait((index, "chunk", chunk))
+                provider_stats.record_result(provider, True)
+                events.put_nowait((index, "end", None))
+            except asyncio.CancelledError:
+                if first:
+                    # Lost a hedge race: it is at least this slow
+                    provider_stats.record_first_token(provider, time.perf_counter() - started[index])
+                raise
+            except Exception as e:
+                provider_stats.record_result(provider, False)
+                events.put_nowait((index, "error", e))
+
+        def launch() -> None:
+            index = len(tasks)
+            name, model = candidates[index]
+            started[index] = time.perf_counter()
+            tasks[index] = asyncio.create_task(attempt(index, name, model))
+
+        launch()
+        winner: Optional[int] = None
+        last_error: Optional[Exception] = None
+        try:
+            while True:
+                can_hedge = winner is None and self.hedge_delay is not None and len(tasks) < len(candidates)
+                try:
+                    index, kind, value = await asyncio.wait_for(events.get(), self.hedge_delay if can_hedge else None)
+                except asyncio.TimeoutError:
+                    provider_stats.hedges += 1
+                    logger.info(f"No first token from {candidates[len(tasks) - 1][0]} after {self.hedge_delay}s, hedging")
+                    launch()
+                    continue
+
+                if winner is not None and index != winner:
+                    continue
+                if kind == "error":
+                    if winner is not None:
+                        raise value
+                    last_error = value
+                    logger.warning(f"{candidates[index][0]} failed, trying the next model: {str(value)}")
+                    if any(not task.done() for i, task in tasks.items() if i != index):
+                        continue
+                    if len(tasks) < len(candidates):
+                        provider_stats.fallbacks += 1
+                        launch()
+                        continue
+                    raise last_error
+
+                if winner is None:
+                    winner = index
+                    for i, task in tasks.items():
+                        if i != winner:
+                            task.cancel()
+                if kind == "end":
+                    return
+                generation = ChatGenerationChunk(message=value)
+                if run_manager and value.content:
+                    await run_manager.on_llm_new_token(value.content, chunk=generation)
+                yield generation
+        finally:
+            for task in tasks.values():
+                if not task.done():
+                    task.cancel()
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        merged = None
+        async for chunk in self._astream(messages, stop, run_manager, **kwargs):
+            merged = chunk if merged is None else merged + chunk
+        message = merged.message if merged is not None else AIMessage(content="")
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(
+            content=message.content,
+            additional_kwargs=message.additional_kwargs,
+            usage_metadata=getattr(message, "usage_metadata", None)
+        ))])
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        candidates = self._candidates()
+
+        def attempt(name: str, model: Any) -> BaseMessage:
+            provider = provider_for(name)
+            start = time.perf_counter()
+            try:
+                message = model.invoke(messages, config={"callbacks": []}, stop=stop, **kwargs)
+            except Exception:
+                provider_stats.record_result(provider, False)
+                raise
+            provider_stats.record_first_token(provider, time.perf_counter() - start)
+            provider_stats.record_result(provider, True)
+            return message
+
+        if self.hedge_delay is None or len(candidates) == 1:
+            last_error: Optional[Exception] = None
+            for name, model in candidates:
+                if last_error is not None:
+                    provider_stats.fallbacks += 1
+                try:
+                    return ChatResult(generations=[ChatGeneration(message=attempt(name, model))])
+                except Exception as e:
+                    last_error = e
+                    logger.warning(f"{name} failed, trying the next model: {str(e)}")
+            raise last_error
+
+        futures: Dict[Future, int] = {}
+
+        def launch() -> Future:
+            index = len(futures)
+            future = _hedge_pool.submit(attempt, *candidates[index])
+            futures[future] = index
+            return future
+
+        running = {launch()}
+        last_error = None
+        while True:
+            can_hedge = len(futures) < len(candidates)
+            done, running = wait(running, timeout=self.hedge_delay if can_hedge else None, return_when=FIRST_COMPLETED)
+            if not done:
+                provider_stats.hedges += 1
+                logger.info(f"No answer from {candidates[len(futures) - 1][0]} after {self.hedge_delay}s, hedging")
+                running.add(launch())
+                continue
+            for future in sorted(done, key=futures.get):
+                if future.exception() is None:
+                    return ChatResult(generations=[ChatGeneration(message=future.result())])
+                last_error = future.exception()
+                logger.warning(f"{candidates[futures[future]][0]} failed, trying the next model: {str(last_error)}")
+            if running:
+                continue
+            if len(futures) < len(candidates):
+                provider_stats.fallbacks += 1
+                running.add(launch())
+                continue
+            raise last_error
+
+_models: Dict[Tuple, BaseChatModel] = {}
+_models_lock = threading.Lock()
+
+def _create_llm(model: str, temperature: float, streaming: bool) -> BaseChatModel:
+    if settings.LLM_BACKEND == "fake":
+        return FakeChatModel(
+            model_name=model,
+            latency=settings.FAKE_LLM_LATENCY,
+            tokens_per_second=settings.FAKE_LLM_TOKENS_PER_SECOND,
+            answer_tokens=settings.FAKE_LLM_ANSWER_TOKENS
+        )
 
-def get_llm(
-    model_name: Optional[str] = None,
-    temperature: float = 0.7,
-    streaming: bool = False
-) -> BaseChatModel:
-    """Get an LLM instance based on the specified model."""
-    callbacks = CallbackManager([StreamingStdOutCallbackHandler()]) if streaming else None
-    
-    model = model_name or settings.DEFAULT_MODEL
-    
     # OpenAI models
     if model.startswith("gpt-"):
         if not settings.OPENAI_API_KEY:
             raise ValueError("OpenAI API key not set")
+        # Provider SDKs are imported on first use; each adds about a second to startup
+        from langchain_openai import ChatOpenAI
+
+        http_client, http_async_client = _http_clients()
         return ChatOpenAI(
             model=model,
             temperature=temperature,
             streaming=streaming,
-            callbacks=callbacks,
-            api_key=settings.OPENAI_API_KEY
+            # Report token usage on streamed responses too
+            stream_usage=streaming,
+            api_key=settings.OPENAI_API_KEY,
+            http_client=http_client,
+            http_async_client=http_async_client
         )
     
     # Google Gemini models
     elif model.startswith("gemini-"):
         if not settings.GOOGLE_API_KEY:
             raise ValueError("Google API key not set")
-        genai.configure(api_key=settings.GOOGLE_API_KEY)
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
+        _configure_genai()
         return ChatGoogleGenerativeAI(
             model=model,
             temperature=temperature,
             streaming=streaming,
-            callbacks=callbacks,
             google_api_key=settings.GOOGLE_API_KEY,
             convert_system_message_to_human=True  # Required for Gemini
         )
     
     else:
-        raise ValueError(f"Unknown model: {model}. Supported prefixes: 'gpt-' for OpenAI, 'gemini-' for Google")
\ No newline at end of file
+        raise ValueError(f"Unknown model: {model}. Supported prefixes: 'gpt-' for OpenAI, 'gemini-' for Google")
+
+def get_llm(
+    model_name: Optional[str] = None,
+    temperature: float = 0.7,
+    streaming: bool = False,
+    fallbacks: Optional[Sequence[str]] = None,
+    hedge_delay: Optional[float] = None
+) -> BaseChatModel:
+    """Get a shared LLM client for the specified model.
+
+    Clients are cached by (provider, model, parameters) and carry no
+    callbacks; pass callbacks per run through the config instead. With
+    fallbacks, the result tries those models in order (fastest first) when
+    the primary fails, and with hedge_delay also races the next one when the
+    primary is slow to produce its first token.
+    """
+    model = model_name or settings.DEFAULT_MODEL
+    fallbacks = [name for name in (fallbacks or []) if name != model]
+    key = (provider_for(model), model, temperature, streaming, tuple(fallbacks), hedge_delay)
+    with _models_lock:
+        llm = _models.get(key)
+        if llm is None:
+            if fallbacks:
+                names = [model] + fallbacks
+                llm = FailoverChatModel(
+                    models=[_create_llm(name, temperature, streaming) for name in names],
+                    names=names,
+                    hedge_delay=hedge_delay
+                )
+            else:
+                llm = _create_llm(model, temperature, streaming)
+            _models[key] = llm
+        return llm
+
+async def close_llm_clients() -> None:
+    """Close the shared HTTP connection pools. Called at application shutdown."""
+    global _http_client, _http_async_client
+    with _http_lock:
+        client, async_client = _http_client, _http_async_client
+        _http_client = _http_async_client = None
+    with _models_lock:
+        _models.clear()
+    if client is not None:
+        client.close()
+    if async_client is not None:
+        await async_client.aclose()
@@ -0,0 +1,205 @@
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from app.core.config import settings
+
+try:
+    from opentelemetry import trace
+except ImportError:  # tracing is optional
+    trace = None
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value: float) -> str:
+    return "+Inf" if value == float("inf") else repr(float(value))
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in values.items()]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._counts: Dict[Tuple[str, ...], List[int]] = {}
+        self._sums: Dict[Tuple[str, ...], float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * len(self.buckets)
+                self._sums[key] = 0.0
+            counts[index] += 1
+            self._sums[key] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            series = [(key, list(counts), self._sums[key]) for key, counts in self._counts.items()]
+        lines = []
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+class Collector(_Metric):
+    """Gauge or counter whose values are read from a callback at scrape time.
+
+    collect returns {label values tuple: value}; use () as the key when the
+    metric has no labels.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        collect: Callable[[], Dict[Tuple[str, ...], float]],
+        labelnames: Sequence[str] = (),
+        kind: str = "gauge"
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.kind = kind
+        self._collect = collect
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in self._collect().items()]
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                logger.warning(f"Failed to collect metric {metric.name}: {str(e)}")
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+time_to_first_token = registry.register(Histogram(
+    "chat_time_to_first_token_seconds", "Time from the start of an agent run to its first streamed token.", ["model"]
+))
+llm_duration = registry.register(Histogram(
+    "chat_llm_seconds", "Duration of each LLM call made by the agent.", ["model"]
+))
+llm_tokens = registry.register(Counter(
+    "chat_llm_tokens_total", "Tokens used by LLM calls.", ["model", "kind"]
+))
+agent_run_duration = registry.register(Histogram(
+    "chat_agent_run_seconds", "Duration of whole agent runs.", ["model", "status"]
+))
+retrieval_duration = registry.register(Histogram(
+    "chat_retrieval_seconds", "Latency of document retrieval."
+))
+context_tokens_removed = registry.register(Histogram(
+    "chat_retrieval_context_tokens_removed", "Prompt tokens saved per document search by merging overlapping chunks and the token budget.",
+    buckets=(0, 25, 50, 100, 200, 400, 800, 1600, 3200)
+))
+answers_interrupted = registry.register(Counter(
+    "chat_answers_interrupted_total", "Answers cut short by a stop request or a client disconnect."
+))
+tool_calls = registry.register(Counter(
+    "chat_tool_calls_total", "Tool calls made by the agent.", ["tool", "status"]
+))
+db_commit_duration = registry.register(Histogram(
+    "db_commit_seconds", "Duration of chat persistence transactions.", ["operation"]
+))
+ingestion_stage_duration = registry.register(Histogram(
+    "ingestion_stage_seconds", "Duration of each document ingestion stage.", ["stage"],
+    buckets=LATENCY_BUCKETS + (120.0, 300.0, 600.0)
+))
+
+def get_tracer():
+    """OpenTelemetry tracer, or None when the packages are not installed."""
+    if trace is None:
+        return None
+    return trace.get_tracer("app")
+
+def setup_tracing(app) -> None:
+    """Export spans over OTLP and trace every request, if enabled in settings."""
+    if not settings.OTEL_ENABLED:
+        return
+    try:
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+        from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError as e:
+        logger.warning(f"OpenTelemetry is enabled but not installed: {str(e)}")
+        return
+
+    provider = TracerProvider(resource=Resource.create({"service.name": settings.OTEL_SERVICE_NAME}))
+    # The exporter reads OTEL_EXPORTER_OTLP_ENDPOINT and friends from the environment
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
+    FastAPIInstrumentor.instrument_app(app, excluded_urls="metrics")
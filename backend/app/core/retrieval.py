@@ -0,0 +1,339 @@
+import heapq
+import itertools
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+import numpy as np
+from cachetools import LRUCache
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from app.core.coalesce import SingleFlight
+from app.core.config import settings
+from app.core.vectorstore import (
+    DEFAULT_NAMESPACE, corpus_version, embedding_model_id, get_vectorstore, normalize_namespace
+)
+
+# Words, numbers and dotted/hyphenated terms such as "3.2" or "mohr-coulomb"
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[.\-][a-z0-9]+)*")
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+def normalize_query(query: str) -> str:
+    """Lowercase and collapse whitespace, so near-identical queries share cache entries."""
+    return " ".join(query.lower().split())
+
+def _matches(metadata: Dict[str, Any], where: Optional[Dict[str, Any]]) -> bool:
+    return not where or all(metadata.get(key) == value for key, value in where.items())
+
+def chroma_filter(where: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Translate a flat equality filter into Chroma's where syntax."""
+    if not where:
+        return None
+    if len(where) == 1:
+        return dict(where)
+    return {"$and": [{key: value} for key, value in where.items()]}
+
+class BM25Index:
+    """In-process inverted index scoring chunks with Okapi BM25.
+
+    Mirrors the chunks stored in Chroma (same ids) so exact terms such as
+    formula names or section numbers can be matched lexically.
+    """
+
+    # Unlike id(), never reused once an index is garbage collected
+    _serials = itertools.count()
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.serial = next(self._serials)
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self._lengths: Dict[str, int] = {}
+        self._docs: Dict[str, Document] = {}
+        self._total_length = 0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def add(self, ids: Iterable[str], documents: Iterable[Document]) -> None:
+        with self._lock:
+            for chunk_id, doc in zip(ids, documents):
+                if chunk_id in self._docs:
+                    self._remove(chunk_id)
+                terms = Counter(tokenize(doc.page_content))
+                for term, tf in terms.items():
+                    self._postings[term][chunk_id] = tf
+                length = sum(terms.values())
+                self._lengths[chunk_id] = length
+                self._total_length += length
+                self._docs[chunk_id] = Document(id=chunk_id, page_content=doc.page_content, metadata=dict(doc.metadata))
+
+    def remove(self, ids: Iterable[str]) -> None:
+        with self._lock:
+            for chunk_id in ids:
+                if chunk_id in self._docs:
+                    self._remove(chunk_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._postings.clear()
+            self._lengths.clear()
+            self._docs.clear()
+            self._total_length = 0
+
+    def search(self, query: str, k: int, where: Optional[Dict[str, Any]] = None) -> List[Tuple[Document, float]]:
+        with self._lock:
+            n = len(self._docs)
+            if n == 0:
+                return []
+            avg_length = self._total_length / n
+            scores: Dict[str, float] = defaultdict(float)
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, tf in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[chunk_id] / avg_length)
+                    scores[chunk_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+            candidates = (
+                (chunk_id, score) for chunk_id, score in scores.items()
+                if _matches(self._docs[chunk_id].metadata, where)
+            )
+            top = heapq.nlargest(k, candidates, key=lambda item: item[1])
+            return [(self._docs[chunk_id], score) for chunk_id, score in top]
+
+    def load(self, vectorstore, batch_size: int = 1000) -> None:
+        """Rebuild the index from everything currently stored in Chroma."""
+        self.clear()
+        offset = 0
+        while True:
+            batch = vectorstore.get(include=["documents", "metadatas"], limit=batch_size, offset=offset)
+            ids = batch["ids"]
+            if not ids:
+                break
+            self.add(ids, [
+                Document(page_content=text or "", metadata=metadata or {})
+                for text, metadata in zip(batch["documents"], batch["metadatas"])
+            ])
+            offset += len(ids)
+
+    def _remove(self, chunk_id: str) -> None:
+        doc = self._docs.pop(chunk_id)
+        for term in set(tokenize(doc.page_content)):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(chunk_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_length -= self._lengths.pop(chunk_id)
+
+class LexicalIndexes:
+    """One BM25 index per namespace, loaded from the namespace's collection on first use."""
+
+    def __init__(self):
+        self._indexes: Dict[str, BM25Index] = {}
+        self._lock = threading.Lock()
+
+    def get(self, namespace: Optional[str] = None) -> BM25Index:
+        namespace = namespace or DEFAULT_NAMESPACE
+        index = self._indexes.get(namespace)
+        if index is None:
+            namespace = normalize_namespace(namespace)
+            with self._lock:
+                index = self._indexes.get(namespace)
+                if index is None:
+                    index = BM25Index()
+                    index.load(get_vectorstore(namespace))
+                    self._indexes[namespace] = index
+        return index
+
+    def clear(self) -> None:
+        with self._lock:
+            self._indexes.clear()
+
+lexical_indexes = LexicalIndexes()
+
+def reciprocal_rank_fusion(rankings: List[List[Document]], k: int, rrf_k: int = 60) -> List[Document]:
+    """Merge ranked lists by summing 1 / (rrf_k + rank) per document."""
+    scores: Dict[str, float] = defaultdict(float)
+    docs: Dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            key = doc.id or doc.page_content
+            scores[key] += 1.0 / (rrf_k + rank + 1)
+            docs.setdefault(key, doc)
+    return [docs[key] for key in heapq.nlargest(k, scores, key=scores.get)]
+
+# Rough per-entry bookkeeping cost (key, LRU links, object headers)
+_ENTRY_OVERHEAD = 200
+
+def _entry_size(value: Any) -> int:
+    if isinstance(value, np.ndarray):
+        return value.nbytes + _ENTRY_OVERHEAD
+    _, docs = value
+    return _ENTRY_OVERHEAD + sum(
+        _ENTRY_OVERHEAD + len(doc.page_content) + len(str(doc.metadata)) for doc in docs
+    )
+
+class RetrievalCache:
+    """LRU cache of query embeddings and retrieval results, bounded by bytes.
+
+    Results are only valid for the corpus version they were computed
+    against and are dropped as soon as it changes. Query embeddings depend
+    only on the query and the embedding model, so they survive ingestion.
+    Sizes are estimates of the payload (vector bytes, chunk text and
+    metadata), not exact Python memory use.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = LRUCache(maxsize=max_bytes, getsizeof=_entry_size)
+        self._version = corpus_version()
+        self._lock = threading.Lock()
+        self.hits = {"embedding": 0, "results": 0}
+        self.misses = {"embedding": 0, "results": 0}
+
+    def embedding(self, query: str, embed: Callable[[str], List[float]]) -> List[float]:
+        """The query's embedding, computed with embed() on a miss."""
+        key = ("embedding", embedding_model_id(), normalize_query(query))
+        with self._lock:
+            vector = self._lookup("embedding", key)
+        if vector is None:
+            vector = np.asarray(embed(query), dtype=np.float32)
+            self._store(key, vector)
+        return vector.tolist()
+
+    def results(self, key: Hashable, search: Callable[[], List[Document]]) -> List[Document]:
+        """Results of a search, running search() on a miss or after the corpus changed."""
+        key = ("results", key)
+        version = corpus_version()
+        with self._lock:
+            if version != self._version:
+                # Ingestion changed the corpus: every cached result is stale
+                for stale in [k for k in self._entries if k[0] == "results"]:
+                    del self._entries[stale]
+                self._version = version
+            entry = self._lookup("results", key)
+        if entry is not None:
+            return list(entry[1])
+        docs = search()
+        # Tagged with the version searched, so an entry computed while the
+        # corpus changed is dropped at its next lookup
+        self._store(key, (version, list(docs)))
+        return docs
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = {kind: self.hits[kind] + self.misses[kind] for kind in self.hits}
+        return {
+            "entries": len(self._entries),
+            "size_bytes": int(self._entries.currsize),
+            "max_bytes": self.max_bytes,
+            "hits": dict(self.hits),
+            "misses": dict(self.misses),
+            "hit_rate": {kind: round(self.hits[kind] / lookups[kind], 3) if lookups[kind] else None for kind in lookups},
+        }
+
+    def _lookup(self, kind: str, key: Hashable) -> Any:
+        value = self._entries.get(key)
+        if kind == "results" and value is not None and value[0] != self._version:
+            del self._entries[key]
+            value = None
+        if value is None:
+            self.misses[kind] += 1
+        else:
+            self.hits[kind] += 1
+        return value
+
+    def _store(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            try:
+                self._entries[key] = value
+            except ValueError:
+                # Larger than the whole cache
+                pass
+
+retrieval_cache = RetrievalCache(max_bytes=settings.RETRIEVAL_CACHE_MAX_BYTES)
+
+# Identical searches running at the same time (same query, filter, options
+# and corpus version) are executed once and their results shared
+retrieval_flight = SingleFlight()
+
+class HybridRetriever(BaseRetriever):
+    """Dense (Chroma) and lexical (BM25) retrieval fused by reciprocal rank.
+
+    `where` restricts both searches to chunks whose metadata matches every
+    key, e.g. {"filename": "lecture-3.pdf"}.
+    """
+
+    vectorstore: Any
+    index: Any = None  # the default namespace's lexical index if not given
+    k: int = 4
+    fetch_k: int = 20
+    mmr: bool = False
+    hybrid: bool = True
+    dense: bool = True
+    where: Optional[Dict[str, Any]] = None
+
+    def _dense(self, query: str) -> List[Document]:
+        filter = chroma_filter(self.where)
+        if settings.RETRIEVAL_CACHE_ENABLED:
+            embedding = retrieval_cache.embedding(query, self.vectorstore.embeddings.embed_query)
+        else:
+            embedding = self.vectorstore.embeddings.embed_query(query)
+        if self.mmr:
+            return self.vectorstore.max_marginal_relevance_search_by_vector(
+                embedding, k=self.fetch_k, fetch_k=self.fetch_k * 2, filter=filter
+            )
+        return self.vectorstore.similarity_search_by_vector(embedding, k=self.fetch_k, filter=filter)
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: Optional[CallbackManagerForRetrieverRun] = None
+    ) -> List[Document]:
+        index = self.index if self.index is not None else lexical_indexes.get()
+        # The collection name identifies the namespace and embedding model;
+        # the corpus version changes whenever their chunks do
+        key = (
+            normalize_query(query),
+            tuple(sorted((self.where or {}).items())),
+            self.k, self.fetch_k, self.mmr, self.hybrid, self.dense,
+            self.vectorstore._collection.name, index.serial, corpus_version(),
+        )
+        if settings.RETRIEVAL_CACHE_ENABLED:
+            return retrieval_cache.results(key, lambda: self._coalesced(key, query, index))
+        return self._coalesced(key, query, index)
+
+    def _coalesced(self, key: Tuple, query: str, index: BM25Index) -> List[Document]:
+        if not settings.COALESCE_REQUESTS:
+            return self._search(query, index)
+        return list(retrieval_flight.do(key, lambda: self._search(query, index)))
+
+    def _search(self, query: str, index: BM25Index) -> List[Document]:
+        dense = self._dense(query) if self.dense else []
+        if not self.hybrid or len(index) == 0:
+            return dense[:self.k]
+        lexical = [doc for doc, _ in index.search(query, self.fetch_k, self.where)]
+        return reciprocal_rank_fusion([dense, lexical], self.k)
+
+def get_retriever(
+    vectorstore, where: Optional[Dict[str, Any]] = None, namespace: Optional[str] = None, **overrides
+) -> HybridRetriever:
+    """Build a retriever configured from settings, using the namespace's lexical index."""
+    options = {
+        "index": lexical_indexes.get(namespace),
+        "k": settings.RETRIEVAL_K,
+        "fetch_k": settings.RETRIEVAL_FETCH_K,
+        "mmr": settings.RETRIEVAL_MMR,
+        "hybrid": settings.RETRIEVAL_HYBRID,
+    }
+    options.update(overrides)
+    return HybridRetriever(vectorstore=vectorstore, where=where, **options)
@@ -1,22 +1,329 @@
-from langchain_openai import OpenAIEmbeddings
-from langchain_chroma import Chroma
-import chromadb
+from langchain_core.embeddings import DeterministicFakeEmbedding
 from app.core.config import settings
+from app.core.embeddings import CachedEmbeddings, OnnxEmbeddings
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+import hashlib
 import os
+import re
+import threading
+import uuid
 
-def get_vectorstore():
-    embeddings = OpenAIEmbeddings(
+if TYPE_CHECKING:
+    import chromadb
+    from langchain_chroma import Chroma
+
+# Documents belong to a namespace (a user or workspace). Each namespace is a
+# separate Chroma collection with its own HNSW index, so a query only walks
+# the graph of its own namespace instead of filtering a shared one.
+DEFAULT_NAMESPACE = "default"
+_NAMESPACE_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+
+# HNSW parameters Chroma uses for collections created without them
+_CHROMA_HNSW_DEFAULTS = {"hnsw:M": 16, "hnsw:construction_ef": 100, "hnsw:search_ef": 10}
+
+# Compaction uses Chroma's internal SQLite component, which is not part of its
+# public API; only these releases are known to provide it
+_CHROMA_INTERNALS_VERSIONS = ("0.6.",)
+
+# Process-wide stores shared by agents and ingestion, one per namespace. The
+# embeddings client and the Chroma client are shared by all of them and are
+# safe to use across threads.
+_stores: Dict[str, "Chroma"] = {}
+_embeddings: Any = None
+_client: Optional["chromadb.ClientAPI"] = None
+_lock = threading.Lock()
+
+# Bumped whenever indexed content changes, so caches derived from the corpus
+# can tell their entries apart from answers computed against older content.
+_corpus_version = 0
+
+def normalize_namespace(namespace: Optional[str]) -> str:
+    """Validate a namespace name; None or "" is the default namespace."""
+    if not namespace:
+        return DEFAULT_NAMESPACE
+    if not _NAMESPACE_RE.match(namespace):
+        raise ValueError(
+            f"Invalid namespace: {namespace!r}. Use up to 64 letters, digits, '_', '-' or '.', "
+            "starting with a letter or digit"
+        )
+    return namespace
+
+def embedding_model_id() -> str:
+    """Name of the model the configured backend embeds with."""
+    if settings.EMBEDDING_BACKEND == "fake":
+        return f"fake-{settings.FAKE_EMBEDDING_SIZE}"
+    if settings.EMBEDDING_BACKEND == "onnx":
+        # EMBEDDING_MODEL is the local model directory
+        return f"onnx-{os.path.basename(os.path.normpath(settings.EMBEDDING_MODEL))}"
+    return settings.EMBEDDING_MODEL
+
+def _model_collection_name() -> str:
+    backend, model = settings.EMBEDDING_BACKEND, embedding_model_id()
+    if backend == "openai" and model == "text-embedding-ada-002":
+        return "documents"
+    slug = re.sub(r"[^a-zA-Z0-9]+", "-", model).strip("-")[:32]
+    digest = hashlib.sha1(f"{backend}\0{model}".encode("utf-8")).hexdigest()[:8]
+    return f"documents-{backend}-{slug}-{digest}"
+
+def collection_name(namespace: Optional[str] = None) -> str:
+    """Chroma collection for a namespace and the configured embedding backend and model.
+
+    Each backend/model pair gets its own collections, so switching never
+    mixes vectors of different models or dimensions. The original OpenAI
+    model keeps the "documents" collection existing stores were built in,
+    and the default namespace keeps each model's original collection.
+    """
+    base = _model_collection_name()
+    namespace = normalize_namespace(namespace)
+    if namespace == DEFAULT_NAMESPACE:
+        return base
+    # Chroma allows 63 characters; the digest keeps truncated names distinct
+    slug = re.sub(r"[^a-zA-Z0-9]+", "-", namespace).strip("-")[:16]
+    digest = hashlib.sha1(f"{base}\0{namespace}".encode("utf-8")).hexdigest()[:8]
+    return f"{base[:32]}-ns-{slug}-{digest}"
+
+def collection_metadata(namespace: Optional[str] = None) -> Dict[str, Any]:
+    """Metadata new collections are created with: the namespace and HNSW parameters."""
+    return {
+        "namespace": normalize_namespace(namespace),
+        "hnsw:M": settings.HNSW_M,
+        "hnsw:construction_ef": settings.HNSW_CONSTRUCTION_EF,
+        "hnsw:search_ef": settings.HNSW_SEARCH_EF,
+    }
+
+def _create_embeddings():
+    """Embeddings client for the configured backend."""
+    if settings.EMBEDDING_BACKEND == "fake":
+        return DeterministicFakeEmbedding(size=settings.FAKE_EMBEDDING_SIZE)
+    if settings.EMBEDDING_BACKEND == "onnx":
+        return OnnxEmbeddings(
+            settings.EMBEDDING_MODEL,
+            threads=settings.EMBEDDING_THREADS,
+            max_batch=settings.EMBEDDING_MAX_BATCH,
+            max_wait=settings.EMBEDDING_BATCH_WAIT,
+            max_length=settings.EMBEDDING_MAX_LENGTH,
+            normalize=settings.EMBEDDING_NORMALIZE
+        )
+    if settings.EMBEDDING_BACKEND != "openai":
+        raise ValueError(f"Unknown embedding backend: {settings.EMBEDDING_BACKEND}. Supported: openai, onnx, fake")
+    from langchain_openai import OpenAIEmbeddings
+
+    return OpenAIEmbeddings(
         model=settings.EMBEDDING_MODEL,
         api_key=settings.OPENAI_API_KEY
     )
-    
+
+def _open_embeddings():
+    """Embeddings client for the configured backend, behind the embedding cache if enabled."""
+    embeddings = _create_embeddings()
+    if settings.EMBEDDING_CACHE_ENABLED:
+        embeddings = CachedEmbeddings(
+            embeddings,
+            directory=settings.EMBEDDING_CACHE_DIR,
+            model=embedding_model_id(),
+            size_limit=settings.EMBEDDING_CACHE_SIZE_LIMIT
+        )
+    return embeddings
+
+def _open_client() -> "chromadb.ClientAPI":
+    # chromadb is slow to import; load it when the store is opened, not with the app
+    import chromadb
+
     # Create vectorstore directory if it doesn't exist
     os.makedirs(settings.VECTORSTORE_DIR, exist_ok=True)
-    
-    client = chromadb.PersistentClient(path=settings.VECTORSTORE_DIR)
-    
+    return chromadb.PersistentClient(path=settings.VECTORSTORE_DIR)
+
+def _open_collection(client, embeddings, namespace: Optional[str] = None) -> "Chroma":
+    from langchain_chroma import Chroma
+
+    # Metadata only applies when the collection is created; existing
+    # collections keep theirs until compacted or rebuilt
     return Chroma(
         embedding_function=embeddings,
         client=client,
-        collection_name="documents"
-    )
\ No newline at end of file
+        collection_name=collection_name(namespace),
+        collection_metadata=collection_metadata(namespace)
+    )
+
+def _create_vectorstore(namespace: Optional[str] = None):
+    """Build a new embeddings client, Chroma client and collection wrapper."""
+    client = _open_client()
+    return client, _open_collection(client, _open_embeddings(), namespace)
+
+def init_vectorstore(namespace: Optional[str] = None):
+    """Open a namespace's vector store. Called for the default namespace at application startup."""
+    global _client, _embeddings
+    namespace = normalize_namespace(namespace)
+    with _lock:
+        if _client is None:
+            _client = _open_client()
+            _embeddings = _open_embeddings()
+        if namespace not in _stores:
+            _stores[namespace] = _open_collection(_client, _embeddings, namespace)
+        return _stores[namespace]
+
+def get_vectorstore(namespace: Optional[str] = None):
+    """Return a namespace's shared vector store, opening it on first use."""
+    store = _stores.get(namespace or DEFAULT_NAMESPACE)
+    if store is None:
+        return init_vectorstore(namespace)
+    return store
+
+def list_namespaces() -> List[str]:
+    """Namespaces with a collection for the configured embedding model."""
+    init_vectorstore()
+    namespaces = []
+    for name in _client.list_collections():
+        namespace = (_client.get_collection(name).metadata or {}).get("namespace", DEFAULT_NAMESPACE)
+        # Skip collections of other embedding models
+        if _NAMESPACE_RE.match(namespace) and collection_name(namespace) == name:
+            namespaces.append(namespace)
+    return sorted(namespaces)
+
+def _hnsw_parameters(metadata: Optional[Dict[str, Any]]) -> Dict[str, int]:
+    metadata = {**_CHROMA_HNSW_DEFAULTS, **(metadata or {})}
+    return {key[len("hnsw:"):]: metadata[key] for key in _CHROMA_HNSW_DEFAULTS}
+
+def index_stats(namespace: Optional[str] = None) -> Dict[str, Any]:
+    """Size and HNSW parameters of a namespace's collection, and whether they match settings."""
+    collection = get_vectorstore(namespace)._collection
+    built = _hnsw_parameters(collection.metadata)
+    wanted = _hnsw_parameters(collection_metadata(namespace))
+    return {
+        "namespace": normalize_namespace(namespace),
+        "collection": collection.name,
+        "chunks": collection.count(),
+        "hnsw": built,
+        # M and construction_ef are fixed when the graph is built
+        "needs_rebuild": any(built[key] != wanted[key] for key in ("M", "construction_ef")),
+        "needs_compact": built["search_ef"] != wanted["search_ef"],
+    }
+
+def _directory_size(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+
+def _chroma_sqlite():
+    """Chroma's internal SQLite component, or a RuntimeError if this chromadb does not have it."""
+    import chromadb
+
+    version = chromadb.__version__
+    if not version.startswith(_CHROMA_INTERNALS_VERSIONS):
+        raise RuntimeError(
+            f"Index compaction relies on chromadb internals; chromadb {version} is not supported "
+            f"(supported: {', '.join(v + 'x' for v in _CHROMA_INTERNALS_VERSIONS)})"
+        )
+    try:
+        from chromadb.db.impl.sqlite import SqliteDB
+
+        db = _client._system.instance(SqliteDB)
+    except (ImportError, AttributeError) as e:
+        raise RuntimeError(f"Index compaction is not available with chromadb {version}: {str(e)}")
+    if not (hasattr(db, "purge_log") and hasattr(db, "vacuum")):
+        raise RuntimeError(f"Index compaction is not available with chromadb {version}: no log purge or vacuum")
+    return db
+
+def compact_index(namespace: Optional[str] = None) -> Dict[str, Any]:
+    """Apply HNSW_SEARCH_EF to a namespace's collection and purge its write log.
+
+    The new search_ef is used once the collection is reopened. Follow with
+    vacuum_vectorstore() to give the purged space back to the filesystem.
+    """
+    collection = get_vectorstore(namespace)._collection
+    sqlite = _chroma_sqlite()
+    # modify() replaces the whole metadata, so send the existing keys along
+    collection.modify(metadata={
+        **(collection.metadata or {}),
+        "namespace": normalize_namespace(namespace),
+        "hnsw:search_ef": settings.HNSW_SEARCH_EF,
+    })
+    # Drops log entries every segment has already applied
+    sqlite.purge_log(collection_id=collection.id)
+    return index_stats(namespace)
+
+def vacuum_vectorstore() -> Dict[str, int]:
+    """VACUUM Chroma's SQLite database. Blocks reads and writes; run it with the server stopped."""
+    init_vectorstore()
+    sqlite = _chroma_sqlite()
+    before = _directory_size(settings.VECTORSTORE_DIR)
+    sqlite.vacuum()
+    return {"bytes_before": before, "bytes_after": _directory_size(settings.VECTORSTORE_DIR)}
+
+def rebuild_index(namespace: Optional[str] = None, batch_size: int = 1000) -> Dict[str, Any]:
+    """Rebuild a namespace's HNSW index with the current HNSW settings.
+
+    Stored vectors are copied into a fresh collection, so nothing is
+    re-embedded, and the fresh graph also drops the entries of deleted
+    chunks. The old collection is renamed aside and only deleted once the
+    new one has taken its name, so a failure at any point leaves a complete
+    index under the namespace. Run it with the server stopped.
+    """
+    namespace = normalize_namespace(namespace)
+    name = collection_name(namespace)
+    old = get_vectorstore(namespace)._collection
+    suffix = uuid.uuid4().hex[:16]
+    new = _client.create_collection(f"rebuild-{suffix}", metadata=collection_metadata(namespace))
+    try:
+        offset = 0
+        while True:
+            batch = old.get(include=["embeddings", "documents", "metadatas"], limit=batch_size, offset=offset)
+            if not batch["ids"]:
+                break
+            new.add(
+                ids=batch["ids"],
+                embeddings=batch["embeddings"],
+                documents=batch["documents"],
+                metadatas=batch["metadatas"]
+            )
+            offset += len(batch["ids"])
+    except BaseException:
+        _client.delete_collection(new.name)
+        raise
+    with _lock:
+        aside = f"replaced-{suffix}"
+        old.modify(name=aside)
+        try:
+            new.modify(name=name)
+        except BaseException:
+            old.modify(name=name)
+            _client.delete_collection(new.name)
+            raise
+        # The wrapper still points at the old collection
+        _stores.pop(namespace, None)
+        _client.delete_collection(aside)
+    return index_stats(namespace)
+
+def embedding_cache() -> Optional[CachedEmbeddings]:
+    """The shared embedding cache, if the stores are open and caching is on."""
+    return _embeddings if isinstance(_embeddings, CachedEmbeddings) else None
+
+def corpus_version() -> int:
+    return _corpus_version
+
+def bump_corpus_version() -> int:
+    """Mark the indexed corpus as changed. Call after adding or removing chunks."""
+    global _corpus_version
+    with _lock:
+        _corpus_version += 1
+        return _corpus_version
+
+def close_vectorstore() -> None:
+    """Release the shared vector stores. Called at application shutdown."""
+    global _embeddings, _client
+    with _lock:
+        # Closes the embedding cache and stops local inference threads
+        if hasattr(_embeddings, "close"):
+            _embeddings.close()
+        if _client is not None:
+            # chromadb keeps one System per path alive for the whole process;
+            # stop it so SQLite and the HNSW segments are flushed and closed.
+            from chromadb.api.client import SharedSystemClient
+
+            _client._system.stop()
+            SharedSystemClient.clear_system_cache()
+        _stores.clear()
+        _embeddings = None
+        _client = None
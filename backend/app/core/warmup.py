@@ -0,0 +1,81 @@
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Sequence
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Seconds each startup step took, exported on /metrics
+startup_timings: Dict[str, float] = {}
+
+@contextmanager
+def startup_step(name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_timings[name] = time.perf_counter() - start
+        logger.info(f"Startup step {name} took {startup_timings[name]:.2f}s")
+
+def _load_hnsw() -> None:
+    """Run one vector query so Chroma loads the default namespace's HNSW index into memory."""
+    from app.core.vectorstore import get_vectorstore
+
+    vectorstore = get_vectorstore()
+    # Query with a stored vector so no embedding call is needed
+    stored = vectorstore.get(limit=1, include=["embeddings"])
+    if stored["ids"]:
+        vectorstore.similarity_search_by_vector(list(stored["embeddings"][0]), k=1)
+
+def _build_llms() -> None:
+    """Import the provider SDK and build the default model's cached clients."""
+    from app.core.llm import get_llm
+
+    get_llm(
+        settings.DEFAULT_MODEL,
+        temperature=0.7,
+        streaming=True,
+        fallbacks=settings.LLM_FALLBACK_MODELS,
+        hedge_delay=settings.LLM_HEDGE_DELAY
+    )
+    get_llm(settings.DEFAULT_MODEL, temperature=0)
+
+def _build_agent() -> None:
+    """Build a throwaway agent, importing LangChain's agent modules and loading the tokenizer."""
+    from app.chains.agent import create_agent
+    from app.chains.memory import count_tokens
+
+    create_agent("warmup", settings.DEFAULT_MODEL)
+    count_tokens("warmup", settings.DEFAULT_MODEL)
+
+def _start_parsers() -> None:
+    """Start the ingestion parser processes before the first upload needs them."""
+    from app.core.ingestion import ingestion_queue
+
+    ingestion_queue.preload()
+
+WARMUP_STEPS: Dict[str, Callable[[], None]] = {
+    "hnsw": _load_hnsw,
+    "llm": _build_llms,
+    "agent": _build_agent,
+    "parser": _start_parsers,
+}
+
+async def warmup(steps: Sequence[str]) -> None:
+    """Run the named warmup steps in order so the first request is not the slow one.
+
+    A failing step is logged and skipped; whatever it would have prepared
+    is then done lazily by the first request that needs it.
+    """
+    for name in steps:
+        step = WARMUP_STEPS.get(name)
+        if step is None:
+            logger.warning(f"Unknown warmup step {name}. Supported: {', '.join(WARMUP_STEPS)}")
+            continue
+        try:
+            with startup_step(f"warmup_{name}"):
+                await asyncio.to_thread(step)
+        except Exception as e:
+            logger.warning(f"Warmup step {name} failed: {str(e)}")
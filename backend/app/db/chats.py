@@ -0,0 +1,198 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+from sqlalchemy import func, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.metrics import db_commit_duration
+from app.core.vectorstore import DEFAULT_NAMESPACE
+from app.db.database import AsyncSessionLocal
+from app.db.models import Chat, ChatSession, SESSION_TITLE_LENGTH
+
+logger = logging.getLogger(__name__)
+
+def upsert_session(session_id: str, message: str, timestamp: datetime, count: int = 1):
+    """Statement creating or updating a session's summary row."""
+    statement = insert(ChatSession).values(
+        id=session_id,
+        title=message[:SESSION_TITLE_LENGTH],
+        created_at=timestamp,
+        last_activity=timestamp,
+        message_count=count,
+        namespace=DEFAULT_NAMESPACE
+    )
+    return statement.on_conflict_do_update(
+        index_elements=[ChatSession.id],
+        set_={
+            # Sessions opened by session_namespace() have no title yet
+            "title": func.coalesce(ChatSession.title, statement.excluded.title),
+            "last_activity": statement.excluded.last_activity,
+            "message_count": ChatSession.message_count + statement.excluded.message_count,
+        }
+    )
+
+async def session_namespace(db: AsyncSession, session_id: str, requested: Optional[str] = None) -> str:
+    """Namespace a session searches.
+
+    The first request of a session fixes its namespace: the requested one,
+    or the default. Later requests get that namespace back, whatever they
+    ask for; callers reject a request whose namespace differs.
+    """
+    query = select(ChatSession.namespace).where(ChatSession.id == session_id)
+    namespace = (await db.execute(query)).scalar_one_or_none()
+    if namespace is None:
+        now = datetime.utcnow()
+        statement = insert(ChatSession).values(
+            id=session_id,
+            created_at=now,
+            last_activity=now,
+            message_count=0,
+            namespace=requested or DEFAULT_NAMESPACE
+        )
+        # A concurrent first request may have opened the session already
+        await db.execute(statement.on_conflict_do_nothing(index_elements=[ChatSession.id]))
+        await db.commit()
+        namespace = (await db.execute(query)).scalar_one()
+    return namespace or DEFAULT_NAMESPACE
+
+async def _write(db: AsyncSession, chats: List[Chat]) -> None:
+    """Insert messages and update their sessions in one transaction."""
+    # One upsert per session: first message (title if new), latest time, count
+    sessions: Dict[str, Tuple[str, datetime, int]] = {}
+    for chat in chats:
+        first, _, count = sessions.get(chat.session_id, (chat.message, chat.timestamp, 0))
+        sessions[chat.session_id] = (first, chat.timestamp, count + 1)
+    with db_commit_duration.time(operation="save_chat"):
+        db.add_all(chats)
+        for session_id, (first, last, count) in sessions.items():
+            await db.execute(upsert_session(session_id, first, last, count))
+        await db.commit()
+
+class ChatWriter:
+    """Write-behind queue for chat messages with group commit.
+
+    Messages are timestamped when queued and written in batches: a batch is
+    flushed when it reaches max_batch messages or flush_interval seconds
+    after its first message, whichever comes first. stop() flushes whatever
+    is still queued.
+    """
+
+    def __init__(self, flush_interval: float, max_batch: int):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.written = 0
+        self.batches = 0
+        self._buffer: List[Chat] = []
+        self._pending = asyncio.Event()
+        self._full = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def queued(self) -> int:
+        return len(self._buffer)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            # Never cancel in the middle of a write, or its batch would be lost
+            async with self._flush_lock:
+                self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    def enqueue(self, session_id: str, message: str, is_user: bool) -> None:
+        self._buffer.append(Chat(
+            session_id=session_id,
+            message=message,
+            is_user=is_user,
+            timestamp=datetime.utcnow()
+        ))
+        self._pending.set()
+        if len(self._buffer) >= self.max_batch:
+            self._full.set()
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            while self._buffer:
+                batch, self._buffer = self._buffer[:self.max_batch], self._buffer[self.max_batch:]
+                try:
+                    async with AsyncSessionLocal() as db:
+                        await _write(db, batch)
+                except Exception as e:
+                    # Put the batch back so the next flush retries it
+                    logger.error(f"Failed to persist {len(batch)} chat messages: {str(e)}", exc_info=True)
+                    self._buffer = batch + self._buffer
+                    return
+                self.written += len(batch)
+                self.batches += 1
+            self._pending.clear()
+            self._full.clear()
+
+    async def _run(self) -> None:
+        while True:
+            await self._pending.wait()
+            # Give concurrent writers a moment to join this batch
+            try:
+                await asyncio.wait_for(self._full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+            if self._buffer:
+                # The flush failed; back off before retrying
+                await asyncio.sleep(self.flush_interval * 10)
+
+chat_writer = ChatWriter(
+    flush_interval=settings.CHAT_FLUSH_INTERVAL,
+    max_batch=settings.CHAT_FLUSH_BATCH
+)
+
+async def save_chat(db: AsyncSession, session_id: str, message: str, is_user: bool):
+    """Save a chat message and update its session summary.
+
+    While the write-behind writer runs (inside the API server) the message is
+    queued for the next group commit; otherwise it is written right away.
+    """
+    if chat_writer.running:
+        chat_writer.enqueue(session_id, message, is_user)
+        return
+    await _write(db, [Chat(
+        session_id=session_id,
+        message=message,
+        is_user=is_user,
+        timestamp=datetime.utcnow()
+    )])
+
+# Writes started by save_chat_nowait, referenced until they finish
+_detached_writes: Set[asyncio.Task] = set()
+
+async def _write_detached(chats: List[Chat]) -> None:
+    async with AsyncSessionLocal() as db:
+        await _write(db, chats)
+
+def save_chat_nowait(session_id: str, message: str, is_user: bool) -> None:
+    """Save a chat message without awaiting, for code that may already be cancelled.
+
+    Queued for the write-behind writer when it runs, otherwise written by a
+    background task.
+    """
+    if chat_writer.running:
+        chat_writer.enqueue(session_id, message, is_user)
+        return
+    task = asyncio.get_running_loop().create_task(_write_detached([Chat(
+        session_id=session_id,
+        message=message,
+        is_user=is_user,
+        timestamp=datetime.utcnow()
+    )]))
+    _detached_writes.add(task)
+    task.add_done_callback(_detached_writes.discard)
@@ -1,16 +1,93 @@
+from sqlalchemy import event, inspect, text
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
+from app.core.vectorstore import DEFAULT_NAMESPACE
+from app.db.models import Base, SESSION_TITLE_LENGTH
 
 # Convert SQLite URL to async version
 DATABASE_URL = settings.DATABASE_URL.replace("sqlite:///", "sqlite+aiosqlite:///")
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+engine_options = {"echo": settings.DATABASE_ECHO}
+if ":memory:" not in DATABASE_URL:
+    engine_options.update(
+        pool_size=settings.DATABASE_POOL_SIZE,
+        max_overflow=settings.DATABASE_MAX_OVERFLOW,
+        pool_pre_ping=True
+    )
+
+engine = create_async_engine(DATABASE_URL, **engine_options)
+
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine.sync_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL lets readers proceed during writes; NORMAL only fsyncs at
+        # checkpoints, which is safe in WAL mode
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout=5000")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA cache_size=-16000")
+        cursor.close()
+
 AsyncSessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
+def _add_missing_columns(conn) -> None:
+    """Add columns introduced after a table was first created.
+
+    create_all() never alters existing tables, so databases created by an
+    older version would otherwise be missing newer model columns. Rows that
+    predate a column are left NULL.
+    """
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=conn.dialect)
+            conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {column_type}'))
+        # Indexes are likewise only created together with a new table
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+def _backfill_sessions(conn) -> None:
+    """Populate the sessions table from chats written before it existed."""
+    if conn.execute(text("SELECT 1 FROM sessions LIMIT 1")).first() is not None:
+        return
+    conn.execute(text(f"""
+        INSERT INTO sessions (id, title, created_at, last_activity, message_count)
+        SELECT c.session_id,
+               substr((SELECT first.message FROM chats AS first
+                       WHERE first.session_id = c.session_id
+                       ORDER BY first.timestamp, first.id LIMIT 1), 1, {SESSION_TITLE_LENGTH}),
+               min(c.timestamp), max(c.timestamp), count(*)
+        FROM chats AS c
+        GROUP BY c.session_id
+    """))
+
+def _backfill_namespaces(conn) -> None:
+    """Put sessions and files from before namespaces existed in the default namespace."""
+    for table in ("sessions", "files"):
+        conn.execute(
+            text(f"UPDATE {table} SET namespace = :namespace WHERE namespace IS NULL"),
+            {"namespace": DEFAULT_NAMESPACE}
+        )
+
+async def init_db() -> None:
+    """Create tables and bring existing ones up to date with the models."""
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_add_missing_columns)
+        await conn.run_sync(_backfill_sessions)
+        await conn.run_sync(_backfill_namespaces)
+
 async def get_db():
     async with AsyncSessionLocal() as session:
         try:
             yield session
         finally:
-            await session.close()
\ No newline at end of file
+            await session.close()
@@ -1,9 +1,12 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Index
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
 
 Base = declarative_base()
 
+# Session titles are the first message, cut to this many characters
+SESSION_TITLE_LENGTH = 50
+
 class Chat(Base):
     __tablename__ = "chats"
 
@@ -13,10 +16,34 @@ class Chat(Base):
     is_user = Column(Boolean, default=True)
     timestamp = Column(DateTime, default=datetime.utcnow)
 
+    # Serves history pages and agent rehydration without a sort
+    __table_args__ = (Index("ix_chats_session_timestamp", "session_id", "timestamp"),)
+
+class ChatSession(Base):
+    """Per-session summary kept up to date as messages are written."""
+    __tablename__ = "sessions"
+
+    id = Column(String, primary_key=True)
+    title = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_activity = Column(DateTime, default=datetime.utcnow, index=True)
+    message_count = Column(Integer, default=0)
+    # Namespace whose documents the session searches, fixed by its first request
+    namespace = Column(String, index=True)
+
 class File(Base):
     __tablename__ = "files"
 
     id = Column(Integer, primary_key=True, index=True)
     filename = Column(String)
     filepath = Column(String)
-    upload_time = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    # Namespace the file is indexed in
+    namespace = Column(String, index=True)
+    upload_time = Column(DateTime, default=datetime.utcnow)
+    # Stable across re-uploads of the same filename; tags the file's chunks
+    document_id = Column(String, index=True)
+    content_hash = Column(String)
+    # Ingestion state: pending -> processing -> ready | failed
+    status = Column(String, default="pending", index=True)
+    chunk_count = Column(Integer, default=0)
+    error = Column(Text, nullable=True)
\ No newline at end of file
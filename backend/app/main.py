@@ -1,8 +1,16 @@
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.api import chat, files
-from app.db.database import engine
-from app.db.models import Base
+from app.api import chat, files, metrics
+from app.core.config import settings
+from app.core.metrics import setup_tracing
+from app.db.chats import chat_writer
+from app.db.database import engine, init_db
+from app.core.ingestion import ingestion_queue
+from app.core.llm import close_llm_clients
+from app.core.retrieval import lexical_indexes
+from app.core.vectorstore import init_vectorstore, close_vectorstore
+from app.core.warmup import startup_step, warmup
 
 app = FastAPI(title="AI Chat API")
 
@@ -13,14 +21,40 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Retry-After"],
 )
 
 # Include routers
 app.include_router(chat.router, prefix="/chat", tags=["chat"])
 app.include_router(files.router, prefix="/files", tags=["files"])
+app.include_router(metrics.router, tags=["metrics"])
+
+# Optional OpenTelemetry tracing (OTEL_ENABLED)
+setup_tracing(app)
 
 # Create database tables on startup
 @app.on_event("startup")
 async def startup():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
\ No newline at end of file
+    with startup_step("database"):
+        await init_db()
+    with startup_step("vectorstore"):
+        # Open the default namespace's store once instead of on the first
+        # request; other namespaces are opened when first used
+        await asyncio.to_thread(init_vectorstore)
+        # The lexical index lives in memory; rebuild it from the stored chunks
+        await asyncio.to_thread(lexical_indexes.get)
+    ingestion_queue.start()
+    # Files a previous process was still ingesting when it stopped
+    await ingestion_queue.recover()
+    chat_writer.start()
+    # Load what the first request would otherwise wait for (WARMUP_STEPS)
+    await warmup(settings.WARMUP_STEPS)
+
+@app.on_event("shutdown")
+async def shutdown():
+    await ingestion_queue.stop()
+    # Persist every queued chat message before the engine goes away
+    await chat_writer.stop()
+    await engine.dispose()
+    close_vectorstore()
+    await close_llm_clients()
\ No newline at end of file
@@ -0,0 +1,82 @@
+"""Chat messages persisted per second under concurrent sessions.
+
+Runs N sessions that each save M messages as fast as they can, once with a
+commit per message (the old save_chat) and once through the write-behind
+ChatWriter, against a fresh SQLite database using the app's tuned engine.
+
+    python -m benchmarks.chat_persistence --sessions 50 --messages 40
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+async def _per_message_commit(session_id: str, messages: int):
+    from app.db.chats import _write
+    from app.db.database import AsyncSessionLocal
+    from app.db.models import Chat
+    from datetime import datetime
+
+    async with AsyncSessionLocal() as db:
+        for i in range(messages):
+            await _write(db, [Chat(session_id=session_id, message=f"message {i}", is_user=i % 2 == 0, timestamp=datetime.utcnow())])
+
+async def _write_behind(session_id: str, messages: int):
+    from app.db.chats import chat_writer
+
+    for i in range(messages):
+        chat_writer.enqueue(session_id, f"message {i}", i % 2 == 0)
+        # Yield like a request handler would between messages
+        await asyncio.sleep(0)
+
+async def _measure(label: str, worker, sessions: int, messages: int, after=None):
+    start = time.perf_counter()
+    await asyncio.gather(*[worker(f"{label}-{s}", messages) for s in range(sessions)])
+    if after is not None:
+        await after()
+    elapsed = time.perf_counter() - start
+    total = sessions * messages
+    return {"messages": total, "elapsed_s": round(elapsed, 3), "messages_per_s": round(total / elapsed, 1)}
+
+async def _main(args):
+    from sqlalchemy import func, select
+    from app.db.chats import chat_writer
+    from app.db.database import AsyncSessionLocal, engine, init_db
+    from app.db.models import Chat
+
+    await init_db()
+    results = {
+        "commit_per_message": await _measure("direct", _per_message_commit, args.sessions, args.messages),
+    }
+
+    chat_writer.start()
+    results["write_behind"] = await _measure("batched", _write_behind, args.sessions, args.messages, after=chat_writer.stop)
+    results["write_behind"]["batches"] = chat_writer.batches
+
+    async with AsyncSessionLocal() as db:
+        stored = (await db.execute(select(func.count()).select_from(Chat))).scalar()
+    await engine.dispose()
+
+    print(json.dumps({
+        "sessions": args.sessions,
+        "messages_per_session": args.messages,
+        "rows_stored": stored,
+        **results,
+    }, indent=2))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=40)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-chat-")
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{workdir}/bench.db")
+
+    asyncio.run(_main(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+"""Offline load test of the chat and upload endpoints.
+
+Drives a mix of /chat/stream, /chat/send, /chat/history and /files/upload
+requests from concurrent clients through the ASGI app (no network), plus
+streams whose client is gone before the first byte (abandon). The
+LLM and embeddings are deterministic fakes (LLM_BACKEND=fake,
+EMBEDDING_BACKEND=fake) with a configurable first-token latency and token
+rate, so the numbers measure this service rather than OpenAI.
+
+Reports p50/p95/p99 latency per endpoint, time to first token and tokens/sec
+for streams, overall requests/sec, peak RSS and event-loop lag as JSON with
+sorted keys, so runs can be diffed between releases. Exits non-zero if a
+request other than an abandoned one did not get 200, or if an agent slot
+is still held once every request has finished.
+
+    python -m benchmarks.load_test --concurrency 20 --requests 400 > before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+
+def _percentiles(values, scale=1000.0):
+    if not values:
+        return {"p50": None, "p95": None, "p99": None}
+    values = sorted(values)
+    pick = lambda q: round(values[min(len(values) - 1, int(q * len(values)))] * scale, 2)
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99)}
+
+def _parse_mix(text: str):
+    mix = {}
+    for part in text.split(","):
+        name, weight = part.split("=")
+        mix[name.strip()] = float(weight)
+    unknown = set(mix) - {"stream", "send", "history", "upload", "abandon"}
+    if unknown:
+        raise ValueError(f"unknown operations in --mix: {', '.join(sorted(unknown))}")
+    return mix
+
+async def _monitor(stop: asyncio.Event, interval: float, lags: list, rss: list):
+    import psutil
+
+    process = psutil.Process()
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+        rss.append(process.memory_info().rss)
+
+async def _asgi_get_stream(app, path: str, params: dict):
+    """GET path from the ASGI app, yielding (status, body chunk) as each chunk is sent.
+
+    httpx's ASGITransport buffers the whole response body, which would hide
+    time to first token, so streams are read straight off the ASGI interface.
+    """
+    from urllib.parse import urlencode
+
+    chunks: asyncio.Queue = asyncio.Queue()
+    disconnected = asyncio.Event()
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+        "query_string": urlencode(params).encode(), "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 0), "server": ("bench", 80),
+    }
+
+    # The (empty) request body, then a disconnect once we stop reading
+    requests = [{"type": "http.request", "body": b"", "more_body": False}]
+
+    async def receive():
+        if requests:
+            return requests.pop()
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            chunks.put_nowait(("status", message["status"]))
+        elif message["type"] == "http.response.body":
+            chunks.put_nowait(("body", message.get("body", b"")))
+            if not message.get("more_body", False):
+                chunks.put_nowait(("end", None))
+
+    task = asyncio.create_task(app(scope, receive, send))
+    try:
+        status = None
+        while True:
+            kind, value = await chunks.get()
+            if kind == "status":
+                status = value
+            elif kind == "body":
+                yield status, value
+            else:
+                break
+        await task
+    finally:
+        disconnected.set()
+        if not task.done():
+            task.cancel()
+
+async def _asgi_abandon(app, path: str, params: dict):
+    """GET path as a client that disconnects before the response starts.
+
+    Uses ASGI spec 2.4, where a disconnect surfaces as a failing send, like
+    a server writing to a closed socket. Returns the exception the app
+    raised, if any.
+    """
+    from urllib.parse import urlencode
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0", "spec_version": "2.4"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+        "query_string": urlencode(params).encode(), "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 0), "server": ("bench", 80),
+    }
+    requests = [{"type": "http.request", "body": b"", "more_body": False}]
+
+    async def receive():
+        if requests:
+            return requests.pop()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        raise OSError("client went away")
+
+    try:
+        await app(scope, receive, send)
+    except Exception as e:
+        return type(e).__name__
+    return None
+
+class LoadTest:
+    def __init__(self, app, client, args, rng: random.Random):
+        self.app = app
+        self.client = client
+        self.args = args
+        self.rng = rng
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.ttft = []
+        self.token_rates = []
+        self.tokens = 0
+        self.sessions = []
+
+    def _question(self, i: int) -> str:
+        if self.args.question_pool:
+            i = self.rng.randrange(self.args.question_pool)
+        return f"What does section {i} of the notes say about bearing capacity?"
+
+    async def stream(self, i: int):
+        session_id = f"bench-{i}"
+        start = time.perf_counter()
+        first, tokens, status = None, 0, None
+        params = {"message": self._question(i), "session_id": session_id}
+        async for status, chunk in _asgi_get_stream(self.app, "/chat/stream", params):
+            count = chunk.count(b'data: {"content"')
+            if count and first is None:
+                first = time.perf_counter()
+            tokens += count
+        end = time.perf_counter()
+        if first is not None:
+            self.ttft.append(first - start)
+            if tokens > 1 and end > first:
+                self.token_rates.append((tokens - 1) / (end - first))
+        self.tokens += tokens
+        self.sessions.append(session_id)
+        return status
+
+    async def send(self, i: int):
+        session_id = f"bench-{i}"
+        response = await self.client.post("/chat/send", json={"message": self._question(i), "session_id": session_id})
+        self.sessions.append(session_id)
+        return response.status_code
+
+    async def abandon(self, i: int):
+        # A session with earlier turns, so the run is its own rather than a coalesced one
+        session_id = self.rng.choice(self.sessions) if self.sessions else f"bench-{i}"
+        params = {"message": self._question(i), "session_id": session_id}
+        return await _asgi_abandon(self.app, "/chat/stream", params) or "completed"
+
+    async def history(self, i: int):
+        session_id = self.rng.choice(self.sessions) if self.sessions else "default"
+        response = await self.client.get("/chat/history", params={"session_id": session_id, "limit": 50})
+        return response.status_code
+
+    async def upload(self, i: int):
+        lines = [f"Note {i}.{n}: the bearing capacity of layer {n} is {self.rng.randint(50, 500)} kPa." for n in range(200)]
+        files = {"file": (f"bench-{i}.txt", "\n".join(lines).encode("utf-8"), "text/plain")}
+        response = await self.client.post("/files/upload", files=files)
+        return response.status_code
+
+    async def run(self, operations):
+        queue: asyncio.Queue = asyncio.Queue()
+        for item in operations:
+            queue.put_nowait(item)
+
+        async def worker():
+            while not queue.empty():
+                i, name = queue.get_nowait()
+                start = time.perf_counter()
+                try:
+                    status = await getattr(self, name)(i)
+                except Exception as e:
+                    status = type(e).__name__
+                self.latencies[name].append(time.perf_counter() - start)
+                self.statuses[name][str(status)] += 1
+
+        await asyncio.gather(*[worker() for _ in range(self.args.concurrency)])
+
+async def _main(args):
+    import httpx
+    from app.main import app
+
+    rng = random.Random(args.seed)
+    mix = _parse_mix(args.mix)
+    names, weights = list(mix), list(mix.values())
+    operations = [(i, rng.choices(names, weights)[0]) for i in range(args.requests)]
+
+    await app.router.startup()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        test = LoadTest(app, client, args, rng)
+        # Give retrieval something to find
+        await test.upload(-1)
+
+        lags, rss = [], []
+        stop = asyncio.Event()
+        monitor = asyncio.create_task(_monitor(stop, 0.01, lags, rss))
+        start = time.perf_counter()
+        await test.run(operations)
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await monitor
+    await app.router.shutdown()
+
+    from app.chains.limits import agent_limits
+    # Every request is over, so no agent slot may still be held
+    leaked = {name: stats["active"] for name, stats in agent_limits.stats().items() if stats["active"]}
+
+    endpoints = {
+        name: {
+            "count": len(latencies),
+            "status_codes": dict(test.statuses[name]),
+            "latency_ms": _percentiles(latencies),
+        }
+        for name, latencies in sorted(test.latencies.items())
+    }
+    report = {
+        "config": {
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "mix": mix,
+            "question_pool": args.question_pool,
+            "llm_latency_s": args.latency,
+            "llm_tokens_per_second": args.tokens_per_second,
+            "llm_answer_tokens": args.answer_tokens,
+            "seed": args.seed,
+        },
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_s": round(args.requests / elapsed, 1),
+        "endpoints": endpoints,
+        "stream": {
+            "ttft_ms": _percentiles(test.ttft),
+            "tokens_per_s_per_stream": _percentiles(test.token_rates, scale=1.0),
+            "tokens_per_s_total": round(test.tokens / elapsed, 1),
+        },
+        "process": {
+            "rss_mb_peak": round(max(rss, default=0) / 2 ** 20, 1),
+            "rss_mb_end": round((rss[-1] if rss else 0) / 2 ** 20, 1),
+            "loop_lag_ms": {**_percentiles(lags), "max": round(max(lags, default=0) * 1000, 2)},
+        },
+        "agent_slots_leaked": leaked,
+    }
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+    failed = {
+        name: codes for name, codes in report["endpoints"].items()
+        if name != "abandon" and set(codes["status_codes"]) != {"200"}
+    }
+    if failed:
+        raise SystemExit(f"Requests did not all succeed: {failed}")
+    if leaked:
+        raise SystemExit(f"Agent slots still held after the run: {leaked}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--mix", default="stream=60,send=20,history=15,upload=5,abandon=5",
+                        help="relative weights of stream, send, history, upload and abandon requests")
+    parser.add_argument("--question-pool", type=int, default=0,
+                        help="draw questions from this many distinct ones (0: every question is unique)")
+    parser.add_argument("--latency", type=float, default=0.2, help="fake LLM seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--answer-tokens", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-load-")
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{workdir}/bench.db")
+    os.environ.setdefault("UPLOAD_DIR", os.path.join(workdir, "uploads"))
+    os.environ.setdefault("VECTORSTORE_DIR", os.path.join(workdir, "vectorstore"))
+    os.environ.setdefault("EMBEDDING_CACHE_DIR", os.path.join(workdir, "embedding_cache"))
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ["EMBEDDING_BACKEND"] = "fake"
+    os.environ["FAKE_LLM_LATENCY"] = str(args.latency)
+    os.environ["FAKE_LLM_TOKENS_PER_SECOND"] = str(args.tokens_per_second)
+    os.environ["FAKE_LLM_ANSWER_TOKENS"] = str(args.answer_tokens)
+    # Let the limiter admit every client; the test measures the service, not the queue
+    os.environ.setdefault("AGENT_CONCURRENCY", str(args.concurrency))
+    os.makedirs(os.environ["UPLOAD_DIR"], exist_ok=True)
+
+    asyncio.run(_main(args))
+
+if __name__ == "__main__":
+    main()
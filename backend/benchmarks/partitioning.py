@@ -0,0 +1,128 @@
+"""Query latency vs. corpus size, with one shared collection and with per-namespace collections.
+
+Synthetic chunks are spread over --namespaces namespaces and indexed two
+ways: all in one collection tagged with their namespace, and in one
+collection (and BM25 index) per namespace, as the app stores them. Each
+query searches a single namespace: the shared layout has to filter by
+namespace (and is also timed unfiltered, which returns other namespaces'
+chunks), the partitioned layout only searches that namespace's index.
+Collections are created with the configured HNSW_* parameters.
+
+Embeddings are deterministic fakes, so only latency is meaningful.
+
+    python -m benchmarks.partitioning --sizes 1000,4000,16000 --namespaces 8
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+def _chunks(count: int, namespaces: int, rng: random.Random, vocabulary):
+    for i in range(count):
+        text = " ".join(rng.choice(vocabulary) for _ in range(60))
+        yield f"chunk-{i}", text, f"ns{i % namespaces}"
+
+def _latency(retriever, queries):
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        retriever.invoke(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))], 2),
+    }
+
+def _run(size: int, args, embeddings):
+    import chromadb
+    from langchain_chroma import Chroma
+    from langchain_core.documents import Document
+    from app.core.retrieval import BM25Index, HybridRetriever
+    from app.core.vectorstore import collection_metadata
+
+    rng = random.Random(args.seed)
+    vocabulary = [f"term{i}" for i in range(args.vocabulary)]
+    chunks = list(_chunks(size, args.namespaces, rng, vocabulary))
+    client = chromadb.PersistentClient(path=tempfile.mkdtemp(prefix="bench-partitioning-"))
+
+    def store(name, namespace):
+        return Chroma(client=client, collection_name=name, embedding_function=embeddings,
+                      collection_metadata=collection_metadata(namespace))
+
+    def fill(vectorstore, index, rows):
+        for start in range(0, len(rows), 1000):
+            batch = rows[start:start + 1000]
+            ids = [chunk_id for chunk_id, _, _ in batch]
+            docs = [Document(page_content=text, metadata={"namespace": ns}) for _, text, ns in batch]
+            vectorstore.add_documents(docs, ids=ids)
+            index.add(ids, docs)
+
+    start = time.perf_counter()
+    shared, shared_index = store("shared", None), BM25Index()
+    fill(shared, shared_index, chunks)
+    shared_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    partitions = {}
+    for n in range(args.namespaces):
+        namespace = f"ns{n}"
+        partitions[namespace] = (store(f"partition-{n}", namespace), BM25Index())
+        fill(*partitions[namespace], [row for row in chunks if row[2] == namespace])
+    partitioned_s = time.perf_counter() - start
+
+    namespace = "ns0"
+    queries = [" ".join(rng.choice(vocabulary) for _ in range(6)) for _ in range(args.queries)]
+    where = {"namespace": namespace}
+    options = {"k": args.k, "fetch_k": args.fetch_k}
+    layouts = {
+        "shared_unfiltered": dict(vectorstore=shared, index=shared_index),
+        "shared_filtered": dict(vectorstore=shared, index=shared_index, where=where),
+        "partitioned": dict(vectorstore=partitions[namespace][0], index=partitions[namespace][1]),
+    }
+    results = {
+        name: {
+            "dense": _latency(HybridRetriever(**layout, **options, hybrid=False), queries),
+            "hybrid": _latency(HybridRetriever(**layout, **options), queries),
+        }
+        for name, layout in layouts.items()
+    }
+    return {
+        "chunks": size,
+        "chunks_per_namespace": size // args.namespaces,
+        "index_s": {"shared": round(shared_s, 2), "partitioned": round(partitioned_s, 2)},
+        "results": results,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,4000,16000", help="comma-separated total chunk counts")
+    parser.add_argument("--namespaces", type=int, default=8)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--vocabulary", type=int, default=5000, help="distinct terms in the synthetic text")
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--fetch-k", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+    # Every query is distinct; keep coalescing bookkeeping out of the timings
+    os.environ.setdefault("COALESCE_REQUESTS", "false")
+
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from app.core.config import settings
+
+    embeddings = DeterministicFakeEmbedding(size=settings.FAKE_EMBEDDING_SIZE)
+    report = {
+        "namespaces": args.namespaces,
+        "queries": args.queries,
+        "hnsw": {"M": settings.HNSW_M, "construction_ef": settings.HNSW_CONSTRUCTION_EF, "search_ef": settings.HNSW_SEARCH_EF},
+        "runs": [_run(int(size), args, embeddings) for size in args.sizes.split(",")],
+    }
+    print(json.dumps(report, indent=2, sort_keys=True))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Offline relevance and latency of dense, lexical and hybrid retrieval.
+
+Indexes one document into a throwaway Chroma collection and BM25 index,
+then runs known-item queries: each query is a short phrase lifted from a
+sampled chunk, and that chunk is the relevant answer. Reports recall@k,
+MRR and per-query latency for each retrieval mode, with the retrieval
+cache off, then hybrid latency with the cache cold and warm (every query
+asked again).
+
+By default embeddings are deterministic fakes, so the dense numbers are a
+floor and the run needs no network; pass --embeddings openai to measure
+real dense retrieval.
+
+    python -m benchmarks.retrieval uploads/lecture.pdf --queries 50
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+def _phrase(text: str, rng: random.Random, words: int) -> str:
+    tokens = text.split()
+    if len(tokens) <= words:
+        return text
+    start = rng.randrange(0, len(tokens) - words)
+    return " ".join(tokens[start:start + words])
+
+def _evaluate(retriever, queries, k):
+    hits, reciprocal_ranks, latencies = 0, [], []
+    for query, relevant_id in queries:
+        start = time.perf_counter()
+        docs = retriever.invoke(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+        ids = [doc.id for doc in docs[:k]]
+        if relevant_id in ids:
+            hits += 1
+            reciprocal_ranks.append(1 / (ids.index(relevant_id) + 1))
+        else:
+            reciprocal_ranks.append(0.0)
+    latencies.sort()
+    return {
+        f"recall@{k}": round(hits / len(queries), 3),
+        "mrr": round(statistics.mean(reciprocal_ranks), 3),
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))], 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", nargs="?", help="PDF or TXT file (default: first PDF in UPLOAD_DIR)")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--phrase-words", type=int, default=6)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--embeddings", choices=["fake", "openai"], default="fake")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+    import chromadb
+    from langchain_chroma import Chroma
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from langchain_openai import OpenAIEmbeddings
+    from app.core.config import settings
+    from app.core.document_processor import assign_chunk_ids, parse_document
+    from app.core.retrieval import BM25Index, HybridRetriever, retrieval_cache
+
+    path = args.path or next(iter(sorted(glob.glob(os.path.join(settings.UPLOAD_DIR, "*.pdf")))), None)
+    if path is None:
+        parser.error(f"no document given and no PDF found in {settings.UPLOAD_DIR}")
+
+    if args.embeddings == "openai":
+        embeddings = OpenAIEmbeddings(model=settings.EMBEDDING_MODEL, api_key=settings.OPENAI_API_KEY)
+    else:
+        embeddings = DeterministicFakeEmbedding(size=256)
+
+    pages, splits = parse_document(path)
+    chunks = assign_chunk_ids("bench", splits)
+    client = chromadb.PersistentClient(path=tempfile.mkdtemp(prefix="bench-retrieval-"))
+    vectorstore = Chroma(client=client, collection_name="benchmark", embedding_function=embeddings)
+    start = time.perf_counter()
+    vectorstore.add_documents(list(chunks.values()), ids=list(chunks))
+    index_ms = (time.perf_counter() - start) * 1000
+    index = BM25Index()
+    start = time.perf_counter()
+    index.add(list(chunks), list(chunks.values()))
+    bm25_ms = (time.perf_counter() - start) * 1000
+
+    rng = random.Random(args.seed)
+    sample = rng.sample(list(chunks.items()), min(args.queries, len(chunks)))
+    queries = [(_phrase(doc.page_content, rng, args.phrase_words), chunk_id) for chunk_id, doc in sample]
+
+    modes = {
+        "dense": HybridRetriever(vectorstore=vectorstore, index=index, k=args.k, hybrid=False),
+        "lexical": HybridRetriever(vectorstore=vectorstore, index=index, k=args.k, dense=False),
+        "hybrid": HybridRetriever(vectorstore=vectorstore, index=index, k=args.k),
+    }
+
+    # Modes would otherwise share cached query embeddings
+    settings.RETRIEVAL_CACHE_ENABLED = False
+    results = {name: _evaluate(retriever, queries, args.k) for name, retriever in modes.items()}
+    settings.RETRIEVAL_CACHE_ENABLED = True
+    retrieval_cache.clear()
+    cache = {
+        "cold": _evaluate(modes["hybrid"], queries, args.k),
+        "warm": _evaluate(modes["hybrid"], queries, args.k),
+        "stats": retrieval_cache.stats(),
+    }
+
+    print(json.dumps({
+        "document": os.path.basename(path),
+        "pages": pages,
+        "chunks": len(chunks),
+        "queries": len(queries),
+        "embeddings": args.embeddings,
+        "index_ms": {"chroma": round(index_ms, 1), "bm25": round(bm25_ms, 1)},
+        "results": results,
+        "retrieval_cache": cache,
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Session-creation latency with a per-call vector store vs. the shared one.
+
+Builds agents the way the chat endpoints do and reports how long each
+create_agent call takes when every call opens its own embeddings client and
+Chroma connection (the old behaviour) versus reusing the process-wide store.
+Nothing here talks to the OpenAI API; constructing the clients is offline.
+
+    python -m benchmarks.session_startup --sessions 20
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+def _timed(fn, n):
+    samples = []
+    for i in range(n):
+        start = time.perf_counter()
+        fn(f"bench-{i}")
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        "sessions": n,
+        "mean_ms": round(statistics.mean(samples), 2),
+        "p50_ms": round(statistics.median(samples), 2),
+        "max_ms": round(max(samples), 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=20)
+    args = parser.parse_args()
+
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    os.environ.setdefault("VECTORSTORE_DIR", tempfile.mkdtemp(prefix="bench-vs-"))
+    os.environ.setdefault("EMBEDDING_CACHE_DIR", tempfile.mkdtemp(prefix="bench-cache-"))
+
+    from app.chains import agent as agent_module
+    from app.core import vectorstore
+
+    # Before: every session builds its own clients
+    agent_module.get_vectorstore = lambda namespace=None: vectorstore._create_vectorstore(namespace)[1]
+    before = _timed(agent_module.create_agent, args.sessions)
+
+    # After: the store is opened once at startup and shared
+    agent_module.get_vectorstore = vectorstore.get_vectorstore
+    start = time.perf_counter()
+    vectorstore.init_vectorstore()
+    startup_ms = (time.perf_counter() - start) * 1000
+    after = _timed(agent_module.create_agent, args.sessions)
+    vectorstore.close_vectorstore()
+
+    print(json.dumps({
+        "per_session_vectorstore": before,
+        "shared_vectorstore": {**after, "startup_ms": round(startup_ms, 2)},
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Startup time: import cost by package, time to ready and the first request.
+
+Each measurement runs in a fresh interpreter. `python -X importtime` gives
+the cost of importing app.main, summed per top-level package. The app is
+then started with and without WARMUP_STEPS, and the report gives the time
+until startup has finished (time to ready) and the latency of the first
+chat request. Warmup should move cost from the first request to startup.
+The LLM and embeddings are the offline fakes.
+
+    python -m benchmarks.startup --runs 3 > startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+
+# Runs in the child interpreter; prints one JSON line
+_READY_SCRIPT = """
+import asyncio, json, time
+start = time.perf_counter()
+from app.main import app
+imported = time.perf_counter()
+
+async def main():
+    import httpx
+    from app.core.warmup import startup_timings
+
+    await app.router.startup()
+    ready = time.perf_counter()
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        response = await client.post("/chat/send", json={"message": "What is the bearing capacity?", "session_id": "bench"})
+        response.raise_for_status()
+    first = time.perf_counter()
+    await app.router.shutdown()
+    print(json.dumps({
+        "import_s": imported - start,
+        "time_to_ready_s": ready - start,
+        "first_request_s": first - ready,
+        "steps_s": startup_timings,
+    }))
+
+asyncio.run(main())
+"""
+
+def _parse_importtime(stderr: str):
+    """{module: (self seconds, cumulative seconds)} from -X importtime output."""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = (int(self_us) / 1e6, int(cumulative_us) / 1e6)
+    return modules
+
+def _import_breakdown(env, top: int):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        env=env, capture_output=True, text=True, check=True
+    )
+    modules = _parse_importtime(result.stderr)
+    packages = defaultdict(float)
+    for name, (self_s, _) in modules.items():
+        packages[name.split(".")[0]] += self_s
+    slowest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {
+        "app_main_s": round(modules.get("app.main", (0, 0))[1], 3),
+        "modules": len(modules),
+        # Slowest first; a list so the ranking survives sort_keys
+        "by_package_s": [[name, round(seconds, 3)] for name, seconds in slowest],
+    }
+
+def _ready(env, runs: int):
+    samples = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-c", _READY_SCRIPT], env=env, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"Startup run failed:\n{result.stderr[-2000:]}")
+        samples.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    median = lambda key: round(statistics.median(sample[key] for sample in samples), 3)
+    steps = {step: round(statistics.median(sample["steps_s"].get(step, 0.0) for sample in samples), 3)
+             for step in samples[-1]["steps_s"]}
+    return {
+        "import_s": median("import_s"),
+        "time_to_ready_s": median("time_to_ready_s"),
+        "first_request_s": median("first_request_s"),
+        "steps_s": steps,
+    }
+
+def _env(workdir: str, **overrides):
+    env = dict(os.environ)
+    env.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    env.setdefault("ANONYMIZED_TELEMETRY", "False")
+    env.update(
+        DATABASE_URL=f"sqlite:///{workdir}/bench.db",
+        UPLOAD_DIR=os.path.join(workdir, "uploads"),
+        VECTORSTORE_DIR=os.path.join(workdir, "vectorstore"),
+        EMBEDDING_CACHE_DIR=os.path.join(workdir, "embedding_cache"),
+        LLM_BACKEND="fake",
+        EMBEDDING_BACKEND="fake",
+        FAKE_LLM_LATENCY="0",
+        FAKE_LLM_TOKENS_PER_SECOND="100000",
+    )
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.getcwd(), env.get("PYTHONPATH")]))
+    env.update(overrides)
+    return env
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3, help="fresh interpreters per variant; medians are reported")
+    parser.add_argument("--top", type=int, default=15, help="packages to list in the import breakdown")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-startup-")
+    os.makedirs(os.path.join(workdir, "uploads"), exist_ok=True)
+    report = {
+        "python": sys.version.split()[0],
+        "runs": args.runs,
+        "imports": _import_breakdown(_env(workdir), args.top),
+        "warmup": _ready(_env(workdir), args.runs),
+        "no_warmup": _ready(_env(workdir, WARMUP_STEPS="[]"), args.runs),
+    }
+    print(json.dumps(report, indent=2, sort_keys=True))
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,73 @@
 import typer
 import uvicorn
 import asyncio
-from typing import Optional
-from app.chains.agent import create_agent
-from app.db.database import AsyncSessionLocal
-from app.db.models import Chat
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+from app.chains.agent import astream_agent
+from app.chains.limits import Saturated, agent_limits
+from app.chains.pool import agent_pool
+from app.core.config import settings
+from app.core.ingestion import IngestionQueue, stage_file
+from app.core.vectorstore import (
+    DEFAULT_NAMESPACE, close_vectorstore, compact_index, index_stats, init_vectorstore, list_namespaces,
+    normalize_namespace, rebuild_index, vacuum_vectorstore
+)
+from app.db.chats import chat_writer, save_chat, session_namespace
+from app.db.database import AsyncSessionLocal, engine, init_db
 
 app = typer.Typer()
 
-async def save_interaction(session_id: str, message: str, is_user: bool):
+async def _chat_turn(agent: Any, session_id: str, message: str, model: Optional[str]) -> str:
+    """Stream one answer to stdout, saving the turn once it is complete."""
+    output = None
+    async with agent_limits.limiter(model).slot():
+        async for event in astream_agent(agent, message, model):
+            if event["type"] == "token":
+                typer.echo(event["content"], nl=False)
+            elif event["type"] == "end":
+                output = event["output"]
+    typer.echo()
     async with AsyncSessionLocal() as db:
-        chat = Chat(
-            session_id=session_id,
-            message=message,
-            is_user=is_user
-        )
-        db.add(chat)
-        await db.commit()
+        await save_chat(db, session_id, message, True)
+        await save_chat(db, session_id, output, False)
+    return output
+
+async def _chat(session_id: str, model: Optional[str], message: Optional[str]) -> None:
+    await init_db()
+    chat_writer.start()
+    try:
+        async with AsyncSessionLocal() as db:
+            namespace = await session_namespace(db, session_id)
+            agent = await agent_pool.get(db, session_id, model, namespace)
+        model_info = f" using {model}" if model else ""
+        if message:
+            # Single message mode
+            typer.echo(f"\nAI{model_info}: ", nl=False)
+            await _chat_turn(agent, session_id, message, model)
+            return
+
+        typer.echo(f"Starting interactive chat session{model_info} (type 'exit' to quit)")
+        typer.echo("----------------------------------------")
+        while True:
+            # Keep the event loop free while waiting for input
+            user_input = await asyncio.to_thread(typer.prompt, "\nYou")
+            if user_input.lower() in ['exit', 'quit']:
+                break
+            typer.echo(f"\nAI{model_info}: ", nl=False)
+            try:
+                await _chat_turn(agent, session_id, user_input, model)
+            except Saturated as e:
+                typer.echo(f"\n{str(e)}, retry in {e.retry_after}s", err=True)
+    finally:
+        await chat_writer.stop()
+        close_vectorstore()
+        await engine.dispose()
 
 @app.command()
 def chat(
@@ -24,42 +75,292 @@ def chat(
     model: Optional[str] = typer.Option(None, "--model", "-m", help="Model to use (e.g., 'anthropic/claude-2', 'openai/gpt-4', 'google/gemini-pro')"),
     message: Optional[str] = typer.Argument(None, help="Message to send to the AI")
 ):
-    """Start an interactive chat session with the AI or send a single message."""
-    agent = create_agent(session_id, model)
-    
-    async def process_message(msg: str):
-        # Save user message
-        await save_interaction(session_id, msg, True)
-        
-        # Get AI response
-        response = agent.invoke({"input": msg})
-        ai_response = response.get("output", "I apologize, but I couldn't process that request.")
-        
-        # Save AI response
-        await save_interaction(session_id, ai_response, False)
-        
-        return ai_response
-
-    model_info = f" using {model}" if model else ""
-    if message:
-        # Single message mode
-        response = asyncio.run(process_message(message))
-        typer.echo(f"\nAI{model_info}: {response}\n")
-    else:
-        # Interactive mode
-        typer.echo(f"Starting interactive chat session{model_info} (type 'exit' to quit)")
-        typer.echo("----------------------------------------")
-        
-        while True:
-            # Get user input
-            user_input = typer.prompt("\nYou")
-            
-            if user_input.lower() in ['exit', 'quit']:
-                break
-            
-            # Process message and show response
-            response = asyncio.run(process_message(user_input))
-            typer.echo(f"\nAI{model_info}: {response}")
+    """Start an interactive chat session with the AI or send a single message.
+
+    Answers stream as they are generated and run through the same agent pool
+    and concurrency limits as the server.
+    """
+    asyncio.run(_chat(session_id, model, message))
+
+def _find_documents(directory: str, recursive: bool) -> List[str]:
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        paths.extend(os.path.join(root, name) for name in files if name.endswith(('.txt', '.pdf')))
+        if not recursive:
+            break
+    return sorted(paths)
+
+def _copy_for_ingestion(path: str) -> tuple:
+    """Copy a file into a temporary file in UPLOAD_DIR, returning (temporary path, sha256)."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    fd, tmp_path = tempfile.mkstemp(dir=settings.UPLOAD_DIR, prefix=".upload-", suffix=".part")
+    os.close(fd)
+    shutil.copyfile(path, tmp_path)
+    return tmp_path, digest.hexdigest()
+
+def _namespace(value: Optional[str]) -> Optional[str]:
+    try:
+        return normalize_namespace(value) if value else None
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+
+async def _ingest(paths: List[str], queue: IngestionQueue, namespace: str) -> dict:
+    await init_db()
+    init_vectorstore(namespace)
+    os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
+    queue.start()
+    try:
+        jobs, skipped = [], []
+        async with AsyncSessionLocal() as db:
+            for path in paths:
+                tmp_path, content_hash = await asyncio.to_thread(_copy_for_ingestion, path)
+                try:
+                    db_file, changed = await stage_file(
+                        db, os.path.basename(path), tmp_path, content_hash, namespace, queue
+                    )
+                finally:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                if changed:
+                    jobs.append(queue.submit(
+                        db_file.id, db_file.filename, db_file.filepath, db_file.document_id, namespace
+                    ))
+                else:
+                    skipped.append(db_file.filename)
+        batch = queue.track_batch(jobs, skipped)
+        await queue.join()
+        return queue.batch_report(batch.id)
+    finally:
+        await queue.stop()
+        close_vectorstore()
+        await engine.dispose()
+
+@app.command()
+def ingest(
+    directory: str = typer.Argument(..., help="Directory of .pdf and .txt files to index"),
+    recursive: bool = typer.Option(True, "--recursive/--no-recursive"),
+    processes: int = typer.Option(os.cpu_count() or 1, "--processes", help="Parser processes"),
+    workers: Optional[int] = typer.Option(None, "--workers", help="Files ingested at once (default: 2 per parser process)"),
+    batch_size: int = typer.Option(settings.EMBEDDING_BATCH_SIZE, "--batch-size", help="Chunks per embedding call"),
+    pages_per_task: int = typer.Option(settings.INGESTION_PAGES_PER_TASK, "--pages-per-task"),
+    namespace: Optional[str] = typer.Option(None, "--namespace", "-n", help="Namespace to index into (default: the default namespace)")
+):
+    """Index a directory of documents in bulk and print a throughput report.
+
+    Files are copied into UPLOAD_DIR and indexed like uploads, so re-running
+    only re-embeds what changed. Stop the server first: both write the same
+    vector store.
+    """
+    if not os.path.isdir(directory):
+        raise typer.BadParameter(f"{directory} is not a directory")
+    namespace = _namespace(namespace) or DEFAULT_NAMESPACE
+    paths = _find_documents(directory, recursive)
+    names = Counter(os.path.basename(path) for path in paths)
+    duplicates = sorted(name for name, count in names.items() if count > 1)
+    if duplicates:
+        raise typer.BadParameter(f"Files are stored by name; duplicate names: {', '.join(duplicates)}")
+    typer.echo(f"Ingesting {len(paths)} files with {processes} parser processes", err=True)
+
+    # Parsing is the bottleneck; keep enough files in flight to fill the pool
+    queue = IngestionQueue(
+        workers=workers or 2 * processes,
+        parse_processes=processes,
+        batch_size=batch_size,
+        pages_per_task=pages_per_task
+    )
+    report = asyncio.run(_ingest(paths, queue, namespace))
+    typer.echo(json.dumps(report, indent=2))
+    if report["failed"]:
+        raise typer.Exit(code=1)
+
+INDEX_ACTIONS = {"stats": index_stats, "compact": compact_index, "rebuild": rebuild_index}
+
+@app.command()
+def index(
+    action: str = typer.Argument(..., help="stats, compact or rebuild"),
+    namespace: Optional[str] = typer.Option(None, "--namespace", "-n", help="Namespace to maintain (default: every namespace)")
+):
+    """Inspect or maintain the vector indexes.
+
+    compact applies HNSW_SEARCH_EF and reclaims space in Chroma's database;
+    rebuild re-creates the HNSW graph with the current HNSW_M and
+    HNSW_CONSTRUCTION_EF (and drops deleted entries) without re-embedding.
+    Stop the server first.
+    """
+    if action not in INDEX_ACTIONS:
+        raise typer.BadParameter(f"Unknown action {action}. Supported: {', '.join(INDEX_ACTIONS)}")
+    namespace = _namespace(namespace)
+    try:
+        namespaces = [namespace] if namespace else list_namespaces()
+        for name in namespaces:
+            typer.echo(json.dumps(INDEX_ACTIONS[action](name), indent=2))
+        if action == "compact":
+            # One VACUUM covers every collection
+            typer.echo(json.dumps(vacuum_vectorstore(), indent=2))
+    finally:
+        close_vectorstore()
+
+def _read_prompts(path: str) -> List[Dict[str, Any]]:
+    """Items of a prompts file, with ids (default: the line number) and session ids filled in."""
+    items, ids = [], set()
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError as e:
+                raise typer.BadParameter(f"{path}:{number}: {str(e)}")
+            if not isinstance(item, dict) or not isinstance(item.get("prompt"), str):
+                raise typer.BadParameter(f"{path}:{number}: expected an object with a prompt")
+            item["id"] = str(item.get("id", number))
+            if item["id"] in ids:
+                raise typer.BadParameter(f"{path}:{number}: duplicate id {item['id']}")
+            ids.add(item["id"])
+            # Without a session id every prompt is answered on its own
+            item["session_id"] = str(item.get("session_id") or f"batch-{item['id']}")
+            item["namespace"] = _namespace(item.get("namespace"))
+            items.append(item)
+    return items
+
+def _read_results(path: str) -> Dict[str, Dict[str, Any]]:
+    """Results already in an output file by id, the last one winning; a torn last line is ignored."""
+    results = {}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    continue
+                results[str(result.get("id"))] = result
+    return results
+
+async def _answer_prompt(item: Dict[str, Any]) -> Dict[str, Any]:
+    result = {
+        "id": item["id"],
+        "session_id": item["session_id"],
+        "model": item.get("model"),
+        "prompt": item["prompt"],
+    }
+    start = time.perf_counter()
+    try:
+        async with AsyncSessionLocal() as db:
+            namespace = await session_namespace(db, item["session_id"], item["namespace"])
+            if item["namespace"] is not None and item["namespace"] != namespace:
+                raise ValueError(f"Session {item['session_id']} belongs to namespace {namespace}")
+            result["namespace"] = namespace
+            agent = await agent_pool.get(db, item["session_id"], item.get("model"), namespace)
+            async for event in astream_agent(agent, item["prompt"], item.get("model")):
+                if event["type"] == "token" and "first_token_s" not in result:
+                    result["first_token_s"] = round(time.perf_counter() - start, 3)
+                elif event["type"] == "end":
+                    result["output"] = event["output"]
+                    result.update(event["usage"])
+            # Only a completed turn is stored, so a failed prompt leaves no
+            # unanswered question behind and a re-run does not repeat it
+            await save_chat(db, item["session_id"], item["prompt"], True)
+            await save_chat(db, item["session_id"], result["output"], False)
+    except Exception as e:
+        result["error"] = str(e)
+    result["latency_s"] = round(time.perf_counter() - start, 3)
+    return result
+
+async def _run_batch(items: List[Dict[str, Any]], output: str, parallelism: int) -> List[Dict[str, Any]]:
+    await init_db()
+    # Prompts of one session are answered in file order, one at a time;
+    # sessions are shared between up to `parallelism` workers
+    sessions: Dict[str, List[Dict[str, Any]]] = {}
+    for item in items:
+        sessions.setdefault(item["session_id"], []).append(item)
+    pending: asyncio.Queue = asyncio.Queue()
+    for session_items in sessions.values():
+        pending.put_nowait(session_items)
+    results = []
+
+    async def worker(out) -> None:
+        while not pending.empty():
+            for item in pending.get_nowait():
+                result = await _answer_prompt(item)
+                # One line per result as it completes, so a crash loses at most the runs in flight
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+                results.append(result)
+
+    chat_writer.start()
+    try:
+        with open(output, "a", encoding="utf-8") as out:
+            await asyncio.gather(*(worker(out) for _ in range(min(parallelism, len(sessions)))))
+        return results
+    finally:
+        await chat_writer.stop()
+        close_vectorstore()
+        await engine.dispose()
+
+def _write_ordered(output: str, items: List[Dict[str, Any]]) -> None:
+    """Rewrite the output file in the order of the prompts file."""
+    results = _read_results(output)
+    order = {item["id"]: index for index, item in enumerate(items)}
+    ordered = sorted(results.values(), key=lambda result: order.get(str(result.get("id")), len(order)))
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(output)), suffix=".part")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        for result in ordered:
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, output)
+
+def _percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[int(fraction * (len(values) - 1))]
+
+@app.command()
+def batch(
+    prompts: str = typer.Argument(..., help="JSONL file of {\"prompt\", \"id\", \"session_id\", \"model\", \"namespace\"} objects"),
+    output: Optional[str] = typer.Option(None, "--output", "-o", help="JSONL results file (default: <prompts>.results.jsonl)"),
+    parallelism: int = typer.Option(4, "--parallelism", "-p", min=1, help="Prompts answered at once")
+):
+    """Answer a file of prompts concurrently and write one JSON result per prompt.
+
+    Only id and prompt are needed; a prompt without a session id gets a
+    session of its own, and prompts sharing one are answered in order.
+    Results carry the answer (or error), latency and token counts, and the
+    file is left in prompt order. Re-running skips prompts that already
+    have an answer in the output file and retries the ones that failed.
+    """
+    if not os.path.isfile(prompts):
+        raise typer.BadParameter(f"{prompts} is not a file")
+    output = output or f"{os.path.splitext(prompts)[0]}.results.jsonl"
+    items = _read_prompts(prompts)
+    done = {item_id for item_id, result in _read_results(output).items() if "error" not in result}
+    todo = [item for item in items if item["id"] not in done]
+    typer.echo(f"Answering {len(todo)} prompts ({len(items) - len(todo)} already done) with parallelism {parallelism}", err=True)
+
+    start = time.perf_counter()
+    results = asyncio.run(_run_batch(todo, output, parallelism)) if todo else []
+    elapsed = time.perf_counter() - start
+    _write_ordered(output, items)
+
+    answered = [result for result in results if "error" not in result]
+    latencies = [result["latency_s"] for result in answered]
+    report = {
+        "prompts": len(items),
+        "skipped": len(items) - len(todo),
+        "answered": len(answered),
+        "failed": len(results) - len(answered),
+        "elapsed_s": round(elapsed, 2),
+        "prompts_per_s": round(len(results) / elapsed, 2) if results else 0.0,
+        "latency_s": {"p50": _percentile(latencies, 0.5), "p95": _percentile(latencies, 0.95)},
+        "prompt_tokens": sum(result.get("prompt_tokens", 0) for result in answered),
+        "completion_tokens": sum(result.get("completion_tokens", 0) for result in answered),
+        "output": output,
+    }
+    typer.echo(json.dumps(report, indent=2))
+    if report["failed"]:
+        raise typer.Exit(code=1)
 
 @app.command()
 def serve(
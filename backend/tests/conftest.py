@@ -0,0 +1,17 @@
+import os
+import tempfile
+
+# Settings are read when app modules are imported: point every store at a
+# scratch directory and use the offline fakes before any test imports them
+_workdir = tempfile.mkdtemp(prefix="tests-")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+os.environ["DATABASE_URL"] = f"sqlite:///{_workdir}/test.db"
+os.environ["UPLOAD_DIR"] = os.path.join(_workdir, "uploads")
+os.environ["VECTORSTORE_DIR"] = os.path.join(_workdir, "vectorstore")
+os.environ["EMBEDDING_CACHE_DIR"] = os.path.join(_workdir, "embedding_cache")
+os.environ["LLM_BACKEND"] = "fake"
+os.environ["EMBEDDING_BACKEND"] = "fake"
+os.environ["FAKE_LLM_LATENCY"] = "0"
+os.environ["FAKE_LLM_TOKENS_PER_SECOND"] = "100000"
+os.makedirs(os.environ["UPLOAD_DIR"], exist_ok=True)
@@ -0,0 +1,55 @@
+import asyncio
+from sqlalchemy import select
+from app.db import chats
+from app.db.chats import ChatWriter
+from app.db.database import AsyncSessionLocal, engine, init_db
+from app.db.models import Chat, ChatSession
+
+async def _messages(session_id: str):
+    async with AsyncSessionLocal() as db:
+        rows = await db.execute(select(Chat.message).where(Chat.session_id == session_id).order_by(Chat.id))
+        session = await db.get(ChatSession, session_id)
+        return list(rows.scalars()), session
+
+def test_writer_flushes_in_batches():
+    async def main():
+        await init_db()
+        writer = ChatWriter(flush_interval=0.01, max_batch=2)
+        writer.start()
+        for i in range(5):
+            writer.enqueue("writer-batches", f"message {i}", i % 2 == 0)
+        await writer.stop()
+        messages, session = await _messages("writer-batches")
+        assert messages == [f"message {i}" for i in range(5)]
+        assert session.message_count == 5
+        assert session.title == "message 0"
+        assert (writer.written, writer.batches) == (5, 3)
+        await engine.dispose()
+
+    asyncio.run(main())
+
+def test_failed_batch_is_kept_and_retried(monkeypatch):
+    async def main():
+        await init_db()
+        write = chats._write
+        failures = [RuntimeError("database is locked")]
+
+        async def flaky_write(db, batch):
+            if failures:
+                raise failures.pop()
+            await write(db, batch)
+
+        monkeypatch.setattr(chats, "_write", flaky_write)
+        writer = ChatWriter(flush_interval=0.01, max_batch=10)
+        writer.enqueue("writer-retry", "question", True)
+        writer.enqueue("writer-retry", "answer", False)
+        await writer.flush()
+        assert writer.queued == 2
+        assert (await _messages("writer-retry"))[0] == []
+
+        await writer.flush()
+        assert writer.queued == 0
+        assert (await _messages("writer-retry"))[0] == ["question", "answer"]
+        await engine.dispose()
+
+    asyncio.run(main())
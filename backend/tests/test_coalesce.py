@@ -0,0 +1,71 @@
+import asyncio
+from app.api.chat import _LimitedEvents
+from app.chains.limits import ConcurrencyLimiter
+from app.core.coalesce import StreamFlight
+
+def _limiter() -> ConcurrencyLimiter:
+    return ConcurrencyLimiter("test", max_concurrency=1, max_queue=4, queue_timeout=1.0)
+
+async def _source(started: asyncio.Event, produced: list):
+    started.set()
+    for i in range(1000):
+        await asyncio.sleep(0.01)
+        produced.append(i)
+        yield {"type": "token", "content": str(i)}
+
+def test_closing_unstarted_subscription_cancels_pump_and_releases_slot():
+    async def main():
+        limiter = _limiter()
+        await limiter.acquire()
+        flight = StreamFlight()
+        started, produced = asyncio.Event(), []
+        subscription = flight.lead("k", _LimitedEvents(_source(started, produced), limiter))
+        await started.wait()
+        # The client went away before the response body was iterated
+        await subscription.aclose()
+        await asyncio.sleep(0.05)
+        assert flight.stats()["in_flight"] == 0
+        assert limiter.active == 0
+        assert len(produced) < 10
+
+    asyncio.run(main())
+
+class _Memory:
+    def __init__(self):
+        self.turns = []
+
+    def save_context(self, inputs, outputs):
+        self.turns.append((inputs["input"], outputs["output"]))
+
+def test_leader_leaving_keeps_run_for_joiners_without_a_partial_turn():
+    from types import SimpleNamespace
+    from contextlib import aclosing
+    from app.api.chat import _answer_events
+    from app.db.database import init_db
+
+    async def main():
+        await init_db()
+        flight = StreamFlight()
+        started, produced = asyncio.Event(), []
+        leader = SimpleNamespace(memory=_Memory())
+        leader_events = flight.lead("k", _source(started, produced))
+        joiner_events = flight.join("k")
+
+        answer = _answer_events(leader, "question", None, "leader-session", leader_events)
+        async with aclosing(answer):
+            async for event in answer:
+                if event["type"] == "token" and event["content"] == "2":
+                    break
+        assert leader_events.run_continues
+        # The leader's own executor records the full answer; no "[stopped]" turn too
+        assert leader.memory.turns == []
+
+        received = 0
+        async for event in joiner_events:
+            received += 1
+            if received == 20:
+                break
+        await joiner_events.aclose()
+        assert received == 20
+
+    asyncio.run(main())
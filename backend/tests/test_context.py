@@ -0,0 +1,26 @@
+from langchain_core.documents import Document
+from app.chains.context import merge_chunks, pack_context
+from app.chains.memory import count_tokens
+
+MODEL = "gpt-3.5-turbo"
+
+def _chunk(text: str, page: int, start: int) -> Document:
+    return Document(page_content=text, metadata={"filename": "notes.pdf", "page": page, "start_index": start})
+
+def test_context_fits_the_token_budget():
+    docs = [_chunk(f"passage {i} " + "word " * 300, page=i, start=0) for i in range(10)]
+    for budget in (50, 200, 1000):
+        context = pack_context("passage", docs, MODEL, budget)
+        assert context.startswith("[notes.pdf p.1]")
+        assert count_tokens(context, MODEL) <= budget
+
+def test_context_keeps_everything_under_the_budget():
+    docs = [_chunk(f"short passage {i}", page=i, start=0) for i in range(3)]
+    context = pack_context("passage", docs, MODEL, 1000)
+    assert context == "\n\n".join(f"[notes.pdf p.{i + 1}]\nshort passage {i}" for i in range(3))
+
+def test_overlapping_chunks_of_a_page_are_merged():
+    text = "The mitochondria is the powerhouse of the cell and makes ATP for it."
+    docs = [_chunk(text[:45], page=0, start=0), _chunk(text[20:], page=0, start=20), _chunk(text[:45], page=0, start=0)]
+    passages = merge_chunks(docs)
+    assert [p.text for p in passages] == [text]
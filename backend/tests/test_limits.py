@@ -0,0 +1,88 @@
+import asyncio
+import pytest
+from app.chains.limits import ConcurrencyLimiter, Saturated
+
+def _limiter(max_queue: int = 4, queue_timeout: float = 1.0) -> ConcurrencyLimiter:
+    return ConcurrencyLimiter("test", max_concurrency=1, max_queue=max_queue, queue_timeout=queue_timeout)
+
+def test_release_hands_the_slot_to_the_oldest_waiter():
+    async def main():
+        limiter = _limiter()
+        await limiter.acquire()
+        admitted = []
+
+        async def wait(name: str) -> None:
+            await limiter.acquire()
+            admitted.append(name)
+
+        first = asyncio.create_task(wait("first"))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(wait("second"))
+        await asyncio.sleep(0)
+        assert limiter.waiting == 2
+
+        limiter.release()
+        await asyncio.sleep(0.01)
+        # The slot went straight to the first waiter: still one run active
+        assert admitted == ["first"]
+        assert limiter.active == 1
+        limiter.release()
+        await asyncio.gather(first, second)
+        assert admitted == ["first", "second"]
+        limiter.release()
+        assert limiter.active == 0
+
+    asyncio.run(main())
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    async def main():
+        limiter = _limiter()
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert limiter.waiting == 0
+        limiter.release()
+        assert limiter.active == 0
+
+    asyncio.run(main())
+
+def test_waiter_cancelled_after_handoff_passes_the_slot_on():
+    async def main():
+        limiter = _limiter()
+        await limiter.acquire()
+        first = asyncio.create_task(limiter.acquire())
+        second = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        # Handed the slot, but cancelled before it could resume
+        limiter.release()
+        first.cancel()
+        result, = await asyncio.gather(first, return_exceptions=True)
+        if not isinstance(result, asyncio.CancelledError):
+            # wait_for may deliver the slot rather than the cancellation
+            limiter.release()
+        await second
+        assert limiter.active == 1
+        limiter.release()
+        assert limiter.active == 0
+
+    asyncio.run(main())
+
+def test_full_queue_and_timeout_are_rejected():
+    async def main():
+        limiter = _limiter(max_queue=1, queue_timeout=0.05)
+        await limiter.acquire()
+        queued = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(Saturated) as full:
+            await limiter.acquire()
+        assert full.value.status_code == 429
+        with pytest.raises(Saturated) as timeout:
+            await queued
+        assert timeout.value.status_code == 503
+        assert limiter.waiting == 0
+        limiter.release()
+        assert limiter.active == 0
+
+    asyncio.run(main())
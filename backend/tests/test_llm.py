@@ -0,0 +1,50 @@
+import time
+from typing import Any, List, Optional
+import pytest
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from app.core import llm
+from app.core.llm import FailoverChatModel, ProviderStats
+
+class _Model(BaseChatModel):
+    reply: str
+    delay: float = 0.0
+    fail: bool = False
+
+    @property
+    def _llm_type(self) -> str:
+        return "test"
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError(f"{self.reply} down")
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.reply))])
+
+@pytest.fixture(autouse=True)
+def stats(monkeypatch):
+    stats = ProviderStats()
+    monkeypatch.setattr(llm, "provider_stats", stats)
+    return stats
+
+def _failover(primary: _Model, fallback: _Model, hedge_delay: Optional[float]) -> FailoverChatModel:
+    return FailoverChatModel(models=[primary, fallback], names=["gpt-test", "gemini-test"], hedge_delay=hedge_delay)
+
+def test_sync_call_hedges_a_slow_primary(stats):
+    model = _failover(_Model(reply="primary", delay=1.0), _Model(reply="fallback"), hedge_delay=0.05)
+    start = time.perf_counter()
+    assert model.invoke([HumanMessage(content="hi")]).content == "fallback"
+    assert time.perf_counter() - start < 0.5
+    assert stats.hedges == 1
+
+def test_sync_call_keeps_a_fast_primary(stats):
+    model = _failover(_Model(reply="primary", delay=0.01), _Model(reply="fallback"), hedge_delay=0.5)
+    assert model.invoke([HumanMessage(content="hi")]).content == "primary"
+    assert stats.hedges == 0
+
+def test_sync_call_falls_back_on_error(stats):
+    for hedge_delay in (None, 0.5):
+        model = _failover(_Model(reply="primary", fail=True), _Model(reply="fallback"), hedge_delay)
+        assert model.invoke([HumanMessage(content="hi")]).content == "fallback"
+    assert stats.fallbacks == 2
@@ -0,0 +1,81 @@
+import threading
+import time
+from types import SimpleNamespace
+from langchain_core.messages import AIMessage, HumanMessage
+from app.chains import memory
+from app.chains.memory import TokenBudgetMemory
+
+class _SummaryLLM:
+    """Summarizes once released, failing the first `failures` calls."""
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.calls = 0
+        self.release = threading.Event()
+
+    def invoke(self, prompt):
+        self.calls += 1
+        self.release.wait(5)
+        if self.calls <= self.failures:
+            raise RuntimeError("summary backend down")
+        return SimpleNamespace(content=f"summary #{self.calls}")
+
+def _memory(llm) -> TokenBudgetMemory:
+    store = TokenBudgetMemory(llm=llm, max_token_limit=40, return_messages=True)
+    for i in range(4):
+        store.chat_memory.add_messages([HumanMessage(content=f"question {i} " * 5), AIMessage(content=f"answer {i} " * 5)])
+    return store
+
+def _wait_idle(store: TokenBudgetMemory) -> None:
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        with store._lock:
+            if not store._summarizing:
+                return
+        time.sleep(0.01)
+    raise AssertionError("summarization did not finish")
+
+def _contents(store: TokenBudgetMemory) -> str:
+    return " ".join(str(m.content) for m in store.load_memory_variables({})["chat_history"])
+
+def test_turns_awaiting_summary_stay_in_the_prompt():
+    llm = _SummaryLLM()
+    store = _memory(llm)
+    # Folds the oldest turns; the summarizer is blocked on them
+    assert "question 3" in _contents(store)
+    assert "answer 2" in _contents(store)
+    assert "summary" not in _contents(store)
+
+    llm.release.set()
+    _wait_idle(store)
+    prompt = _contents(store)
+    assert "summary #1" in prompt
+    assert "answer 2" not in prompt
+    assert "question 3" in prompt
+
+def test_failed_summary_is_retried_and_turns_are_kept(monkeypatch):
+    monkeypatch.setattr(memory, "SUMMARY_RETRY_DELAY", 0.01)
+    llm = _SummaryLLM(failures=memory.SUMMARY_ATTEMPTS)
+    llm.release.set()
+    store = _memory(llm)
+    store.load_memory_variables({})
+    _wait_idle(store)
+    # Every attempt failed: the turns are still in the prompt, not lost
+    assert llm.calls == memory.SUMMARY_ATTEMPTS
+    assert "answer 2" in _contents(store)
+
+    # The next request resubmits them and the retry succeeds
+    _wait_idle(store)
+    assert llm.calls == memory.SUMMARY_ATTEMPTS + 1
+    assert "summary" in _contents(store)
+    assert "answer 2" not in _contents(store)
+
+def test_clear_discards_a_summary_in_flight():
+    llm = _SummaryLLM()
+    store = _memory(llm)
+    store.load_memory_variables({})
+    store.clear()
+    llm.release.set()
+    _wait_idle(store)
+    assert store.summary == ""
+    assert not store.has_folded_turns
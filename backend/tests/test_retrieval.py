@@ -0,0 +1,38 @@
+from langchain_core.documents import Document
+from app.core.retrieval import RetrievalCache
+from app.core.vectorstore import bump_corpus_version
+
+def _docs(size: int):
+    return [Document(page_content="x" * size, metadata={"filename": "a.txt"})]
+
+def test_results_stay_within_the_byte_bound():
+    cache = RetrievalCache(max_bytes=50_000)
+    for i in range(100):
+        cache.results(("q", i), lambda: _docs(2_000))
+    stats = cache.stats()
+    assert 0 < stats["size_bytes"] <= 50_000
+    assert stats["entries"] < 100
+    # The oldest entries were evicted, the newest kept
+    calls = []
+    cache.results(("q", 99), lambda: calls.append(1) or _docs(2_000))
+    cache.results(("q", 0), lambda: calls.append(1) or _docs(2_000))
+    assert len(calls) == 1
+
+def test_entry_larger_than_the_cache_is_not_stored():
+    cache = RetrievalCache(max_bytes=1_000)
+    assert cache.results("big", lambda: _docs(10_000))[0].page_content == "x" * 10_000
+    assert cache.stats()["entries"] == 0
+
+def test_corpus_change_purges_results_but_keeps_embeddings():
+    cache = RetrievalCache(max_bytes=1_000_000)
+    searches, embeds = [], []
+    cache.results("q", lambda: searches.append(1) or _docs(10))
+    cache.embedding("question", lambda query: embeds.append(1) or [0.1, 0.2])
+    cache.results("q", lambda: searches.append(1) or _docs(10))
+    assert len(searches) == 1
+
+    bump_corpus_version()
+    cache.results("q", lambda: searches.append(1) or _docs(10))
+    cache.embedding("question", lambda query: embeds.append(1) or [0.1, 0.2])
+    assert len(searches) == 2
+    assert len(embeds) == 1
@@ -0,0 +1,44 @@
+import uuid
+import pytest
+from langchain_core.documents import Document
+from app.core import vectorstore
+
+@pytest.fixture
+def namespace():
+    # A fresh collection per test; the vector store directory is shared
+    vectorstore.close_vectorstore()
+    yield f"test-{uuid.uuid4().hex[:8]}"
+    vectorstore.close_vectorstore()
+
+@pytest.fixture
+def store(namespace):
+    return vectorstore.init_vectorstore(namespace)
+
+def test_rebuild_keeps_chunks_and_replaces_the_collection(store, namespace):
+    store.add_documents([Document(page_content=f"chunk {i}", metadata={"i": i}) for i in range(25)])
+    stats = vectorstore.rebuild_index(namespace, batch_size=10)
+    assert stats["chunks"] == 25
+    names = vectorstore._client.list_collections()
+    assert not [name for name in names if name.startswith(("rebuild-", "replaced-"))]
+
+def test_failed_copy_leaves_the_old_collection_in_place(store, namespace, monkeypatch):
+    store.add_documents([Document(page_content="kept", metadata={"i": 0})])
+    create = vectorstore._client.create_collection
+
+    def failing_create(*args, **kwargs):
+        collection = create(*args, **kwargs)
+        monkeypatch.setattr(collection, "add", lambda **_: (_ for _ in ()).throw(RuntimeError("disk full")))
+        return collection
+
+    monkeypatch.setattr(vectorstore._client, "create_collection", failing_create)
+    with pytest.raises(RuntimeError):
+        vectorstore.rebuild_index(namespace)
+    assert vectorstore.index_stats(namespace)["chunks"] == 1
+    assert not [name for name in vectorstore._client.list_collections() if name.startswith("rebuild-")]
+
+def test_compaction_refuses_unsupported_chromadb(store, namespace, monkeypatch):
+    import chromadb
+
+    monkeypatch.setattr(chromadb, "__version__", "9.0.0")
+    with pytest.raises(RuntimeError, match="not supported"):
+        vectorstore.compact_index(namespace)